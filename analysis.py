@@ -1,76 +1,139 @@
-from typing import List, Dict
+from typing import List, Dict, Optional
 from datetime import datetime
 from models import InvestmentPortfolio, RiskAssessment, InvestmentStrategy
+from optimizer import PortfolioOptimizer, OBJECTIVES
+from factors import FACTORS
 import numpy as np
 import pandas as pd
 
+# 基于资产类别的风险权重，未列出的类别使用默认权重
+RISK_WEIGHTS = {
+    "股票": 0.8,
+    "基金": 0.6,
+    "债券": 0.3,
+    "现金": 0.1
+}
+DEFAULT_RISK_WEIGHT = 0.5
+
+# 各策略类型对应的组合优化目标
+STRATEGY_OBJECTIVES = {
+    "保守型": "min_variance",
+    "平衡型": "risk_parity",
+    "进取型": "max_sharpe"
+}
+
+class HoldingArrays:
+    """持仓列式数组：从 pydantic 资产对象中一次性抽取数量、价格与类别编码，多个组合按组合编码拼接"""
+
+    def __init__(self, portfolios: List[InvestmentPortfolio]):
+        assets = [asset for portfolio in portfolios for asset in portfolio.assets]
+        self.portfolio_count = len(portfolios)
+        self.portfolio_codes = np.repeat(
+            np.arange(len(portfolios)), [len(portfolio.assets) for portfolio in portfolios]
+        )
+        self.names = [asset.name for asset in assets]
+        self.quantity = np.array([asset.quantity for asset in assets], dtype=float)
+        self.current_price = np.array([asset.current_price for asset in assets], dtype=float)
+        self.cost_price = np.array([asset.cost_price for asset in assets], dtype=float)
+        self.purchase_price = np.array([asset.purchase_price for asset in assets], dtype=float)
+        self.categories, self.category_codes = np.unique(
+            np.array([asset.category for asset in assets], dtype=str), return_inverse=True
+        )
+        self.category_codes = self.category_codes.reshape(-1)
+
+def analyze_holdings(holdings: HoldingArrays) -> List[Dict]:
+    """单次向量化计算各投资组合的指标、资产配置与风险因子"""
+    n = holdings.portfolio_count
+    m = len(holdings.categories)
+    codes = holdings.portfolio_codes
+    
+    values = holdings.quantity * holdings.current_price
+    total_values = np.bincount(codes, weights=values, minlength=n)
+    total_costs = np.bincount(codes, weights=holdings.quantity * holdings.purchase_price, minlength=n)
+    total_returns = np.divide(total_values - total_costs, total_costs,
+                              out=np.zeros(n), where=total_costs > 0)
+    
+    # 组合 × 类别的市值矩阵及其占比
+    cells = codes * m + holdings.category_codes
+    category_values = np.bincount(cells, weights=values, minlength=n * m).reshape(n, m)
+    held = np.bincount(cells, minlength=n * m).reshape(n, m) > 0
+    # 类别按在组合中首次出现的顺序输出
+    first_seen = np.full(n * m, len(cells))
+    np.minimum.at(first_seen, cells, np.arange(len(cells)))
+    first_seen = first_seen.reshape(n, m)
+    allocation = np.divide(category_values, total_values[:, None],
+                           out=np.zeros((n, m)), where=total_values[:, None] > 0)
+    risk_weights = np.array([RISK_WEIGHTS.get(category, DEFAULT_RISK_WEIGHT) for category in holdings.categories])
+    risk_scores = allocation @ risk_weights
+    
+    # 价格波动因子：现价相对成本价涨幅过大或跌幅较大（成本价为零的资产跳过）
+    ratios = np.divide(holdings.current_price, holdings.cost_price,
+                       out=np.ones_like(values), where=holdings.cost_price != 0)
+    flagged = np.flatnonzero((ratios > 1.5) | (ratios < 0.8))
+    price_flags: List[List[tuple]] = [[] for _ in range(n)]
+    for i in flagged:
+        price_flags[codes[i]].append((holdings.names[i], bool(ratios[i] > 1.5)))
+    
+    results = []
+    for p in range(n):
+        present = np.flatnonzero(held[p])
+        present = present[np.argsort(first_seen[p, present])]
+        results.append({
+            "total_value": float(total_values[p]),
+            "total_cost": float(total_costs[p]),
+            "total_return": float(total_returns[p]),
+            "asset_allocation": {
+                str(holdings.categories[c]): float(allocation[p, c]) for c in present
+            } if total_values[p] != 0 else {},
+            "risk_score": float(risk_scores[p]),
+            "category_count": len(present),
+            "price_flags": price_flags[p]
+        })
+    return results
+
 class InvestmentAnalysis:
-    def __init__(self, portfolio: InvestmentPortfolio):
+    def __init__(self, portfolio: InvestmentPortfolio, metrics: Optional[Dict] = None):
         self.portfolio = portfolio
+        # 向量化计算结果，首次使用时计算；批量分析时由 batch 预先填入
+        self._metrics = metrics
+
+    @classmethod
+    def batch(cls, portfolios: List[InvestmentPortfolio]) -> List['InvestmentAnalysis']:
+        """批量分析多个投资组合：所有持仓拼接后只做一次向量化计算"""
+        results = analyze_holdings(HoldingArrays(portfolios))
+        return [cls(portfolio, metrics) for portfolio, metrics in zip(portfolios, results)]
+
+    @property
+    def metrics(self) -> Dict:
+        if self._metrics is None:
+            self._metrics = analyze_holdings(HoldingArrays([self.portfolio]))[0]
+        return self._metrics
 
     def calculate_portfolio_metrics(self) -> Dict:
         """计算投资组合指标"""
-        total_value = sum(asset.quantity * asset.current_price for asset in self.portfolio.assets)
-        total_cost = sum(asset.quantity * asset.purchase_price for asset in self.portfolio.assets)
-        total_return = (total_value - total_cost) / total_cost if total_cost > 0 else 0.0
-        
-        asset_allocation = self._calculate_asset_allocation()
-        risk_score = self._calculate_risk_score()
-        
+        metrics = self.metrics
         return {
-            "total_value": total_value,
-            "total_cost": total_cost,
-            "total_return": total_return,
-            "asset_allocation": asset_allocation,
-            "risk_score": risk_score
+            "total_value": metrics["total_value"],
+            "total_cost": metrics["total_cost"],
+            "total_return": metrics["total_return"],
+            "asset_allocation": dict(metrics["asset_allocation"]),
+            "risk_score": metrics["risk_score"]
         }
 
     def _calculate_asset_allocation(self) -> Dict[str, float]:
         """计算资产配置比例"""
-        total_value = sum(asset.quantity * asset.current_price for asset in self.portfolio.assets)
-        if total_value == 0:
-            return {}
-            
-        allocation = {}
-        for asset in self.portfolio.assets:
-            category = asset.category
-            value = asset.quantity * asset.current_price
-            allocation[category] = allocation.get(category, 0) + value / total_value
-            
-        return allocation
+        return dict(self.metrics["asset_allocation"])
 
     def _calculate_risk_score(self) -> float:
         """计算风险评分"""
-        if not self.portfolio.assets:
-            return 0.0
-            
-        # 基于资产类别的风险权重
-        risk_weights = {
-            "股票": 0.8,
-            "基金": 0.6,
-            "债券": 0.3,
-            "现金": 0.1
-        }
-        
-        # 计算加权风险得分
-        total_value = sum(asset.quantity * asset.current_price for asset in self.portfolio.assets)
-        if total_value == 0:
-            return 0.0
-            
-        weighted_risk = 0.0
-        for asset in self.portfolio.assets:
-            weight = (asset.quantity * asset.current_price) / total_value
-            risk_weight = risk_weights.get(asset.category, 0.5)
-            weighted_risk += weight * risk_weight
-            
-        return weighted_risk
+        return self.metrics["risk_score"]
 
-    def assess_risk(self) -> RiskAssessment:
-        """评估投资组合风险"""
+    def assess_risk(self, correlation: Optional[Dict] = None, factor_exposures: Optional[Dict] = None) -> RiskAssessment:
+        """评估投资组合风险，correlation 为 CorrelationAnalysis.analyze 的结果，
+        factor_exposures 为 FactorEngine.portfolio_exposures 的结果（均可选）"""
         try:
-            # 计算总价值
-            total_value = sum(asset.quantity * asset.current_price for asset in self.portfolio.assets)
-            if total_value == 0:
+            metrics = self.metrics
+            if metrics["total_value"] == 0:
                 return RiskAssessment(
                     risk_score=0.0,
                     risk_level="低",
@@ -79,38 +142,46 @@ class InvestmentAnalysis:
                     assessment_date=datetime.now()
                 )
             
-            # 计算各类资产占比
-            asset_categories = {}
-            for asset in self.portfolio.assets:
-                category = asset.category
-                value = asset.quantity * asset.current_price
-                asset_categories[category] = asset_categories.get(category, 0) + value
-            
             # 计算风险分数
             risk_score = 0.0
             risk_factors = []
             
             # 1. 资产集中度风险
-            if len(asset_categories) < 3:
+            if metrics["category_count"] < 3:
                 risk_score += 0.3
                 risk_factors.append("资产类别过于集中")
             
             # 2. 单一资产风险
-            for category, value in asset_categories.items():
-                if value / total_value > 0.5:
+            for category, share in metrics["asset_allocation"].items():
+                if share > 0.5:
                     risk_score += 0.2
                     risk_factors.append(f"{category}占比过高")
             
             # 3. 波动性风险
-            for asset in self.portfolio.assets:
-                if asset.cost_price == 0:  # 添加成本价为零的检查
-                    continue
-                if asset.current_price / asset.cost_price > 1.5:
+            for name, surged in metrics["price_flags"]:
+                if surged:
                     risk_score += 0.1
-                    risk_factors.append(f"{asset.name}涨幅过大")
-                elif asset.current_price / asset.cost_price < 0.8:
+                    risk_factors.append(f"{name}涨幅过大")
+                else:
                     risk_score += 0.2
-                    risk_factors.append(f"{asset.name}跌幅较大")
+                    risk_factors.append(f"{name}跌幅较大")
+            
+            # 4. 相关性风险
+            if correlation:
+                for cluster in correlation.get("clusters", []):
+                    if len(cluster["members"]) >= 2 and cluster["weight"] > 0.5:
+                        risk_score += 0.2
+                        risk_factors.append(f"{'、'.join(cluster['members'][:3])}等高度相关持仓合计占比{cluster['weight']:.0%}")
+                if len(correlation.get("ts_codes", [])) >= 3 and correlation.get("effective_bets", 0.0) < 2:
+                    risk_score += 0.2
+                    risk_factors.append(f"有效独立投资数仅{correlation['effective_bets']:.1f}个")
+            
+            # 5. 风格暴露风险：组合因子暴露偏离市场平均超过一个标准差
+            if factor_exposures:
+                for factor, exposure in factor_exposures.get("exposures", {}).items():
+                    if abs(exposure) >= 1.0:
+                        risk_score += 0.1
+                        risk_factors.append(f"{FACTORS.get(factor, factor)}因子暴露{exposure:+.2f}")
             
             # 确定风险等级
             if risk_score < 0.3:
@@ -130,6 +201,10 @@ class InvestmentAnalysis:
                 suggestions.append("建议考虑部分获利了结")
             if any("跌幅较大" in factor for factor in risk_factors):
                 suggestions.append("建议评估是否需要止损")
+            if any("高度相关" in factor or "有效独立投资数" in factor for factor in risk_factors):
+                suggestions.append("建议降低高度相关持仓的合计占比，增加低相关资产")
+            if any("因子暴露" in factor for factor in risk_factors):
+                suggestions.append("建议关注组合的风格集中度，适当均衡不同风格的持仓")
             
             return RiskAssessment(
                 risk_score=risk_score,
@@ -148,8 +223,9 @@ class InvestmentAnalysis:
                 assessment_date=datetime.now()
             )
 
-    def recommend_strategy(self) -> InvestmentStrategy:
-        """推荐投资策略"""
+    def recommend_strategy(self, optimizer: Optional[PortfolioOptimizer] = None,
+                           universe: Optional[List[str]] = None, max_weight: float = 0.2) -> InvestmentStrategy:
+        """推荐投资策略；提供优化器时按策略类型求解目标权重，并以优化结果的预期收益替代固定值"""
         risk_score = self._calculate_risk_score()
         
         if risk_score < 0.3:
@@ -182,14 +258,35 @@ class InvestmentAnalysis:
                 "适当配置另类资产",
                 "保持必要流动性"
             ]
-            
+        
         # 计算策略适合度
         suitability_score = 1.0 - abs(risk_score - 0.5)  # 越接近0.5分越高
+        
+        # 基于持仓与候选代码求解目标权重
+        target_weights = {}
+        if optimizer is not None and (self.portfolio.assets or universe):
+            holdings = {}
+            for asset in self.portfolio.assets:
+                holdings[asset.symbol] = holdings.get(asset.symbol, 0.0) + asset.quantity * asset.current_price
+            objective = STRATEGY_OBJECTIVES[strategy_type]
+            result = optimizer.optimize(holdings, universe, objective, max_weight)
+            if result["insufficient"]:
+                strategy_points = strategy_points + [
+                    f"以下代码历史行情不足，未纳入优化：{'、'.join(result['insufficient'])}"
+                ]
+            if result["weights"]:
+                target_weights = result["weights"]
+                expected_return = result["expected_return"]
+                strategy_points = strategy_points + [
+                    f"{OBJECTIVES[objective]}组合：预期年化收益{result['expected_return']:.2%}，"
+                    f"年化波动率{result['volatility']:.2%}"
+                ]
             
         return InvestmentStrategy(
             strategy_type=strategy_type,
             strategy_points=strategy_points,
             suitability_score=suitability_score,
             expected_return=expected_return,
-            risk_level=risk_level
+            risk_level=risk_level,
+            target_weights=target_weights
         ) 
\ No newline at end of file
@@ -8,10 +8,25 @@ from config import APIConfig
 from market_data import MarketDataService
 from tushare_service import TushareService
 from database import DatabaseService
+from write_queue import AnalysisWriteQueue
+from market_store import MarketDataStore
+from risk_model import RiskModel
+from var_engine import VaREngine
+from optimizer import PortfolioOptimizer
+from correlation import CorrelationAnalysis
+from projection import MonteCarloProjection, scenario_grid
+from valuation import PortfolioValuation, LiveValuation
+from benchmark import BenchmarkAnalysis, INDICES
+from factors import FactorEngine, FACTORS
+from backtest import Backtester, STRATEGIES
+import indicators
+from screener import StockScreener, FIELDS, FINA_FIELDS
+from indicators import MA_WINDOWS
 from analysis import InvestmentAnalysis
 from goal_tracker import GoalTracker
 from models import InvestmentPortfolio, InvestmentGoal, InvestmentAsset
 import pandas as pd
+import numpy as np
 import plotly.graph_objects as go
 
 # 加载配置
@@ -209,10 +224,65 @@ st.markdown(config.APP_DESCRIPTION)
 # 初始化服务
 market_service = MarketDataService()
 tushare_service = TushareService()
-db_service = DatabaseService()
+db_service = DatabaseService(config.DATABASE_URL)
 
-# 初始化数据库表
-db_service._init_db()
+@st.cache_resource
+def get_analysis_writer() -> AnalysisWriteQueue:
+    """进程内共享的分析结果后台写入队列"""
+    return AnalysisWriteQueue(DatabaseService(config.DATABASE_URL))
+
+analysis_writer = get_analysis_writer()
+
+@st.cache_resource
+def get_risk_model() -> RiskModel:
+    """进程内共享的风险模型，协方差缓存在页面刷新之间保留"""
+    return RiskModel(MarketDataStore(DatabaseService(config.DATABASE_URL), TushareService()))
+
+risk_model = get_risk_model()
+var_engine = VaREngine(risk_model, seed=42)
+optimizer = PortfolioOptimizer(risk_model)
+
+@st.cache_resource
+def get_correlation_analysis() -> CorrelationAnalysis:
+    """进程内共享的持仓相关性分析，相关系数与聚类结果按持仓代码集合缓存"""
+    return CorrelationAnalysis(risk_model)
+
+correlation_analysis = get_correlation_analysis()
+
+@st.cache_resource
+def get_projection() -> MonteCarloProjection:
+    """进程内共享的投资计划模拟器，指数收益参数按月缓存"""
+    return MonteCarloProjection(MarketDataStore(DatabaseService(config.DATABASE_URL), TushareService()), seed=42)
+
+projection = get_projection()
+
+@st.cache_resource
+def get_screener() -> StockScreener:
+    """进程内共享的选股器，全市场截面按日缓存"""
+    return StockScreener(TushareService())
+
+screener = get_screener()
+
+@st.cache_resource
+def get_live_valuation() -> LiveValuation:
+    """进程内共享的实时估值，报价到达时只按差额更新各组合市值"""
+    return LiveValuation()
+
+live_valuation = get_live_valuation()
+
+@st.cache_resource
+def get_benchmark_analysis() -> BenchmarkAnalysis:
+    """进程内共享的业绩基准分析，指数日线与净值快照均增量同步"""
+    return BenchmarkAnalysis(PortfolioValuation(MarketDataStore(DatabaseService(config.DATABASE_URL), TushareService())))
+
+benchmark_analysis = get_benchmark_analysis()
+
+@st.cache_resource
+def get_factor_engine() -> FactorEngine:
+    """进程内共享的风格因子引擎，全市场因子暴露按交易日存入本地库"""
+    return FactorEngine(screener, MarketDataStore(DatabaseService(config.DATABASE_URL), TushareService()))
+
+factor_engine = get_factor_engine()
 
 # 初始化会话状态
 if "user_id" not in st.session_state:
@@ -440,7 +510,7 @@ elif page == "市场行情":
     st.header("📈 市场行情")
     
     # 创建标签页
-    tab1, tab2, tab3 = st.tabs(["股票查询", "市场指数", "财务数据"])
+    tab1, tab2, tab3, tab4 = st.tabs(["股票查询", "市场指数", "财务数据", "条件选股"])
     
     with tab1:
         st.subheader("股票查询")
@@ -542,14 +612,8 @@ elif page == "市场行情":
         with col1:
             try:
                 # 选择指数
-                index_options = {
-                    "上证指数": "000001.SH",
-                    "深证成指": "399001.SZ",
-                    "创业板指": "399006.SZ",
-                    "沪深300": "000300.SH"
-                }
-                selected_index = st.selectbox("选择指数", list(index_options.keys()))
-                index_code = index_options[selected_index]
+                selected_index = st.selectbox("选择指数", list(INDICES.keys()))
+                index_code = INDICES[selected_index]
                 
                 # 选择时间范围
                 end_date = datetime.now()
@@ -590,10 +654,11 @@ elif page == "市场行情":
                             name='K线'
                         )])
                         
-                        # 添加移动平均线
-                        index_data['MA5'] = index_data['close'].rolling(window=5).mean()
-                        index_data['MA10'] = index_data['close'].rolling(window=10).mean()
-                        index_data['MA20'] = index_data['close'].rolling(window=20).mean()
+                        # 添加移动平均线（按交易日升序计算）
+                        index_data = index_data.sort_values('trade_date')
+                        index_closes = index_data['close'].to_numpy(dtype=float)
+                        for window in MA_WINDOWS:
+                            index_data[f'MA{window}'] = indicators.sma(index_closes, window)
                         
                         fig.add_trace(go.Scatter(
                             x=index_data['trade_date'],
@@ -673,6 +738,81 @@ elif page == "市场行情":
                         st.warning("暂时无法获取财务数据，请稍后再试")
                 except Exception as e:
                     st.error(f"获取财务数据失败：{str(e)}")
+    
+    with tab4:
+        st.subheader("条件选股")
+        
+        with st.form("stock_screener_form"):
+            st.write("### 筛选条件（填 0 表示不限）")
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                max_pe = st.number_input("市盈率(TTM)上限", min_value=0.0, value=20.0, step=1.0)
+                max_pb = st.number_input("市净率上限", min_value=0.0, value=0.0, step=0.5)
+            
+            with col2:
+                min_roe = st.number_input("净资产收益率下限(%)", min_value=0.0, value=15.0, step=1.0)
+                max_debt = st.number_input("资产负债率上限(%)", min_value=0.0, max_value=100.0, value=50.0, step=5.0)
+            
+            with col3:
+                min_dividend = st.number_input("股息率(TTM)下限(%)", min_value=0.0, value=0.0, step=0.5)
+                min_market_value = st.number_input("总市值下限(亿元)", min_value=0.0, value=0.0, step=10.0)
+            
+            # 行业选项只取股票列表（按日缓存），全市场截面在提交筛选时才加载
+            screen_industries = st.multiselect("行业（不选表示全部）", screener.industries())
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                sort_field = st.selectbox(
+                    "排序字段",
+                    list(FIELDS.keys()),
+                    index=list(FIELDS.keys()).index("roe"),
+                    format_func=lambda field: FIELDS[field]
+                )
+            with col2:
+                sort_descending = st.radio("排序方向", ["降序", "升序"], horizontal=True) == "降序"
+            with col3:
+                screen_limit = st.slider("显示数量", min_value=10, max_value=500, value=100, step=10)
+            
+            if st.form_submit_button("开始选股"):
+                criteria = []
+                if max_pe > 0:
+                    # 市盈率为负（亏损）的股票不计入
+                    criteria += [("pe_ttm", ">", 0), ("pe_ttm", "<", max_pe)]
+                if max_pb > 0:
+                    criteria += [("pb", ">", 0), ("pb", "<", max_pb)]
+                if min_roe > 0:
+                    criteria.append(("roe", ">", min_roe))
+                if max_debt > 0:
+                    criteria.append(("debt_to_assets", "<", max_debt))
+                if min_dividend > 0:
+                    criteria.append(("dv_ttm", ">=", min_dividend))
+                if min_market_value > 0:
+                    criteria.append(("total_mv", ">=", min_market_value * 10000))
+                
+                try:
+                    with st.spinner("正在加载全市场数据..."):
+                        universe = screener.load()
+                    if universe is None:
+                        st.warning("暂时无法获取选股数据，请稍后再试")
+                    else:
+                        if universe.period is None and any(field in FINA_FIELDS for field, _, _ in criteria):
+                            st.warning("未获取到财务指标（全市场财务数据需要 Tushare fina_indicator_vip 接口权限），"
+                                       "已忽略净资产收益率、资产负债率等财务条件")
+                            criteria = [criterion for criterion in criteria if criterion[0] not in FINA_FIELDS]
+                        result = universe.screen(criteria, sort_field, not sort_descending, screen_limit,
+                                                 screen_industries)
+                        fina_note = f"财务数据取各股最新报告期（最新 {universe.period}）" if universe.period else "无财务数据"
+                        st.caption(f"行情日期 {universe.trade_date}，{fina_note}，"
+                                   f"全市场 {len(universe)} 只股票，显示 {len(result)} 只")
+                        st.dataframe(result.rename(columns={
+                            "ts_code": "代码",
+                            "name": "名称",
+                            "industry": "行业",
+                            **FIELDS
+                        }))
+                except Exception as e:
+                    st.error(f"条件选股失败：{str(e)}")
 
 # 投资分析页面
 elif page == "投资分析":
@@ -773,11 +913,13 @@ elif page == "投资分析":
                         
                         # 保存投资组合
                         if st.session_state.user_id:
-                            portfolio_id = db_service.create_portfolio(
+                            # 投资组合与全部资产在同一事务中写入
+                            portfolio_id = db_service.create_portfolio_with_assets(
                                 user_id=st.session_state.user_id,
                                 name=portfolio_name,
                                 risk_tolerance=risk_tolerance,
                                 investment_goal=investment_goal,
+                                assets=assets,
                                 total_value=total_value,
                                 total_profit=total_profit,
                                 total_profit_rate=total_profit_rate,
@@ -799,20 +941,6 @@ elif page == "投资分析":
                                     "total_profit_rate": total_profit_rate
                                 }
                                 
-                                # 保存资产
-                                for asset in assets:
-                                    db_service.add_asset(
-                                        portfolio_id=portfolio_id,
-                                        symbol=asset['symbol'],
-                                        name=asset['name'],
-                                        quantity=asset['quantity'],
-                                        cost_price=asset['cost_price'],
-                                        current_price=asset['current_price'],
-                                        market_value=asset['market_value'],
-                                        profit=asset['profit'],
-                                        profit_rate=asset['profit_rate']
-                                    )
-                                
                                 st.success("投资组合创建成功！")
                                 st.write(f"投资组合名称：{portfolio_name}")
                                 st.write(f"总市值：¥{total_value:,.2f}")
@@ -861,6 +989,37 @@ elif page == "投资分析":
                                 st.write(f"  市值：¥{float(asset.get('market_value', 0)):,.2f}")
                                 st.write(f"  盈亏：¥{float(asset.get('profit', 0)):,.2f}")
                                 st.write(f"  盈亏率：{float(asset.get('profit_rate', 0)):.2f}%")
+                            
+                            # 实时估值：只拉取持仓代码的最新价，按差额更新组合市值与盈亏
+                            if st.button("刷新实时估值"):
+                                live_valuation.load(db_service.get_portfolios_with_assets(st.session_state.user_id))
+                                quotes = {}
+                                for symbol in {asset['symbol'] for asset in assets}:
+                                    price_data = market_service.get_stock_price(symbol.split('.')[0])
+                                    if "error" not in price_data:
+                                        quotes[symbol] = price_data['current']
+                                live_valuation.update_many(quotes)
+                                live = live_valuation.snapshot(st.session_state.portfolio_id)
+                                if live:
+                                    col1, col2, col3 = st.columns(3)
+                                    with col1:
+                                        st.metric("实时总市值", f"¥{live['total_value']:,.2f}",
+                                                  f"{live['total_value'] - float(portfolio.get('total_value', 0)):,.2f}")
+                                    with col2:
+                                        st.metric("实时总盈亏", f"¥{live['total_profit']:,.2f}")
+                                    with col3:
+                                        st.metric("实时收益率", f"{live['total_profit_rate']:.2f}%")
+                                    live_assets = live['assets']
+                                    st.dataframe(pd.DataFrame({
+                                        "代码": live_assets['symbol'],
+                                        "当前价": live_assets['current_price'],
+                                        "市值": live_assets['market_value'],
+                                        "盈亏": live_assets['profit'],
+                                        "盈亏率(%)": live_assets['profit_rate'],
+                                        "权重": [f"{weight:.2%}" for weight in live_assets['weight']]
+                                    }), use_container_width=True)
+                                    if len(quotes) < len({asset['symbol'] for asset in assets}):
+                                        st.caption("部分代码未获取到实时报价，按最近一次价格估值")
                 except Exception as e:
                     st.warning(f"获取投资组合信息失败：{str(e)}")
     
@@ -893,22 +1052,16 @@ elif page == "投资分析":
             
             if st.form_submit_button("分析"):
                 try:
-                    # 计算预期收益
-                    monthly_rate = expected_return / 12 / 100
-                    total_investment = initial_capital + monthly_investment * investment_period
-                    
-                    # 计算复利收益
-                    future_value = initial_capital * (1 + monthly_rate) ** investment_period
-                    if monthly_investment > 0:
-                        future_value += monthly_investment * ((1 + monthly_rate) ** investment_period - 1) / monthly_rate
-                    
-                    # 计算总收益
-                    total_profit = future_value - total_investment
-                    annualized_return = ((future_value / total_investment) ** (12 / investment_period) - 1) * 100
+                    # 计算复利收益（闭式解，逐月一次算出；预期收益率为 0 时同样适用）
+                    months = list(range(int(investment_period) + 1))
+                    plan = scenario_grid(initial_capital, [expected_return], months, [monthly_investment])
+                    total_investment = float(plan["total_investment"][0, -1, 0])
+                    total_profit = float(plan["total_profit"][0, -1, 0])
+                    annualized_return = float(plan["annualized_return"][0, -1, 0])
                     
-                    # 保存分析结果
+                    # 保存分析结果（后台批量写入，不阻塞页面渲染）
                     if st.session_state.user_id:
-                        db_service.save_profit_analysis(
+                        analysis_writer.save_profit_analysis(
                             st.session_state.user_id,
                             initial_capital,
                             investment_period,
@@ -952,10 +1105,7 @@ elif page == "投资分析":
                     
                     # 收益增长曲线
                     st.write("#### 收益增长曲线")
-                    months = list(range(investment_period + 1))
-                    values = [initial_capital * (1 + monthly_rate) ** m + 
-                             (monthly_investment * ((1 + monthly_rate) ** m - 1) / monthly_rate if monthly_investment > 0 else 0)
-                             for m in months]
+                    values = plan["future_value"][0, :, 0]
                     
                     fig = go.Figure()
                     fig.add_trace(go.Scatter(
@@ -971,6 +1121,80 @@ elif page == "投资分析":
                     )
                     st.plotly_chart(fig)
                     
+                    # 情景分析：收益率 × 投资年限 × 每月追加的整张网格一次计算
+                    st.write("#### 情景分析")
+                    grid_returns = np.round(np.arange(0, max(expected_return * 2, 10) + 0.25, 0.5), 1)
+                    grid_years = np.arange(1, max(int(np.ceil(investment_period / 12)) * 2, 10) + 1)
+                    grid_contributions = np.unique(np.round(monthly_investment * np.array([0, 0.5, 1, 1.5, 2]), 2))
+                    grid = scenario_grid(initial_capital, grid_returns, grid_years * 12, grid_contributions)
+                    
+                    fig_grid = go.Figure()
+                    selected = int(np.abs(grid_contributions - monthly_investment).argmin())
+                    for i, contribution in enumerate(grid_contributions):
+                        fig_grid.add_trace(go.Heatmap(
+                            z=grid["future_value"][:, :, i],
+                            x=grid_years,
+                            y=grid_returns,
+                            customdata=grid["annualized_return"][:, :, i],
+                            colorscale='Viridis',
+                            colorbar=dict(title='期末价值(元)'),
+                            visible=(i == selected),
+                            hovertemplate='投资%{x}年<br>预期年化收益率%{y}%<br>期末价值¥%{z:,.0f}'
+                                          '<br>实际年化收益率%{customdata:.2f}%<extra></extra>'
+                        ))
+                    fig_grid.update_layout(
+                        title='期末价值情景分析',
+                        xaxis_title='投资年限',
+                        yaxis_title='预期年化收益率(%)',
+                        sliders=[dict(
+                            active=selected,
+                            currentvalue=dict(prefix='每月追加：'),
+                            steps=[dict(
+                                label=f"¥{contribution:,.0f}",
+                                method='update',
+                                args=[{'visible': [j == i for j in range(len(grid_contributions))]}]
+                            ) for i, contribution in enumerate(grid_contributions)]
+                        )]
+                    )
+                    st.plotly_chart(fig_grid)
+                    
+                    # 蒙特卡洛模拟：收益率参数来自沪深300历史月度收益
+                    st.write("#### 蒙特卡洛模拟")
+                    with st.spinner("正在模拟10000条收益路径..."):
+                        simulation = projection.project(
+                            initial_capital,
+                            monthly_investment,
+                            int(investment_period),
+                            risk_tolerance
+                        )
+                    col1, col2, col3 = st.columns(3)
+                    with col1:
+                        st.metric("期末价值中位数", f"¥{simulation['final'][50]:,.2f}")
+                    with col2:
+                        st.metric("较差情形(5%分位)", f"¥{simulation['final'][5]:,.2f}")
+                    with col3:
+                        st.metric("亏损概率", f"{simulation['loss_probability']:.1%}")
+                    st.caption(
+                        f"模拟参数：年化收益率 {simulation['annual_return']:.2%}，"
+                        f"年化波动率 {simulation['annual_volatility']:.2%}（按{risk_tolerance}型配置混合沪深300与无风险资产）"
+                    )
+                    
+                    bands = simulation['bands']
+                    fig_mc = go.Figure()
+                    for lower, upper, label, color in [(5, 95, '5%-95%区间', 'rgba(31,119,180,0.15)'),
+                                                       (25, 75, '25%-75%区间', 'rgba(31,119,180,0.3)')]:
+                        fig_mc.add_trace(go.Scatter(x=months, y=bands[upper], mode='lines',
+                                                    line=dict(width=0), showlegend=False, hoverinfo='skip'))
+                        fig_mc.add_trace(go.Scatter(x=months, y=bands[lower], mode='lines', line=dict(width=0),
+                                                    fill='tonexty', fillcolor=color, name=label))
+                    fig_mc.add_trace(go.Scatter(x=months, y=bands[50], mode='lines', name='中位数'))
+                    fig_mc.update_layout(
+                        title='资产价值模拟分布',
+                        xaxis_title='投资月数',
+                        yaxis_title='资产价值(元)'
+                    )
+                    st.plotly_chart(fig_mc)
+                    
                     # 显示投资建议
                     st.write("### 投资建议")
                     if risk_tolerance == "保守":
@@ -1100,6 +1324,251 @@ elif page == "投资分析":
                     
                 except Exception as e:
                     st.error(f"评估失败：{str(e)}")
+        
+        # 基于持仓历史行情的组合风险价值
+        st.write("### 组合风险价值（VaR / ES）")
+        if not st.session_state.user_id:
+            st.info("登录并创建投资组合后可计算组合风险价值")
+        else:
+            var_portfolios = db_service.get_portfolios_with_assets(st.session_state.user_id)
+            if not var_portfolios:
+                st.info("您还没有创建投资组合，请先创建投资组合")
+            else:
+                with st.form("var_form"):
+                    var_portfolio = st.selectbox("投资组合", var_portfolios, format_func=lambda p: p['name'])
+                    method_labels = {"historical": "历史模拟法", "parametric": "参数法", "monte_carlo": "蒙特卡洛模拟"}
+                    var_method = st.selectbox("计算方法", list(method_labels), format_func=method_labels.get)
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        var_confidence = st.selectbox("置信水平", [0.95, 0.99], format_func=lambda c: f"{c:.0%}")
+                    with col2:
+                        var_horizon = st.number_input("持有期（交易日）", min_value=1, max_value=60, value=1)
+                    
+                    if st.form_submit_button("计算风险价值"):
+                        try:
+                            with st.spinner("正在计算风险价值..."):
+                                result = var_engine.calculate(
+                                    RiskModel.holding_weights(var_portfolio),
+                                    var_method,
+                                    var_confidence,
+                                    int(var_horizon)
+                                )
+                            if result["insufficient"]:
+                                st.warning("以下持仓的历史行情不足，按现有数据计算会低估风险，暂不计算风险价值：" +
+                                           "、".join(f"{code}（{count}个交易日）"
+                                                    for code, count in result["insufficient"].items()))
+                            else:
+                                col1, col2 = st.columns(2)
+                                with col1:
+                                    st.metric(f"VaR（{var_confidence:.0%}，{int(var_horizon)}日）", f"¥{result['var']:,.2f}",
+                                              f"占组合市值 {result['var_rate']:.2%}", delta_color="off")
+                                with col2:
+                                    st.metric(f"ES（{var_confidence:.0%}，{int(var_horizon)}日）", f"¥{result['es']:,.2f}",
+                                              f"占组合市值 {result['es_rate']:.2%}", delta_color="off")
+                                st.caption(f"在{var_confidence:.0%}的置信水平下，{int(var_horizon)}个交易日内的损失预计不超过VaR；"
+                                           f"超过VaR时的平均损失为ES。")
+                        except Exception as e:
+                            st.error(f"计算风险价值失败：{str(e)}")
+                
+                # 持仓相关性与层次聚类
+                st.write("### 持仓相关性")
+                with st.form("correlation_form"):
+                    corr_portfolio = st.selectbox("投资组合", var_portfolios, format_func=lambda p: p['name'],
+                                                  key="corr_portfolio")
+                    corr_window = st.slider("回看窗口（交易日）", min_value=60, max_value=500, value=250, step=10)
+                    
+                    if st.form_submit_button("分析相关性"):
+                        try:
+                            with st.spinner("正在计算持仓相关性..."):
+                                result = correlation_analysis.analyze(RiskModel.holding_weights(corr_portfolio),
+                                                                      int(corr_window))
+                            if result["missing"]:
+                                st.warning(f"以下代码的历史行情不足，未参与分析：{'、'.join(result['missing'])}")
+                            if not result["ts_codes"]:
+                                st.info("没有可用于分析的持仓行情")
+                            else:
+                                col1, col2, col3 = st.columns(3)
+                                with col1:
+                                    st.metric("有效独立投资数", f"{result['effective_bets']:.1f}",
+                                              f"共 {len(result['ts_codes'])} 个持仓", delta_color="off")
+                                with col2:
+                                    st.metric("独立风险来源", f"{result['effective_rank']:.1f}")
+                                with col3:
+                                    st.metric("加权平均相关系数", f"{result['average_correlation']:.2f}")
+                                
+                                # 按聚类树叶节点顺序排列，高度相关的持仓聚在一起
+                                corr = result["correlation"]
+                                fig = go.Figure(data=go.Heatmap(
+                                    z=corr.to_numpy(),
+                                    x=list(corr.columns),
+                                    y=list(corr.index),
+                                    zmin=-1,
+                                    zmax=1,
+                                    colorscale='RdBu',
+                                    reversescale=True
+                                ))
+                                fig.update_layout(title='持仓相关系数矩阵', height=max(400, 20 * len(corr)))
+                                st.plotly_chart(fig, use_container_width=True)
+                                
+                                st.write("#### 相关性聚类")
+                                st.dataframe(pd.DataFrame([{
+                                    "持仓": "、".join(cluster["members"]),
+                                    "数量": len(cluster["members"]),
+                                    "合计占比": f"{cluster['weight']:.2%}",
+                                    "簇内平均相关系数": f"{cluster['average_correlation']:.2f}"
+                                } for cluster in result["clusters"]]), use_container_width=True)
+                                st.caption("有效独立投资数越接近持仓数，分散效果越好；同一簇内的持仓走势高度相关，"
+                                           "合计占比过高时相当于集中持有单一资产。")
+                        except Exception as e:
+                            st.error(f"分析持仓相关性失败：{str(e)}")
+                
+                # 组合净值相对业绩基准的表现
+                st.write("### 业绩基准对比")
+                with st.form("benchmark_form"):
+                    bench_portfolio = st.selectbox("投资组合", var_portfolios, format_func=lambda p: p['name'],
+                                                   key="bench_portfolio")
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        bench_name = st.selectbox("业绩基准", list(INDICES), index=list(INDICES).index("沪深300"))
+                    with col2:
+                        bench_window = st.slider("滚动窗口（交易日）", min_value=20, max_value=250, value=60, step=10)
+                    
+                    if st.form_submit_button("对比业绩基准"):
+                        try:
+                            with st.spinner("正在计算基准对比..."):
+                                result = benchmark_analysis.analyze(bench_portfolio, INDICES[bench_name],
+                                                                    window=int(bench_window))
+                            if result["observations"] < 2:
+                                st.info("净值快照不足，暂无法与基准对比")
+                            else:
+                                metrics = result["metrics"]
+                                col1, col2, col3 = st.columns(3)
+                                with col1:
+                                    st.metric("Alpha（年化）", f"{metrics['alpha']:.2%}")
+                                    st.metric("Beta", f"{metrics['beta']:.2f}")
+                                with col2:
+                                    st.metric("跟踪误差（年化）", f"{metrics['tracking_error']:.2%}")
+                                    st.metric("信息比率", f"{metrics['information_ratio']:.2f}")
+                                with col3:
+                                    st.metric("上涨捕获率", f"{metrics['up_capture']:.2%}")
+                                    st.metric("下跌捕获率", f"{metrics['down_capture']:.2%}")
+                                st.caption(f"共 {result['observations']} 个交易日；组合年化收益 {metrics['portfolio_return']:.2%}，"
+                                           f"{bench_name}年化收益 {metrics['benchmark_return']:.2%}")
+                                
+                                cumulative = result["cumulative"]
+                                dates = pd.to_datetime(cumulative.index)
+                                fig = go.Figure()
+                                fig.add_trace(go.Scatter(x=dates, y=cumulative["portfolio"], name=bench_portfolio['name']))
+                                fig.add_trace(go.Scatter(x=dates, y=cumulative["benchmark"], name=bench_name))
+                                fig.update_layout(title='累计净值对比', xaxis_title='日期', yaxis_title='净值')
+                                st.plotly_chart(fig, use_container_width=True)
+                                
+                                rolling = result["rolling"]
+                                if not rolling.empty:
+                                    fig = go.Figure()
+                                    fig.add_trace(go.Scatter(x=pd.to_datetime(rolling.index), y=rolling["beta"], name='Beta'))
+                                    fig.add_trace(go.Scatter(x=pd.to_datetime(rolling.index), y=rolling["information_ratio"],
+                                                             name='信息比率', yaxis='y2'))
+                                    fig.update_layout(title=f'滚动{int(bench_window)}日 Beta 与信息比率', xaxis_title='日期',
+                                                      yaxis=dict(title='Beta'),
+                                                      yaxis2=dict(title='信息比率', overlaying='y', side='right'))
+                                    st.plotly_chart(fig, use_container_width=True)
+                        except Exception as e:
+                            st.error(f"对比业绩基准失败：{str(e)}")
+                
+                # 组合的风格因子暴露（相对全市场的标准差倍数）
+                st.write("### 风格因子暴露")
+                with st.form("factor_form"):
+                    factor_portfolio = st.selectbox("投资组合", var_portfolios, format_func=lambda p: p['name'],
+                                                    key="factor_portfolio")
+                    
+                    if st.form_submit_button("计算因子暴露"):
+                        try:
+                            sync_bar = st.progress(0.0, text="正在计算全市场因子暴露（每个交易日首次计算需同步全市场行情）...")
+                            result = factor_engine.portfolio_exposures(
+                                RiskModel.holding_weights(factor_portfolio),
+                                progress=lambda done, total: sync_bar.progress(done / total,
+                                                                               text=f"正在同步全市场行情 {done}/{total}")
+                            )
+                            sync_bar.empty()
+                            if result["coverage"] <= 0:
+                                st.info("持仓没有可用的因子暴露数据（全市场行情同步不完整时请稍后重试）")
+                            else:
+                                exposures = result["exposures"]
+                                fig = go.Figure(data=go.Bar(
+                                    x=[FACTORS[factor] for factor in exposures],
+                                    y=list(exposures.values()),
+                                    marker_color=['#d62728' if value > 0 else '#2ca02c' for value in exposures.values()]
+                                ))
+                                fig.update_layout(title=f"风格因子暴露（{result['trade_date']}）", yaxis_title='标准差倍数')
+                                st.plotly_chart(fig, use_container_width=True)
+                                st.caption(f"因子暴露为相对全市场的标准化值，0 为市场平均；有数据的持仓市值占比 {result['coverage']:.0%}")
+                                if result["missing"]:
+                                    st.warning(f"以下代码缺少因子数据，按市场平均计入：{'、'.join(result['missing'])}")
+                        except Exception as e:
+                            st.error(f"计算因子暴露失败：{str(e)}")
+                
+                # 按组合风险评分推荐策略，并由组合优化器求解目标配置
+                st.write("### 策略推荐与目标配置")
+                with st.form("strategy_form"):
+                    strategy_portfolio = st.selectbox("投资组合", var_portfolios, format_func=lambda p: p['name'],
+                                                      key="strategy_portfolio")
+                    strategy_universe = st.text_input("候选股票代码（可选，多个用逗号分隔）", placeholder="例如：600519.SH,000858.SZ")
+                    strategy_max_weight = st.slider("单一资产权重上限", min_value=0.05, max_value=1.0, value=0.2, step=0.05)
+                    
+                    if st.form_submit_button("推荐策略"):
+                        try:
+                            assets = strategy_portfolio['assets']
+                            # 本地持仓均为 A 股代码，按股票类别计算风险评分
+                            portfolio_model = InvestmentPortfolio(
+                                name=strategy_portfolio['name'],
+                                risk_tolerance=strategy_portfolio['risk_tolerance'],
+                                initial_capital=strategy_portfolio['initial_capital'],
+                                investment_goal=strategy_portfolio['investment_goal'],
+                                assets=[InvestmentAsset(
+                                    symbol=symbol,
+                                    name=name,
+                                    category="股票",
+                                    quantity=quantity,
+                                    cost_price=cost_price,
+                                    current_price=current_price,
+                                    purchase_price=cost_price,
+                                    purchase_date=created_at
+                                ) for symbol, name, quantity, cost_price, current_price, created_at in zip(
+                                    assets['symbol'], assets['name'], assets['quantity'], assets['cost_price'],
+                                    assets['current_price'], assets['created_at']
+                                )]
+                            )
+                            universe = [code.strip().upper() for code in strategy_universe.replace('，', ',').split(',')
+                                        if code.strip()]
+                            with st.spinner("正在求解目标配置..."):
+                                strategy = InvestmentAnalysis(portfolio_model).recommend_strategy(
+                                    optimizer, universe, float(strategy_max_weight)
+                                )
+                            col1, col2, col3 = st.columns(3)
+                            with col1:
+                                st.metric("推荐策略", strategy.strategy_type)
+                            with col2:
+                                st.metric("风险等级", strategy.risk_level)
+                            with col3:
+                                st.metric("预期年化收益", f"{strategy.expected_return:.2%}")
+                            for point in strategy.strategy_points:
+                                st.write(f"- {point}")
+                            
+                            if strategy.target_weights:
+                                holdings = RiskModel.holding_weights(strategy_portfolio)
+                                total = sum(holdings.values())
+                                codes = list(dict.fromkeys(list(strategy.target_weights) + list(holdings)))
+                                st.dataframe(pd.DataFrame({
+                                    "代码": codes,
+                                    "当前权重": [f"{holdings.get(code, 0.0) / total:.2%}" if total > 0 else "0.00%"
+                                                 for code in codes],
+                                    "目标权重": [f"{strategy.target_weights.get(code, 0.0):.2%}" for code in codes]
+                                }), use_container_width=True)
+                            else:
+                                st.info("持仓与候选代码的历史行情不足，暂无法求解目标配置")
+                        except Exception as e:
+                            st.error(f"推荐策略失败：{str(e)}")
     
     with tab4:
         st.subheader("技术分析")
@@ -1124,22 +1593,15 @@ elif page == "投资分析":
                             import numpy as np
                             
                             # 计算移动平均线
-                            historical_data['MA5'] = historical_data['close'].rolling(window=5).mean()
-                            historical_data['MA10'] = historical_data['close'].rolling(window=10).mean()
-                            historical_data['MA20'] = historical_data['close'].rolling(window=20).mean()
+                            closes = historical_data['close'].to_numpy(dtype=float)
+                            for window in MA_WINDOWS:
+                                historical_data[f'MA{window}'] = indicators.sma(closes, window)
                             
                             # 计算MACD
-                            exp1 = historical_data['close'].ewm(span=12, adjust=False).mean()
-                            exp2 = historical_data['close'].ewm(span=26, adjust=False).mean()
-                            historical_data['MACD'] = exp1 - exp2
-                            historical_data['Signal'] = historical_data['MACD'].ewm(span=9, adjust=False).mean()
+                            historical_data['MACD'], historical_data['Signal'], _ = indicators.macd(closes)
                             
-                            # 计算RSI
-                            delta = historical_data['close'].diff()
-                            gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-                            loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-                            rs = gain / loss
-                            historical_data['RSI'] = 100 - (100 / (1 + rs))
+                            # 计算RSI（Wilder 平滑）
+                            historical_data['RSI'] = indicators.rsi(closes)
                             
                             # 显示技术指标图表
                             fig = go.Figure()
@@ -1315,6 +1777,94 @@ elif page == "投资分析":
                 st.rerun()
             else:
                 st.warning("请点击分析按钮生成技术分析报告")
+        
+        # 策略回测
+        with st.form("strategy_backtest_form"):
+            st.write("### 策略回测")
+            col1, col2 = st.columns(2)
+            
+            with col1:
+                backtest_codes = st.text_input("股票代码（多个代码用逗号分隔）", placeholder="600000.SH,000001.SZ")
+                backtest_strategy = st.selectbox(
+                    "交易策略",
+                    list(STRATEGIES.keys()),
+                    format_func=lambda key: STRATEGIES[key]
+                )
+            
+            with col2:
+                backtest_years = st.slider("回测年数", min_value=1, max_value=10, value=3)
+                backtest_slippage = st.number_input(
+                    "单边滑点",
+                    min_value=0.0,
+                    max_value=0.01,
+                    value=0.001,
+                    step=0.0005,
+                    format="%.4f"
+                )
+            
+            if st.form_submit_button("开始回测"):
+                codes = [code.strip().upper() for code in backtest_codes.replace("，", ",").split(",") if code.strip()]
+                if not codes:
+                    st.warning("请输入股票代码")
+                else:
+                    try:
+                        backtester = Backtester(risk_model.market_store, slippage=backtest_slippage)
+                        backtest_start = (datetime.now() - timedelta(days=365 * backtest_years)).strftime('%Y%m%d')
+                        with st.spinner("正在回测..."):
+                            result = backtester.run(codes, backtest_strategy, backtest_start)
+                        
+                        if result["equity"].empty:
+                            st.warning("回测区间内没有行情数据")
+                        else:
+                            period = result["period"]
+                            if period["late"]:
+                                st.warning(
+                                    f"以下代码的行情起始晚于回测起点 {backtest_start}，之前的区间未参与回测：" +
+                                    "、".join(f"{code}（{date or '无行情'}）" for code, date in period["late"].items())
+                                )
+                            st.info(f"实际回测区间：{period['start']} 至 {period['end']}")
+                            metrics = result["metrics"]
+                            col1, col2, col3, col4 = st.columns(4)
+                            with col1:
+                                st.metric("累计收益", f"{metrics['total_return']:.2%}",
+                                          f"基准 {result['benchmark_metrics']['total_return']:.2%}", delta_color="off")
+                            with col2:
+                                st.metric("年化收益", f"{metrics['annual_return']:.2%}")
+                            with col3:
+                                st.metric("夏普比率", f"{metrics['sharpe']:.2f}")
+                            with col4:
+                                st.metric("最大回撤", f"{metrics['max_drawdown']:.2%}")
+                            st.caption(f"年化换手率 {metrics['turnover']:.1f} 倍，平均仓位 {metrics['exposure']:.0%}，"
+                                       f"开仓 {metrics['trades']} 次，交易成本合计 {metrics['costs']:.2%}；"
+                                       f"基准为回测代码等权持有")
+                            
+                            fig_backtest = go.Figure()
+                            fig_backtest.add_trace(go.Scatter(
+                                x=result["equity"].index,
+                                y=result["equity"],
+                                name=STRATEGIES[backtest_strategy]
+                            ))
+                            fig_backtest.add_trace(go.Scatter(
+                                x=result["benchmark_equity"].index,
+                                y=result["benchmark_equity"],
+                                name='等权持有',
+                                line=dict(dash='dash')
+                            ))
+                            fig_backtest.update_layout(
+                                title='策略净值曲线',
+                                xaxis_title='日期',
+                                yaxis_title='净值'
+                            )
+                            st.plotly_chart(fig_backtest)
+                            
+                            symbols = result["symbols"]
+                            st.dataframe(pd.DataFrame({
+                                "累计收益": symbols["total_return"].map("{:.2%}".format),
+                                "开仓次数": symbols["trades"],
+                                "持仓时间占比": symbols["exposure"].map("{:.0%}".format)
+                            }))
+                    except Exception as e:
+                        st.error(f"策略回测失败：{str(e)}")
     
     with tab5:
         st.subheader("基本面分析")
@@ -1515,63 +2065,82 @@ elif page == "投资分析":
         if 'financial_data' in st.session_state:
             if st.button("生成财务分析"):
                 try:
-                    # 构建大模型分析提示词
-                    analysis_prompt = f"""
-                    请基于以下财务数据进行分析：
+                    # 优先读取未过期的缓存分析
+                    cached_analysis = None
+                    if st.session_state.user_id:
+                        cached_analysis = db_service.get_investment_analysis(
+                            st.session_state.user_id, st.session_state.symbol, "基本面分析"
+                        )
+                    if cached_analysis and cached_analysis.get("period") == st.session_state.period:
+                        st.markdown("### 智能财务分析")
+                        st.markdown(cached_analysis["analysis"])
+                    else:
+                        # 构建大模型分析提示词
+                        analysis_prompt = f"""
+                        请基于以下财务数据进行分析：
 
-                    股票代码：{st.session_state.symbol}
-                    报告期：{st.session_state.period[:4]}年{st.session_state.period[4:6]}月{st.session_state.period[6:]}日
+                        股票代码：{st.session_state.symbol}
+                        报告期：{st.session_state.period[:4]}年{st.session_state.period[4:6]}月{st.session_state.period[6:]}日
 
-                    主要财务指标：
-                    - 基本每股收益：{st.session_state.financial_dict.get('eps', 'N/A')}
-                    - 稀释每股收益：{st.session_state.financial_dict.get('dt_eps', 'N/A')}
-                    - 每股净资产：{st.session_state.financial_dict.get('bps', 'N/A')}
-                    - 净资产收益率：{st.session_state.financial_dict.get('roe', 'N/A')}%
-                    - 总资产报酬率：{st.session_state.financial_dict.get('roa', 'N/A')}%
-                    - 销售毛利率：{st.session_state.financial_dict.get('grossprofit_margin', 'N/A')}%
-                    - 销售净利率：{st.session_state.financial_dict.get('netprofit_margin', 'N/A')}%
-                    - 资产负债率：{st.session_state.financial_dict.get('debt_to_assets', 'N/A')}%
-                    - 流动比率：{st.session_state.financial_dict.get('current_ratio', 'N/A')}
-                    - 速动比率：{st.session_state.financial_dict.get('quick_ratio', 'N/A')}
-                    - 存货周转率：{st.session_state.financial_dict.get('inv_turn', 'N/A')}
-                    - 应收账款周转率：{st.session_state.financial_dict.get('ar_turn', 'N/A')}
-                    - 总资产周转率：{st.session_state.financial_dict.get('assets_turn', 'N/A')}
-                    - 经营活动现金流/营业收入：{st.session_state.financial_dict.get('ocf_to_or', 'N/A')}%
+                        主要财务指标：
+                        - 基本每股收益：{st.session_state.financial_dict.get('eps', 'N/A')}
+                        - 稀释每股收益：{st.session_state.financial_dict.get('dt_eps', 'N/A')}
+                        - 每股净资产：{st.session_state.financial_dict.get('bps', 'N/A')}
+                        - 净资产收益率：{st.session_state.financial_dict.get('roe', 'N/A')}%
+                        - 总资产报酬率：{st.session_state.financial_dict.get('roa', 'N/A')}%
+                        - 销售毛利率：{st.session_state.financial_dict.get('grossprofit_margin', 'N/A')}%
+                        - 销售净利率：{st.session_state.financial_dict.get('netprofit_margin', 'N/A')}%
+                        - 资产负债率：{st.session_state.financial_dict.get('debt_to_assets', 'N/A')}%
+                        - 流动比率：{st.session_state.financial_dict.get('current_ratio', 'N/A')}
+                        - 速动比率：{st.session_state.financial_dict.get('quick_ratio', 'N/A')}
+                        - 存货周转率：{st.session_state.financial_dict.get('inv_turn', 'N/A')}
+                        - 应收账款周转率：{st.session_state.financial_dict.get('ar_turn', 'N/A')}
+                        - 总资产周转率：{st.session_state.financial_dict.get('assets_turn', 'N/A')}
+                        - 经营活动现金流/营业收入：{st.session_state.financial_dict.get('ocf_to_or', 'N/A')}%
 
-                    请从以下几个方面进行分析：
-                    1. 盈利能力分析
-                    2. 偿债能力分析
-                    3. 运营能力分析
-                    4. 成长性分析
-                    5. 现金流分析
-                    6. 投资建议
+                        请从以下几个方面进行分析：
+                        1. 盈利能力分析
+                        2. 偿债能力分析
+                        3. 运营能力分析
+                        4. 成长性分析
+                        5. 现金流分析
+                        6. 投资建议
 
-                    注意：请用专业、客观的语气进行分析，并提供具体的建议。
-                    """
+                        注意：请用专业、客观的语气进行分析，并提供具体的建议。
+                        """
                     
-                    # 调用大模型API进行分析
-                    try:
-                        headers = {
-                            "Authorization": f"Bearer {config.DEEPSEEK_API_KEY}",
-                            "Content-Type": "application/json"
-                        }
+                        # 调用大模型API进行分析
+                        try:
+                            headers = {
+                                "Authorization": f"Bearer {config.DEEPSEEK_API_KEY}",
+                                "Content-Type": "application/json"
+                            }
                         
-                        data = {
-                            "model": "deepseek-chat",
-                            "messages": [{"role": "user", "content": analysis_prompt}],
-                            "temperature": 0.7
-                        }
+                            data = {
+                                "model": "deepseek-chat",
+                                "messages": [{"role": "user", "content": analysis_prompt}],
+                                "temperature": 0.7
+                            }
                         
-                        with st.spinner("🤔 正在生成财务分析..."):
-                            response = requests.post(config.DEEPSEEK_API_URL, headers=headers, json=data)
-                            response.raise_for_status()
-                            analysis_result = response.json()["choices"][0]["message"]["content"]
+                            with st.spinner("🤔 正在生成财务分析..."):
+                                response = requests.post(config.DEEPSEEK_API_URL, headers=headers, json=data)
+                                response.raise_for_status()
+                                analysis_result = response.json()["choices"][0]["message"]["content"]
                             
-                            # 显示分析结果
-                            st.markdown("### 智能财务分析")
-                            st.markdown(analysis_result)
-                    except Exception as e:
-                        st.error(f"生成财务分析失败：{str(e)}")
+                                # 显示分析结果
+                                st.markdown("### 智能财务分析")
+                                st.markdown(analysis_result)
+                                
+                                # 写入分析缓存，有效期内重复生成直接读取
+                                if st.session_state.user_id:
+                                    analysis_writer.save_investment_analysis(
+                                        st.session_state.user_id,
+                                        st.session_state.symbol,
+                                        "基本面分析",
+                                        {"period": st.session_state.period, "analysis": analysis_result}
+                                    )
+                        except Exception as e:
+                            st.error(f"生成财务分析失败：{str(e)}")
                 except Exception as e:
                     st.error(f"分析失败：{str(e)}")
 
@@ -1604,8 +2173,8 @@ elif page == "投资分析":
                             st.error("获取用户信息失败，请重新登录")
                             st.stop()
                         
-                        # 获取投资组合信息
-                        portfolios = db_service.get_portfolios(st.session_state.user_id)
+                        # 获取投资组合及资产信息（单次查询）
+                        portfolios = db_service.get_portfolios_with_assets(st.session_state.user_id)
                         if not portfolios:
                             st.error("您还没有创建投资组合，请先创建投资组合")
                             st.stop()
@@ -1648,16 +2217,16 @@ elif page == "投资分析":
                         
                         for portfolio in portfolios:
                             try:
-                                assets = db_service.get_assets(portfolio['id'])
-                                if not assets:
+                                if not portfolio['asset_count']:
                                     continue
-                                    
-                                portfolio_value = sum(float(asset.get('market_value', 0)) for asset in assets)
-                                portfolio_profit = sum(float(asset.get('profit', 0)) for asset in assets)
+                                
+                                assets = portfolio['assets']
+                                portfolio_value = portfolio['portfolio_value']
+                                portfolio_profit = portfolio['portfolio_profit']
                                 total_value += portfolio_value
                                 total_profit += portfolio_profit
                                 
-                                portfolio_assets.extend(assets)
+                                portfolio_assets.extend(zip(assets['name'], assets['symbol'], assets['market_value'], assets['profit_rate']))
                                 
                                 report_content += f"""
 ### 投资组合：{portfolio.get('name', 'N/A')}
@@ -1671,15 +2240,18 @@ elif page == "投资分析":
 """
                                 
                                 # 添加资产配置分析
-                                for asset in assets:
+                                for name, symbol, quantity, cost_price, current_price, market_value, profit, profit_rate in zip(
+                                    assets['name'], assets['symbol'], assets['quantity'], assets['cost_price'],
+                                    assets['current_price'], assets['market_value'], assets['profit'], assets['profit_rate']
+                                ):
                                     report_content += f"""
-- {asset.get('name', 'N/A')} ({asset.get('symbol', 'N/A')})
-  - 持仓数量：{asset.get('quantity', 0)}
-  - 成本价：¥{float(asset.get('cost_price', 0)):,.2f}
-  - 当前价：¥{float(asset.get('current_price', 0)):,.2f}
-  - 市值：¥{float(asset.get('market_value', 0)):,.2f}
-  - 盈亏：¥{float(asset.get('profit', 0)):,.2f}
-  - 盈亏率：{float(asset.get('profit_rate', 0)):.2f}%
+- {name} ({symbol})
+  - 持仓数量：{quantity}
+  - 成本价：¥{cost_price:,.2f}
+  - 当前价：¥{current_price:,.2f}
+  - 市值：¥{market_value:,.2f}
+  - 盈亏：¥{profit:,.2f}
+  - 盈亏率：{profit_rate:.2f}%
 """
                             except Exception as e:
                                 st.warning(f"处理投资组合 {portfolio.get('name', 'N/A')} 时出错：{str(e)}")
@@ -1708,7 +2280,7 @@ elif page == "投资分析":
                         - 总收益率：{(total_profit / (total_value - total_profit) * 100) if (total_value - total_profit) > 0 else 0:.2f}%
 
                         资产配置：
-                        {[f"{asset.get('name', 'N/A')} ({asset.get('symbol', 'N/A')}) - 市值：¥{float(asset.get('market_value', 0)):,.2f} - 盈亏率：{float(asset.get('profit_rate', 0)):.2f}%" for asset in portfolio_assets]}
+                        {[f"{name} ({symbol}) - 市值：¥{market_value:,.2f} - 盈亏率：{profit_rate:.2f}%" for name, symbol, market_value, profit_rate in portfolio_assets]}
 
                         市场环境：
                         - 上证指数：{market_data.get('sh_index', 'N/A')}
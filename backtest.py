@@ -0,0 +1,193 @@
+from typing import List, Dict, Optional
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from market_store import MarketDataStore, shift_date
+from rebalancer import COMMISSION_RATE, STAMP_DUTY_RATE, TRANSFER_FEE_RATE
+from risk_model import TRADING_DAYS
+from indicators import sma, macd, rsi, forward_fill
+
+STRATEGIES = {
+    "ma_cross": "均线交叉",
+    "macd": "MACD金叉死叉",
+    "rsi": "RSI超买超卖"
+}
+DEFAULT_PARAMS = {
+    "ma_cross": {"fast": 5, "slow": 20},
+    "macd": {"fast": 12, "slow": 26, "signal": 9},
+    "rsi": {"period": 14, "lower": 30, "upper": 70}
+}
+# 行情起点晚于回测起点超过该自然日数（长假休市最长约十余天）时视为回测区间被截短
+MAX_CLOSURE_DAYS = 15
+
+def generate_signals(strategy: str, closes: np.ndarray, params: Optional[Dict] = None) -> np.ndarray:
+    """由（复权）收盘价面板生成目标持仓：1 为持有，0 为空仓；指标未就绪时空仓"""
+    params = {**DEFAULT_PARAMS.get(strategy, {}), **(params or {})}
+    if strategy == "ma_cross":
+        fast = sma(closes, params["fast"])
+        slow = sma(closes, params["slow"])
+        with np.errstate(invalid="ignore"):
+            return (fast > slow).astype(float)
+    if strategy == "macd":
+        dif, dea, _ = macd(closes, params["fast"], params["slow"], params["signal"])
+        with np.errstate(invalid="ignore"):
+            return (dif > dea).astype(float)
+    if strategy == "rsi":
+        # 超卖时买入、超买时卖出，两者之间维持原状态
+        values = rsi(closes, params["period"])
+        state = np.full(closes.shape, np.nan)
+        with np.errstate(invalid="ignore"):
+            state[values < params["lower"]] = 1.0
+            state[values > params["upper"]] = 0.0
+        return np.nan_to_num(forward_fill(state), nan=0.0)
+    raise ValueError(f"不支持的回测策略：{strategy}")
+
+class Backtester:
+    """向量化多代码回测：日期 × 代码的价格面板上一次计算信号，信号次日开盘成交并计入交易成本"""
+
+    def __init__(self, market_store: MarketDataStore, commission_rate: float = COMMISSION_RATE,
+                 stamp_duty_rate: float = STAMP_DUTY_RATE, transfer_fee_rate: float = TRANSFER_FEE_RATE,
+                 slippage: float = 0.001, risk_free_rate: float = 0.0):
+        self.market_store = market_store
+        # 按成交金额比例计算的单边成本；回测不跟踪金额，不计最低佣金
+        self.buy_rate = commission_rate + transfer_fee_rate + slippage
+        self.sell_rate = commission_rate + transfer_fee_rate + stamp_duty_rate + slippage
+        self.risk_free_rate = risk_free_rate
+
+    def run(self, ts_codes: List[str], strategy: str, start_date: str, end_date: Optional[str] = None,
+            params: Optional[Dict] = None, sync: bool = True) -> Dict:
+        """回测 start_date 至 end_date 的策略，向前多取一段行情用于指标预热"""
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        merged = {**DEFAULT_PARAMS.get(strategy, {}), **(params or {})}
+        warmup = max([value for value in merged.values() if isinstance(value, int)] + [1]) * 3
+        fetch_start = (datetime.strptime(start_date, '%Y%m%d') - timedelta(days=warmup * 2 + 10)).strftime('%Y%m%d')
+        if sync:
+            self.market_store.sync_daily_bars(ts_codes, fetch_start, end_date)
+        panels = self.market_store.get_price_panels(ts_codes, fetch_start, end_date)
+        return self.backtest(panels['open'], panels['close'], panels['pre_close'], strategy, merged, start_date)
+
+    def backtest(self, opens: pd.DataFrame, closes: pd.DataFrame, pre_closes: pd.DataFrame, strategy: str,
+                 params: Optional[Dict] = None, start_date: Optional[str] = None) -> Dict:
+        """在对齐的开盘价、收盘价与前收盘价面板上回测，并以全部代码等权持有作为基准"""
+        dates = closes.index
+        open_, close, pre_close = (panel.to_numpy(dtype=float) for panel in (opens, closes, pre_closes))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            daily = close / pre_close - 1
+        # 以前收盘价复权的收盘价序列，避免除权缺口产生虚假信号
+        listed = ~np.isnan(close)
+        adjusted = np.cumprod(1 + np.nan_to_num(daily, nan=0.0, posinf=0.0, neginf=0.0), axis=0)
+        adjusted = np.where(listed, adjusted, np.nan)
+        signals = generate_signals(strategy, forward_fill(adjusted), params)
+        
+        start = int(np.searchsorted(np.asarray(dates), start_date)) if start_date else 0
+        open_, close, pre_close, signals = (x[start:] for x in (open_, close, pre_close, signals))
+        dates = dates[start:]
+        result = self.simulate(open_, close, pre_close, signals)
+        benchmark = self.simulate(open_, close, pre_close, np.ones_like(signals))
+        
+        result["equity"] = pd.Series(result["equity"], index=dates)
+        result["returns"] = pd.Series(result["returns"], index=dates)
+        result["symbols"] = pd.DataFrame(result["symbols"], index=closes.columns)
+        result["benchmark_equity"] = pd.Series(benchmark["equity"], index=dates)
+        result["benchmark_metrics"] = benchmark["metrics"]
+        result["strategy"] = strategy
+        result["params"] = {**DEFAULT_PARAMS.get(strategy, {}), **(params or {})}
+        result["period"] = self.period(dates, close, list(closes.columns), start_date)
+        return result
+
+    @staticmethod
+    def period(dates: pd.Index, close: np.ndarray, ts_codes: List[str], start_date: Optional[str] = None) -> Dict:
+        """实际回测区间与行情起点晚于回测起点的代码（late 为代码到首个有行情交易日的映射，无行情为 None）"""
+        listed = ~np.isnan(close)
+        first = np.where(listed.any(axis=0), listed.argmax(axis=0), -1)
+        if not len(dates):
+            limit = None
+        elif start_date:
+            limit = shift_date(start_date, MAX_CLOSURE_DAYS)
+        else:
+            limit = dates[0]
+        late = {}
+        for code, row in zip(ts_codes, first):
+            if row < 0:
+                late[code] = None
+            elif limit is not None and dates[row] > limit:
+                late[code] = dates[row]
+        return {
+            "requested_start": start_date,
+            "start": dates[0] if len(dates) else None,
+            "end": dates[-1] if len(dates) else None,
+            "late": late
+        }
+
+    def simulate(self, open_: np.ndarray, close: np.ndarray, pre_close: np.ndarray, signals: np.ndarray) -> Dict:
+        """按收盘信号次日开盘调仓，持仓代码等权；停牌（当日无行情）的代码维持原持仓状态
+        
+        每日收益分为隔夜（开盘价 / 前收盘价）与日内（收盘价 / 开盘价）两段，
+        开盘时由隔夜漂移后的权重调整到目标权重，调仓成本按买卖金额占组合的比例扣除
+        """
+        t, k = close.shape
+        tradable = np.isfinite(open_) & np.isfinite(close) & (open_ > 0)
+        # 当日持仓：可交易时取前一日信号，否则沿用之前的持仓
+        held = np.full((t, k), np.nan)
+        held[1:] = np.where(tradable[1:], signals[:-1], np.nan)
+        held[:1] = np.where(tradable[:1], 0.0, np.nan)
+        held = np.nan_to_num(forward_fill(held), copy=False, nan=0.0)
+        
+        counts = held.sum(axis=1, keepdims=True)
+        weights = np.divide(held, counts, out=np.zeros_like(held), where=counts > 0)
+        # 无行情或价格无效时两段收益均记为 0
+        overnight = np.divide(open_, pre_close, out=np.ones((t, k)), where=tradable & (pre_close > 0))
+        overnight -= 1
+        intraday = np.divide(close, open_, out=np.ones((t, k)), where=tradable)
+        intraday -= 1
+        
+        # 上一交易日收盘时的权重（日内漂移后），再经隔夜漂移得到开盘时的权重
+        intraday_returns = (weights * intraday).sum(axis=1)
+        closing = np.zeros_like(weights)
+        closing[1:] = weights[:-1] * (1 + intraday[:-1]) / (1 + intraday_returns[:-1, None])
+        overnight_returns = (closing * overnight).sum(axis=1)
+        opening = closing * (1 + overnight) / (1 + overnight_returns[:, None])
+        
+        trades = weights - opening
+        buys = np.clip(trades, 0, None).sum(axis=1)
+        sells = np.clip(-trades, 0, None).sum(axis=1)
+        costs = buys * self.buy_rate + sells * self.sell_rate
+        returns = (1 + overnight_returns) * (1 - costs) * (1 + intraday_returns) - 1
+        equity = np.cumprod(1 + returns)
+        
+        # 单代码独立持有时的累计收益：进出场分别计入单边成本
+        previous = np.vstack([np.zeros((1, k)), held[:-1]])
+        entries = (held > previous).sum(axis=0)
+        symbol_costs = np.where(held > previous, self.buy_rate, np.where(held < previous, self.sell_rate, 0.0))
+        symbol_growth = (1 + previous * overnight) * (1 - symbol_costs) * (1 + held * intraday)
+        symbols = {
+            "total_return": np.prod(symbol_growth, axis=0) - 1,
+            "trades": entries,
+            "exposure": held.mean(axis=0) if t else np.zeros(k)
+        }
+        
+        metrics = self.metrics(returns, equity)
+        metrics["turnover"] = float((buys + sells).sum() / 2 / max(t, 1) * TRADING_DAYS)
+        metrics["exposure"] = float(weights.sum(axis=1).mean()) if t else 0.0
+        metrics["trades"] = int(entries.sum())
+        metrics["costs"] = float(costs.sum())
+        return {"equity": equity, "returns": returns, "symbols": symbols, "metrics": metrics}
+
+    def metrics(self, returns: np.ndarray, equity: np.ndarray) -> Dict:
+        """收益、波动、夏普比率与最大回撤"""
+        n = len(returns)
+        if n == 0:
+            return {"total_return": 0.0, "annual_return": 0.0, "annual_volatility": 0.0,
+                    "sharpe": 0.0, "max_drawdown": 0.0}
+        total_return = float(equity[-1] - 1)
+        volatility = float(returns.std(ddof=1)) if n > 1 else 0.0
+        excess = float(returns.mean()) - self.risk_free_rate / TRADING_DAYS
+        drawdowns = equity / np.maximum.accumulate(np.maximum(equity, 1.0)) - 1
+        return {
+            "total_return": total_return,
+            "annual_return": float(max(equity[-1], 0.0) ** (TRADING_DAYS / n) - 1),
+            "annual_volatility": float(volatility * np.sqrt(TRADING_DAYS)),
+            "sharpe": float(excess / volatility * np.sqrt(TRADING_DAYS)) if volatility > 0 else 0.0,
+            "max_drawdown": float(drawdowns.min())
+        }
\ No newline at end of file
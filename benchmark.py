@@ -0,0 +1,131 @@
+from typing import Dict, Optional
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from valuation import PortfolioValuation
+from risk_model import TRADING_DAYS
+
+# 市场指数页可选的指数，同时作为业绩比较基准
+INDICES = {
+    "上证指数": "000001.SH",
+    "深证成指": "399001.SZ",
+    "创业板指": "399006.SZ",
+    "沪深300": "000300.SH"
+}
+DEFAULT_BENCHMARK = "000300.SH"
+
+def window_sums(values: np.ndarray, window: int) -> np.ndarray:
+    """由累计和相减得到每个长度为 window 的滑动窗口之和（第 i 个为截至第 i + window - 1 行的窗口）"""
+    cumulative = np.concatenate([np.zeros((1,) + values.shape[1:]), np.cumsum(values, axis=0)])
+    return cumulative[window:] - cumulative[:-window]
+
+def relative_statistics(portfolio: np.ndarray, benchmark: np.ndarray, window: Optional[int] = None,
+                        risk_free_rate: float = 0.0) -> Dict[str, np.ndarray]:
+    """组合相对基准的 alpha、beta、跟踪误差、信息比率与上涨/下跌捕获率
+    
+    所需的一阶、二阶矩全部由累计和按窗口相减得到，滚动计算的复杂度为 O(n)；
+    window 缺省时只计算全样本一个窗口。二阶矩先减去全样本均值，降低累计和相减的精度损失
+    """
+    n = len(portfolio)
+    window = window or n
+    if n < max(window, 2):
+        return {}
+    p_mean, b_mean = portfolio.mean(), benchmark.mean()
+    p, b = portfolio - p_mean, benchmark - b_mean
+    up, down = benchmark > 0, benchmark < 0
+    sums = {
+        name: window_sums(values, window)
+        for name, values in (("p", p), ("b", b), ("pp", p * p), ("bb", b * b), ("pb", p * b),
+                             ("p_up", np.where(up, portfolio, 0.0)), ("b_up", np.where(up, benchmark, 0.0)),
+                             ("p_down", np.where(down, portfolio, 0.0)), ("b_down", np.where(down, benchmark, 0.0)))
+    }
+    mean_p = sums["p"] / window
+    mean_b = sums["b"] / window
+    var_p = np.clip((sums["pp"] - window * mean_p * mean_p) / (window - 1), 0.0, None)
+    var_b = np.clip((sums["bb"] - window * mean_b * mean_b) / (window - 1), 0.0, None)
+    cov = (sums["pb"] - window * mean_p * mean_b) / (window - 1)
+    active_var = np.clip(var_p + var_b - 2 * cov, 0.0, None)
+    mean_p += p_mean
+    mean_b += b_mean
+    
+    with np.errstate(invalid="ignore", divide="ignore"):
+        beta = np.where(var_b > 0, cov / var_b, np.nan)
+        daily_rf = risk_free_rate / TRADING_DAYS
+        tracking_error = np.sqrt(active_var * TRADING_DAYS)
+        excess_return = (mean_p - mean_b) * TRADING_DAYS
+        return {
+            "alpha": ((mean_p - daily_rf) - beta * (mean_b - daily_rf)) * TRADING_DAYS,
+            "beta": beta,
+            "correlation": np.where((var_p > 0) & (var_b > 0), cov / np.sqrt(var_p * var_b), np.nan),
+            "tracking_error": tracking_error,
+            "excess_return": excess_return,
+            "information_ratio": np.where(tracking_error > 0, excess_return / tracking_error, np.nan),
+            "up_capture": np.where(sums["b_up"] > 0, sums["p_up"] / sums["b_up"], np.nan),
+            "down_capture": np.where(sums["b_down"] < 0, sums["p_down"] / sums["b_down"], np.nan)
+        }
+
+class BenchmarkAnalysis:
+    """业绩基准分析：组合净值快照与本地缓存的指数日线按交易日对齐，计算相对基准的收益与风险指标"""
+
+    def __init__(self, valuation: PortfolioValuation, risk_free_rate: float = 0.0):
+        self.valuation = valuation
+        self.db_service = valuation.db_service
+        self.market_store = valuation.market_store
+        self.risk_free_rate = risk_free_rate
+
+    def aligned_returns(self, portfolio: Dict, benchmark: str = DEFAULT_BENCHMARK, start_date: Optional[str] = None,
+                        end_date: Optional[str] = None, sync: bool = True) -> pd.DataFrame:
+        """组合单位净值与基准指数收盘价对齐到净值快照的交易日后的日收益率（列为 portfolio、benchmark）
+        
+        组合收益取自剔除资金进出的单位净值，而非市值或市值/成本，追加买入、卖出不计为收益
+        """
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        if sync:
+            # 先补齐最近一次快照之后的净值
+            self.valuation.value_portfolio(portfolio, end_date, sync)
+        snapshots = self.db_service.get_portfolio_snapshots(portfolio['id'], start_date or "00000000", end_date)
+        if len(snapshots) < 2:
+            return pd.DataFrame(columns=["portfolio", "benchmark"], dtype=float)
+        nav = pd.Series([row['nav'] for row in snapshots], index=[row['trade_date'] for row in snapshots], dtype=float)
+        
+        # 向前多取一段指数行情，首个快照日指数无行情时沿用前收盘
+        fetch_start = (datetime.strptime(nav.index[0], '%Y%m%d')
+                       - timedelta(days=self.valuation.lookback_days)).strftime('%Y%m%d')
+        if sync:
+            self.market_store.sync_daily_bars([benchmark], fetch_start, end_date, index=True)
+        closes = self.market_store.get_price_panel([benchmark], fetch_start, end_date)[benchmark]
+        closes = closes.reindex(closes.index.union(nav.index)).ffill().reindex(nav.index)
+        
+        levels = pd.DataFrame({"portfolio": nav, "benchmark": closes}).dropna()
+        return levels.pct_change().iloc[1:].replace([np.inf, -np.inf], np.nan).dropna()
+
+    def analyze(self, portfolio: Dict, benchmark: str = DEFAULT_BENCHMARK, start_date: Optional[str] = None,
+                end_date: Optional[str] = None, window: int = 60, sync: bool = True) -> Dict:
+        """全样本与滚动窗口的相对基准指标，portfolio 需包含 get_portfolios_with_assets 返回的列式资产"""
+        result = {"benchmark": benchmark, "observations": 0, "metrics": {}, "rolling": pd.DataFrame(),
+                  "cumulative": pd.DataFrame()}
+        try:
+            returns = self.aligned_returns(portfolio, benchmark, start_date, end_date, sync)
+        except Exception as e:
+            print(f"计算基准对比失败：{str(e)}")
+            return result
+        if len(returns) < 2:
+            return result
+        
+        p = returns["portfolio"].to_numpy()
+        b = returns["benchmark"].to_numpy()
+        metrics = {name: float(values[0]) for name, values in
+                   relative_statistics(p, b, risk_free_rate=self.risk_free_rate).items()}
+        growth = np.cumprod(1 + returns.to_numpy(), axis=0)
+        years = len(returns) / TRADING_DAYS
+        metrics["portfolio_return"] = float(growth[-1, 0] ** (1 / years) - 1) if growth[-1, 0] > 0 else -1.0
+        metrics["benchmark_return"] = float(growth[-1, 1] ** (1 / years) - 1) if growth[-1, 1] > 0 else -1.0
+        
+        result["observations"] = len(returns)
+        result["metrics"] = metrics
+        result["cumulative"] = pd.DataFrame(growth, index=returns.index, columns=returns.columns)
+        if len(returns) >= window:
+            rolling = relative_statistics(p, b, window, self.risk_free_rate)
+            result["rolling"] = pd.DataFrame(rolling, index=returns.index[window - 1:])
+        return result
\ No newline at end of file
@@ -0,0 +1,188 @@
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from risk_model import RiskModel, TRADING_DAYS
+
+def correlation_matrix(returns: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """样本相关系数矩阵与各列日收益标准差；零波动的列与其他列的相关系数记为 0"""
+    n = len(returns)
+    centered = returns - returns.mean(axis=0)
+    std = np.sqrt((centered * centered).sum(axis=0) / max(n - 1, 1))
+    scaled = np.divide(centered, std, out=np.zeros_like(centered), where=std > 0)
+    corr = scaled.T @ scaled / max(n - 1, 1)
+    np.fill_diagonal(corr, 1.0)
+    return np.clip(corr, -1.0, 1.0), std
+
+def average_linkage(distance: np.ndarray) -> np.ndarray:
+    """平均连接凝聚层次聚类，返回与 scipy linkage 相同格式的 (n-1, 4) 矩阵：[簇 a, 簇 b, 距离, 样本数]
+    
+    合并后按 Lance-Williams 公式 d(k, i∪j) = (n_i·d(k,i) + n_j·d(k,j)) / (n_i + n_j) 整行更新距离
+    """
+    n = len(distance)
+    d = np.array(distance, dtype=float)
+    np.fill_diagonal(d, np.inf)
+    sizes = np.ones(n)
+    ids = np.arange(n)
+    linkage = np.zeros((max(n - 1, 0), 4))
+    for step in range(n - 1):
+        i, j = divmod(int(np.argmin(d)), n)
+        if i > j:
+            i, j = j, i
+        linkage[step] = [min(ids[i], ids[j]), max(ids[i], ids[j]), d[i, j], sizes[i] + sizes[j]]
+        merged = (sizes[i] * d[i] + sizes[j] * d[j]) / (sizes[i] + sizes[j])
+        d[i, :] = merged
+        d[:, i] = merged
+        d[i, i] = np.inf
+        d[j, :] = np.inf
+        d[:, j] = np.inf
+        sizes[i] += sizes[j]
+        ids[i] = n + step
+    return linkage
+
+def cut_linkage(linkage: np.ndarray, n: int, threshold: float) -> np.ndarray:
+    """在距离 threshold 处切分聚类树，返回各样本的簇编号（按样本首次出现的顺序从 0 编号）"""
+    parent = np.arange(2 * n - 1)
+
+    def root(x: int) -> int:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    
+    for step, (a, b, height, _) in enumerate(linkage):
+        if height <= threshold:
+            parent[root(int(a))] = n + step
+            parent[root(int(b))] = n + step
+    roots = np.array([root(i) for i in range(n)])
+    _, labels = np.unique(roots, return_inverse=True)
+    # 按首次出现顺序重新编号
+    first = {}
+    return np.array([first.setdefault(label, len(first)) for label in labels])
+
+def leaf_order(linkage: np.ndarray, n: int) -> List[int]:
+    """聚类树的叶节点顺序，相近的样本排在一起（用于相关系数热力图）"""
+    if n <= 1:
+        return list(range(n))
+    order = []
+    stack = [2 * n - 2]
+    while stack:
+        node = stack.pop()
+        if node < n:
+            order.append(node)
+        else:
+            a, b = linkage[node - n, :2].astype(int)
+            stack.extend([b, a])
+    return order
+
+def effective_bets(weights: np.ndarray, cov: np.ndarray) -> float:
+    """有效独立投资数（Meucci）：组合方差在各主成分上的占比的熵取指数，介于 1 与持仓数之间"""
+    values, vectors = np.linalg.eigh(cov)
+    exposures = vectors.T @ weights
+    contributions = exposures * exposures * np.clip(values, 0.0, None)
+    total = contributions.sum()
+    if total <= 0:
+        return 0.0
+    shares = contributions[contributions > 0] / total
+    return float(np.exp(-(shares * np.log(shares)).sum()))
+
+def effective_rank(corr: np.ndarray) -> float:
+    """相关系数矩阵特征值分布的熵取指数：不考虑权重时相互独立的风险来源个数"""
+    values = np.clip(np.linalg.eigvalsh(corr), 0.0, None)
+    if values.sum() <= 0:
+        return 0.0
+    shares = values[values > 0] / values.sum()
+    return float(np.exp(-(shares * np.log(shares)).sum()))
+
+class CorrelationAnalysis:
+    """持仓相关性分析：相关系数矩阵、层次聚类与有效独立投资数；与权重无关的部分按（持仓代码集合, 窗口, 截止日）缓存"""
+
+    def __init__(self, risk_model: RiskModel, cluster_correlation: float = 0.7, max_cache: int = 64):
+        self.risk_model = risk_model
+        # 聚类切分的相关系数阈值：平均连接距离不超过 sqrt((1 - ρ) / 2) 的持仓归为同一簇
+        self.cluster_correlation = cluster_correlation
+        self.max_cache = max_cache
+        self._cache: Dict[tuple, Dict] = {}
+
+    def _structure(self, ts_codes: Tuple[str, ...], window: int, end_date: str, sync: bool) -> Dict:
+        """计算（或读取缓存的）相关系数矩阵、波动率与聚类结果"""
+        key = (ts_codes, window, end_date)
+        if key in self._cache:
+            return self._cache[key]
+        
+        returns = self.risk_model.history(list(ts_codes), end_date, sync, window, fill=False)[list(ts_codes)]
+        # 历史行情不足的代码（缺失日按 0 收益计会低估相关性）不参与分析
+        insufficient = self.risk_model.insufficient(returns, window)
+        codes = [code for code in ts_codes if code not in insufficient]
+        corr, std = correlation_matrix(returns[codes].fillna(0.0).to_numpy())
+        n = len(codes)
+        linkage = average_linkage(np.sqrt(np.clip((1 - corr) / 2, 0.0, None)))
+        threshold = np.sqrt((1 - self.cluster_correlation) / 2)
+        structure = {
+            "ts_codes": codes,
+            "missing": [code for code in ts_codes if code in insufficient],
+            "observations": len(returns),
+            "correlation": corr,
+            "volatility": std * np.sqrt(TRADING_DAYS),
+            "linkage": linkage,
+            "labels": cut_linkage(linkage, n, threshold) if n else np.zeros(0, dtype=int),
+            "order": leaf_order(linkage, n)
+        }
+        if len(self._cache) >= self.max_cache:
+            self._cache.pop(next(iter(self._cache)))
+        self._cache[key] = structure
+        return structure
+
+    def analyze(self, holdings: Dict[str, float], window: int = 250, end_date: Optional[str] = None,
+                sync: bool = True) -> Dict:
+        """分析持仓相关性，holdings 为代码到持仓市值的映射"""
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        ts_codes = tuple(sorted(code for code, value in holdings.items() if value))
+        result = {"ts_codes": [], "missing": [], "correlation": pd.DataFrame(), "order": [], "clusters": [],
+                  "effective_bets": 0.0, "effective_rank": 0.0, "average_correlation": 0.0}
+        if not ts_codes:
+            return result
+        
+        try:
+            structure = self._structure(ts_codes, window, end_date, sync)
+        except Exception as e:
+            print(f"计算持仓相关性失败：{str(e)}")
+            return result
+        codes = structure["ts_codes"]
+        result["missing"] = structure["missing"]
+        if not codes:
+            return result
+        
+        corr = structure["correlation"]
+        labels = structure["labels"]
+        values = np.array([holdings[code] for code in codes], dtype=float)
+        weights = values / values.sum()
+        cov = corr * np.outer(structure["volatility"], structure["volatility"])
+        # 不同持仓两两之间的加权平均相关系数
+        off_diagonal = weights @ corr @ weights - weights @ weights
+        pair_weight = 1 - weights @ weights
+        
+        clusters = []
+        for label in range(int(labels.max()) + 1):
+            members = np.flatnonzero(labels == label)
+            block = corr[np.ix_(members, members)]
+            size = len(members)
+            clusters.append({
+                "members": [codes[i] for i in members],
+                "weight": float(weights[members].sum()),
+                "average_correlation": float((block.sum() - size) / (size * (size - 1))) if size > 1 else 1.0
+            })
+        clusters.sort(key=lambda cluster: -cluster["weight"])
+        
+        order = [codes[i] for i in structure["order"]]
+        result.update({
+            "ts_codes": codes,
+            "correlation": pd.DataFrame(corr, index=codes, columns=codes).loc[order, order],
+            "order": order,
+            "clusters": clusters,
+            "effective_bets": effective_bets(weights, cov),
+            "effective_rank": effective_rank(corr),
+            "average_correlation": float(off_diagonal / pair_weight) if pair_weight > 0 else 1.0
+        })
+        return result
\ No newline at end of file
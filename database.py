@@ -1,129 +1,544 @@
 import sqlite3
-from datetime import datetime
-from typing import List, Dict, Optional
+import os
+from datetime import datetime, timedelta
+from typing import List, Dict, Optional, Iterable, Iterator
+from urllib.parse import parse_qs
 from models import InvestmentPortfolio, InvestmentGoal, InvestmentAsset
+from config import APIConfig
 import json
+import zlib
+import hashlib
+import numpy as np
+
+# 日线行情字段顺序
+BAR_COLUMNS = ["ts_code", "trade_date", "open", "high", "low", "close", "pre_close", "vol", "amount"]
+
+# 分析缓存：各分析类型的有效期（秒），未列出的类型使用默认值
+ANALYSIS_TTL = {
+    "技术分析": 24 * 3600,
+    "基本面分析": 7 * 24 * 3600,
+    "投资报告": 3 * 24 * 3600,
+}
+DEFAULT_ANALYSIS_TTL = 24 * 3600
+# 分析缓存的压缩后总容量上限（字节），以及每写入多少条执行一次淘汰
+ANALYSIS_CACHE_MAX_BYTES = 64 * 1024 * 1024
+ANALYSIS_SWEEP_INTERVAL = 100
+
+def _encode_analysis(analysis_data: dict) -> tuple:
+    """序列化并压缩分析数据，返回 (压缩内容, 内容哈希, 压缩后字节数)"""
+    raw = json.dumps(analysis_data, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8")
+    payload = zlib.compress(raw, 6)
+    return payload, hashlib.sha256(raw).hexdigest(), len(payload)
+
+def _decode_analysis(payload: bytes) -> dict:
+    """解压并反序列化分析数据"""
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+# 二级索引：列顺序与查询的 WHERE 条件和 ORDER BY 保持一致，避免全表扫描和临时排序
+INDEX_STATEMENTS = [
+    "CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_portfolios_user_created ON portfolios (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_assets_portfolio ON assets (portfolio_id)",
+    "CREATE INDEX IF NOT EXISTS idx_analysis_lookup ON investment_analysis (user_id, symbol, analysis_type, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_profit_analysis_user_created ON profit_analysis (user_id, created_at)",
+    "CREATE INDEX IF NOT EXISTS idx_transactions_user_asset ON transactions (user_id, asset_id)",
+    "CREATE INDEX IF NOT EXISTS idx_goals_user_created ON goals (user_id, created_at)",
+]
+
+def _transactions_page_sql(conditions: List[str]) -> str:
+    """交易记录键集分页查询，conditions 为以 AND 连接的过滤条件"""
+    return f"""
+        SELECT * FROM transactions
+        WHERE {' AND '.join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    """
+
+# 单条语句的绑定参数上限（SQLite 旧版本默认 999），IN 列表按此分批
+SQL_PARAM_LIMIT = 999
+
+def _transaction_history_sql(count: int) -> str:
+    """用户指定资产的交易流水，沿 (user_id, asset_id, ...) 索引逐个资产读取；count 为资产ID个数"""
+    return f"""
+        SELECT id, asset_id, type, quantity, price, amount, created_at FROM transactions
+        WHERE user_id = ? AND asset_id IN ({','.join('?' * count)})
+    """
+
+# 高频查询：用于检查查询计划，任何一条退化为全表扫描或临时排序都视为回归
+HOT_QUERIES = {
+    "get_recent_user": "SELECT id, name, experience, created_at FROM users ORDER BY created_at DESC LIMIT 1",
+    "get_portfolios": "SELECT * FROM portfolios WHERE user_id = ? ORDER BY created_at DESC",
+    "get_recent_portfolio": """
+        SELECT id, name, risk_tolerance, initial_capital, investment_goal,
+               created_at, is_active, total_value, risk_score
+        FROM portfolios
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+        LIMIT 1
+    """,
+    "get_assets": "SELECT * FROM assets WHERE portfolio_id = ?",
+    "get_investment_analysis": """
+        SELECT payload FROM investment_analysis
+        WHERE user_id = ? AND symbol = ? AND analysis_type = ?
+          AND expires_at > datetime('now')
+    """,
+    "expire_investment_analysis": "DELETE FROM investment_analysis WHERE expires_at <= datetime('now')",
+    "get_profit_analysis": "SELECT * FROM profit_analysis WHERE user_id = ? ORDER BY created_at DESC LIMIT 1",
+    "get_transactions": "SELECT * FROM transactions WHERE user_id = ? AND asset_id = ?",
+    "get_user_transactions": "SELECT * FROM transactions WHERE user_id = ?",
+    "get_portfolio_snapshots": """
+        SELECT trade_date, total_value, total_cost, total_profit, nav
+        FROM portfolio_snapshots
+        WHERE portfolio_id = ? AND trade_date BETWEEN ? AND ?
+        ORDER BY trade_date
+    """,
+    "get_daily_bars": """
+        SELECT ts_code, trade_date, close FROM daily_bars
+        WHERE ts_code = ? AND trade_date BETWEEN ? AND ?
+        ORDER BY trade_date
+    """,
+    "get_bar_coverage": "SELECT start_date, end_date, checked_at FROM bar_coverage WHERE ts_code = ?",
+    "get_bar_date_counts": """
+        SELECT trade_date, COUNT(*) FROM daily_bars
+        WHERE trade_date BETWEEN ? AND ?
+        GROUP BY trade_date
+    """,
+    "get_factor_exposures": """
+        SELECT ts_code, size, value, momentum, volatility, quality
+        FROM factor_exposures
+        WHERE trade_date = ?
+        ORDER BY ts_code
+    """,
+    "iter_transactions": "SELECT id, asset_id, type, quantity, price, amount FROM transactions WHERE user_id = ? AND id > ? ORDER BY id",
+    "get_transaction_history": _transaction_history_sql(3),
+    # 分页查询的过滤条件由 get_transactions_page 按参数组合，这里覆盖各类过滤的典型组合
+    "get_transactions_page": _transactions_page_sql(
+        ["user_id = ?", "created_at >= ?", "(created_at, id) < (?, ?)"]
+    ),
+    "get_asset_transactions_page": _transactions_page_sql(
+        ["user_id = ?", "asset_id = ?", "created_at >= ?", "(created_at, id) < (?, ?)"]
+    ),
+    "get_typed_transactions_page": _transactions_page_sql(
+        ["user_id = ?", "created_at >= ?", "(created_at, id) < (?, ?)", "type = ?"]
+    ),
+    "get_goals": """
+        SELECT id, name, target_amount, current_amount, deadline,
+               risk_tolerance, created_at, progress
+        FROM goals
+        WHERE user_id = ?
+        ORDER BY created_at DESC
+    """,
+}
+
+def _migrate_v1_base_tables(cursor: sqlite3.Cursor) -> None:
+    """版本1：创建基础业务表"""
+    # 创建用户表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            experience TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # 创建投资组合表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS portfolios (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            risk_tolerance TEXT NOT NULL,
+            initial_capital REAL NOT NULL,
+            investment_goal TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            is_active BOOLEAN DEFAULT 1,
+            total_value REAL DEFAULT 0,
+            total_profit REAL DEFAULT 0,
+            total_profit_rate REAL DEFAULT 0,
+            risk_score REAL DEFAULT 0,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+    
+    # 创建资产表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS assets (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            portfolio_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            name TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            cost_price REAL NOT NULL,
+            current_price REAL NOT NULL,
+            market_value REAL NOT NULL,
+            profit REAL NOT NULL,
+            profit_rate REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (portfolio_id) REFERENCES portfolios (id)
+        )
+    """)
+    
+    # 创建投资分析表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS investment_analysis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            analysis_type TEXT NOT NULL,
+            analysis_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    
+    # 创建收益分析表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS profit_analysis (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            initial_capital REAL NOT NULL,
+            investment_period INTEGER NOT NULL,
+            expected_return REAL NOT NULL,
+            monthly_investment REAL NOT NULL,
+            risk_tolerance TEXT NOT NULL,
+            total_investment REAL NOT NULL,
+            expected_profit REAL NOT NULL,
+            annualized_return REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    
+    # 创建交易记录表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            asset_id INTEGER NOT NULL,
+            type TEXT NOT NULL,
+            quantity INTEGER NOT NULL,
+            price REAL NOT NULL,
+            amount REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (asset_id) REFERENCES assets (id)
+        )
+    """)
+    
+    # 创建投资目标表
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS goals (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            target_amount REAL NOT NULL,
+            current_amount REAL DEFAULT 0,
+            deadline DATE NOT NULL,
+            risk_tolerance TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    """)
+
+def _migrate_v2_indexes(cursor: sqlite3.Cursor) -> None:
+    """版本2：创建二级索引"""
+    for statement in INDEX_STATEMENTS:
+        cursor.execute(statement)
+
+def _migrate_v3_goal_progress(cursor: sqlite3.Cursor) -> None:
+    """版本3：为投资目标表补充进度列"""
+    cursor.execute("PRAGMA table_info(goals)")
+    if "progress" not in [column[1] for column in cursor.fetchall()]:
+        cursor.execute("ALTER TABLE goals ADD COLUMN progress REAL DEFAULT 0")
+    cursor.execute("""
+        UPDATE goals
+        SET progress = current_amount / target_amount * 100
+        WHERE target_amount > 0
+    """)
+
+def _migrate_v4_bars_and_snapshots(cursor: sqlite3.Cursor) -> None:
+    """版本4：本地日线行情库与投资组合每日净值快照"""
+    # 日线行情（与 Tushare daily/index_daily 字段一致），按 (代码, 交易日) 聚簇存储
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS daily_bars (
+            ts_code TEXT NOT NULL,
+            trade_date TEXT NOT NULL,
+            open REAL,
+            high REAL,
+            low REAL,
+            close REAL NOT NULL,
+            pre_close REAL,
+            vol REAL,
+            amount REAL,
+            PRIMARY KEY (ts_code, trade_date)
+        ) WITHOUT ROWID
+    """)
+    
+    # 投资组合每日净值，按 (组合, 交易日) 聚簇存储，区间查询即一次索引范围读取
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS portfolio_snapshots (
+            portfolio_id INTEGER NOT NULL,
+            trade_date TEXT NOT NULL,
+            total_value REAL NOT NULL,
+            total_cost REAL NOT NULL,
+            total_profit REAL NOT NULL,
+            nav REAL NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (portfolio_id, trade_date),
+            FOREIGN KEY (portfolio_id) REFERENCES portfolios (id)
+        ) WITHOUT ROWID
+    """)
+
+def _migrate_v5_positions(cursor: sqlite3.Cursor) -> None:
+    """版本5：由交易流水物化的持仓、FIFO批次及重放检查点"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS positions (
+            user_id INTEGER NOT NULL,
+            asset_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            cost_basis REAL NOT NULL,
+            avg_cost REAL NOT NULL,
+            realized_pnl REAL NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (user_id, asset_id)
+        ) WITHOUT ROWID
+    """)
+    
+    # 未平仓批次，按开仓交易ID先进先出
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS position_lots (
+            user_id INTEGER NOT NULL,
+            asset_id INTEGER NOT NULL,
+            open_txn_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL,
+            unit_cost REAL NOT NULL,
+            PRIMARY KEY (user_id, asset_id, open_txn_id)
+        ) WITHOUT ROWID
+    """)
+    
+    # 已物化到持仓表的最后一笔交易ID
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS position_checkpoints (
+            user_id INTEGER PRIMARY KEY,
+            last_txn_id INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    
+    # 按用户、交易ID顺序重放流水
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_id ON transactions (user_id, id)")
+
+def _migrate_v6_analysis_cache(cursor: sqlite3.Cursor) -> None:
+    """版本6：投资分析表改为压缩存储、带有效期的缓存表，每个 (用户, 代码, 类型) 仅保留一条"""
+    cursor.execute("""
+        CREATE TABLE investment_analysis_cache (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            analysis_type TEXT NOT NULL,
+            payload BLOB NOT NULL,
+            content_hash TEXT NOT NULL,
+            payload_size INTEGER NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            expires_at TIMESTAMP NOT NULL,
+            UNIQUE (user_id, symbol, analysis_type),
+            FOREIGN KEY (user_id) REFERENCES users(id)
+        )
+    """)
+    
+    # 迁移旧数据：每个键只保留最新一条
+    cursor.execute("""
+        SELECT user_id, symbol, analysis_type, analysis_data, created_at
+        FROM investment_analysis
+        WHERE id IN (
+            SELECT MAX(id) FROM investment_analysis
+            GROUP BY user_id, symbol, analysis_type
+        )
+    """)
+    rows = []
+    for user_id, symbol, analysis_type, analysis_data, created_at in cursor.fetchall():
+        payload, content_hash, payload_size = _encode_analysis(json.loads(analysis_data))
+        ttl = ANALYSIS_TTL.get(analysis_type, DEFAULT_ANALYSIS_TTL)
+        rows.append((user_id, symbol, analysis_type, payload, content_hash, payload_size,
+                     created_at, created_at, f"+{ttl} seconds"))
+    cursor.executemany("""
+        INSERT INTO investment_analysis_cache
+        (user_id, symbol, analysis_type, payload, content_hash, payload_size, created_at, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, datetime(?, ?))
+    """, rows)
+    
+    cursor.execute("DROP TABLE investment_analysis")
+    cursor.execute("ALTER TABLE investment_analysis_cache RENAME TO investment_analysis")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_analysis_expires ON investment_analysis (expires_at)")
+
+def _migrate_v7_transaction_pages(cursor: sqlite3.Cursor) -> None:
+    """版本7：交易记录按时间分页的索引；(user_id, asset_id) 索引扩展为带时间的前缀索引"""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_transactions_user_created ON transactions (user_id, created_at, id)")
+    cursor.execute("DROP INDEX IF EXISTS idx_transactions_user_asset")
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_asset_created ON transactions (user_id, asset_id, created_at, id)"
+    )
+
+def _migrate_v8_factor_exposures(cursor: sqlite3.Cursor) -> None:
+    """版本8：按交易日存储的全市场风格因子暴露，以及日线行情的交易日索引"""
+    # 标准化后的因子暴露，按 (交易日, 代码) 聚簇存储，读取某日截面即一次索引范围读取
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS factor_exposures (
+            trade_date TEXT NOT NULL,
+            ts_code TEXT NOT NULL,
+            size REAL,
+            value REAL,
+            momentum REAL,
+            volatility REAL,
+            quality REAL,
+            PRIMARY KEY (trade_date, ts_code)
+        ) WITHOUT ROWID
+    """)
+    
+    # 全市场按交易日同步日线时检查哪些交易日已经入库
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_daily_bars_trade_date ON daily_bars (trade_date)")
+
+def _migrate_v9_bar_coverage(cursor: sqlite3.Cursor) -> None:
+    """版本9：各代码已从 Tushare 同步过的日线区间，区间内缺少的交易日即为停牌或未上市"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS bar_coverage (
+            ts_code TEXT PRIMARY KEY,
+            start_date TEXT NOT NULL,
+            end_date TEXT NOT NULL,
+            checked_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID
+    """)
+
+def _migrate_v10_unit_nav(cursor: sqlite3.Cursor) -> None:
+    """版本10：净值快照改为剔除资金进出的单位净值，清空按市值/成本计算的旧快照，下次估值时重新生成"""
+    cursor.execute("DELETE FROM portfolio_snapshots")
+
+# 按顺序排列的迁移，列表下标加一即为迁移后的 user_version；只能在末尾追加
+MIGRATIONS = [
+    _migrate_v1_base_tables,
+    _migrate_v2_indexes,
+    _migrate_v3_goal_progress,
+    _migrate_v4_bars_and_snapshots,
+    _migrate_v5_positions,
+    _migrate_v6_analysis_cache,
+    _migrate_v7_transaction_pages,
+    _migrate_v8_factor_exposures,
+    _migrate_v9_bar_coverage,
+    _migrate_v10_unit_nav,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+# 用户数据导出：表名 -> 按用户筛选的流式查询（按主键升序）
+EXPORT_QUERIES = {
+    "users": "SELECT * FROM users WHERE id = ?",
+    "portfolios": "SELECT * FROM portfolios WHERE user_id = ? ORDER BY id",
+    "assets": """
+        SELECT a.* FROM assets a JOIN portfolios p ON p.id = a.portfolio_id
+        WHERE p.user_id = ? ORDER BY a.id
+    """,
+    "transactions": "SELECT * FROM transactions WHERE user_id = ? ORDER BY id",
+    "investment_analysis": "SELECT * FROM investment_analysis WHERE user_id = ? ORDER BY id",
+    "profit_analysis": "SELECT * FROM profit_analysis WHERE user_id = ? ORDER BY id",
+    "goals": "SELECT * FROM goals WHERE user_id = ? ORDER BY id",
+}
+
+# 导入时需要重映射的ID列：列名 -> 被引用的表（按导入顺序排列，被引用的表在前）
+IMPORT_ID_COLUMNS = {
+    "users": {"id": "users"},
+    "portfolios": {"id": "portfolios", "user_id": "users"},
+    "assets": {"id": "assets", "portfolio_id": "portfolios"},
+    "transactions": {"id": "transactions", "user_id": "users", "asset_id": "assets"},
+    "investment_analysis": {"id": "investment_analysis", "user_id": "users"},
+    "profit_analysis": {"id": "profit_analysis", "user_id": "users"},
+    "goals": {"id": "goals", "user_id": "users"},
+}
+
+def _require_pyarrow():
+    """按需导入 pyarrow（Parquet 导入导出的可选依赖）"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet 导入导出需要安装 pyarrow：pip install pyarrow")
+    return pyarrow, pyarrow.parquet
+
+def _arrow_type(pa, declared_type: str):
+    """SQLite 声明类型到 Arrow 类型的映射"""
+    declared_type = declared_type.upper()
+    if "INT" in declared_type or declared_type == "BOOLEAN":
+        return pa.int64()
+    if "REAL" in declared_type:
+        return pa.float64()
+    if "BLOB" in declared_type:
+        return pa.binary()
+    return pa.string()
+
+# 内存库未指定名称时使用的共享库名
+DEFAULT_MEMORY_DB = "investment"
+
+def parse_database_url(database_url: str) -> tuple:
+    """解析数据库地址，返回 (SQLite 连接串, 是否为共享内存库)
+    
+    支持 sqlite:///相对路径、sqlite:////绝对路径、sqlite:///:memory:（可用 ?name= 指定库名）
+    以及不带前缀的文件路径
+    """
+    if "://" not in database_url:
+        return database_url, False
+    scheme, _, rest = database_url.partition("://")
+    if scheme != "sqlite":
+        raise ValueError(f"不支持的数据库地址：{database_url}")
+    
+    path, _, query = rest[1:].partition("?") if rest.startswith("/") else rest.partition("?")
+    if path in ("", ":memory:"):
+        name = parse_qs(query).get("name", [DEFAULT_MEMORY_DB])[0]
+        # 同一进程内同名的连接共享同一个内存库
+        return f"file:{name}?mode=memory&cache=shared", True
+    return path, False
 
 class DatabaseService:
-    def __init__(self, db_path: str = "investment.db"):
-        self.db_path = db_path
+    # 共享内存库在最后一个连接关闭时即被销毁，因此每个库常驻一个连接
+    _memory_keepers: Dict[str, sqlite3.Connection] = {}
+    
+    def __init__(self, database_url: Optional[str] = None):
+        if database_url is None:
+            database_url = APIConfig().DATABASE_URL
+        self.db_path, self.in_memory = parse_database_url(database_url)
+        if self.in_memory and self.db_path not in DatabaseService._memory_keepers:
+            DatabaseService._memory_keepers[self.db_path] = sqlite3.connect(
+                self.db_path, uri=True, check_same_thread=False
+            )
+        self._analysis_writes = 0
         self._init_db()
     
+    def _connect(self, readonly: bool = False) -> sqlite3.Connection:
+        """打开数据库连接；readonly 为只读副本连接，供报表类查询使用"""
+        conn = sqlite3.connect(self.db_path, uri=self.in_memory)
+        if readonly:
+            # 只禁止写入；共享缓存内存库不开启读未提交，避免读到其他连接未提交（可能回滚）的数据
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+    
     def _init_db(self):
-        """初始化数据库表"""
+        """按版本执行数据库迁移，已是最新版本时只读取一次 user_version"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
+                cursor.execute("PRAGMA user_version")
+                if cursor.fetchone()[0] >= SCHEMA_VERSION:
+                    return True
                 
-                # 创建用户表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        name TEXT NOT NULL,
-                        experience TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # 创建投资组合表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS portfolios (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        name TEXT NOT NULL,
-                        risk_tolerance TEXT NOT NULL,
-                        initial_capital REAL NOT NULL,
-                        investment_goal TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        is_active BOOLEAN DEFAULT 1,
-                        total_value REAL DEFAULT 0,
-                        total_profit REAL DEFAULT 0,
-                        total_profit_rate REAL DEFAULT 0,
-                        risk_score REAL DEFAULT 0,
-                        FOREIGN KEY (user_id) REFERENCES users (id)
-                    )
-                """)
-                
-                # 创建资产表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS assets (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        portfolio_id INTEGER NOT NULL,
-                        symbol TEXT NOT NULL,
-                        name TEXT NOT NULL,
-                        quantity INTEGER NOT NULL,
-                        cost_price REAL NOT NULL,
-                        current_price REAL NOT NULL,
-                        market_value REAL NOT NULL,
-                        profit REAL NOT NULL,
-                        profit_rate REAL NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (portfolio_id) REFERENCES portfolios (id)
-                    )
-                """)
-                
-                # 创建投资分析表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS investment_analysis (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        symbol TEXT NOT NULL,
-                        analysis_type TEXT NOT NULL,
-                        analysis_data TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )
-                """)
-                
-                # 创建收益分析表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS profit_analysis (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        initial_capital REAL NOT NULL,
-                        investment_period INTEGER NOT NULL,
-                        expected_return REAL NOT NULL,
-                        monthly_investment REAL NOT NULL,
-                        risk_tolerance TEXT NOT NULL,
-                        total_investment REAL NOT NULL,
-                        expected_profit REAL NOT NULL,
-                        annualized_return REAL NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users(id)
-                    )
-                """)
-                
-                # 创建交易记录表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS transactions (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        asset_id INTEGER NOT NULL,
-                        type TEXT NOT NULL,
-                        quantity INTEGER NOT NULL,
-                        price REAL NOT NULL,
-                        amount REAL NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (id),
-                        FOREIGN KEY (asset_id) REFERENCES assets (id)
-                    )
-                """)
-                
-                # 创建投资目标表
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS goals (
-                        id INTEGER PRIMARY KEY AUTOINCREMENT,
-                        user_id INTEGER NOT NULL,
-                        name TEXT NOT NULL,
-                        target_amount REAL NOT NULL,
-                        current_amount REAL DEFAULT 0,
-                        deadline DATE NOT NULL,
-                        risk_tolerance TEXT NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users (id)
-                    )
-                """)
+                # 文件库启用 WAL：报表读取与写入互不阻塞（该设置持久保存在库文件中）
+                if not self.in_memory:
+                    cursor.execute("PRAGMA journal_mode = WAL")
                 
+                # 加写锁后重新读取版本，避免多个进程重复迁移
+                cursor.execute("BEGIN IMMEDIATE")
+                cursor.execute("PRAGMA user_version")
+                version = cursor.fetchone()[0]
+                for target, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+                    migration(cursor)
+                    cursor.execute(f"PRAGMA user_version = {target}")
                 conn.commit()
             return True
         except Exception as e:
@@ -132,7 +547,7 @@ class DatabaseService:
     
     def create_user(self, name: str, experience: str) -> int:
         """创建新用户"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 "INSERT INTO users (name, experience) VALUES (?, ?)",
@@ -142,7 +557,7 @@ class DatabaseService:
     
     def get_user(self, user_id: int) -> Dict:
         """获取用户信息"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute("SELECT * FROM users WHERE id = ?", (user_id,))
             row = cursor.fetchone()
@@ -158,7 +573,7 @@ class DatabaseService:
     def create_portfolio(self, user_id: int, name: str, risk_tolerance: str, investment_goal: str, total_value: float, total_profit: float, total_profit_rate: float, initial_capital: float) -> int:
         """创建投资组合"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO portfolios (user_id, name, risk_tolerance, investment_goal, total_value, total_profit, total_profit_rate, initial_capital, created_at)
@@ -174,7 +589,7 @@ class DatabaseService:
     def get_portfolio(self, portfolio_id: int) -> Optional[Dict]:
         """获取投资组合信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
                 cursor.execute("""
@@ -192,14 +607,10 @@ class DatabaseService:
     def get_portfolios(self, user_id: int) -> List[Dict]:
         """获取用户的所有投资组合"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT * FROM portfolios 
-                    WHERE user_id = ? 
-                    ORDER BY created_at DESC
-                """, (user_id,))
+                cursor.execute(HOT_QUERIES["get_portfolios"], (user_id,))
                 return [dict(row) for row in cursor.fetchall()]
         except Exception as e:
             print(f"获取投资组合列表失败：{str(e)}")
@@ -208,7 +619,7 @@ class DatabaseService:
     def update_portfolio(self, portfolio_id: int, portfolio: InvestmentPortfolio) -> bool:
         """更新投资组合信息"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE portfolios 
@@ -233,10 +644,11 @@ class DatabaseService:
     def delete_portfolio(self, portfolio_id: int) -> bool:
         """删除投资组合"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                # 先删除相关的资产
+                # 先删除相关的资产和净值快照
                 cursor.execute("DELETE FROM assets WHERE portfolio_id = ?", (portfolio_id,))
+                cursor.execute("DELETE FROM portfolio_snapshots WHERE portfolio_id = ?", (portfolio_id,))
                 # 删除投资组合
                 cursor.execute("DELETE FROM portfolios WHERE id = ?", (portfolio_id,))
                 conn.commit()
@@ -247,7 +659,7 @@ class DatabaseService:
     
     def add_asset(self, portfolio_id: int, symbol: str, name: str, quantity: int, cost_price: float, current_price: float, market_value: float, profit: float, profit_rate: float) -> int:
         """添加资产"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """INSERT INTO assets 
@@ -257,11 +669,69 @@ class DatabaseService:
             )
             return cursor.lastrowid
     
+    def _insert_assets(self, cursor: sqlite3.Cursor, portfolio_id: int, assets: Iterable[Dict]) -> None:
+        """在当前事务中批量写入资产"""
+        cursor.executemany(
+            """INSERT INTO assets
+               (portfolio_id, symbol, name, quantity, cost_price, current_price, market_value, profit, profit_rate, created_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))""",
+            ((
+                portfolio_id,
+                asset['symbol'],
+                asset['name'],
+                asset['quantity'],
+                asset['cost_price'],
+                asset['current_price'],
+                asset['market_value'],
+                asset['profit'],
+                asset['profit_rate']
+            ) for asset in assets)
+        )
+    
+    def add_assets(self, portfolio_id: int, assets: Iterable[Dict], batch_size: int = 1000) -> int:
+        """批量添加资产（单一事务提交），适用于导入大量持仓"""
+        try:
+            count = 0
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                batch = []
+                for asset in assets:
+                    batch.append(asset)
+                    if len(batch) >= batch_size:
+                        self._insert_assets(cursor, portfolio_id, batch)
+                        count += len(batch)
+                        batch = []
+                if batch:
+                    self._insert_assets(cursor, portfolio_id, batch)
+                    count += len(batch)
+            return count
+        except Exception as e:
+            print(f"批量添加资产失败：{str(e)}")
+            return 0
+    
+    def create_portfolio_with_assets(self, user_id: int, name: str, risk_tolerance: str, investment_goal: str,
+                                     assets: List[Dict], total_value: float, total_profit: float,
+                                     total_profit_rate: float, initial_capital: float) -> Optional[int]:
+        """在同一事务中创建投资组合及其全部资产"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    INSERT INTO portfolios (user_id, name, risk_tolerance, investment_goal, total_value, total_profit, total_profit_rate, initial_capital, created_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+                """, (user_id, name, risk_tolerance, investment_goal, total_value, total_profit, total_profit_rate, initial_capital))
+                portfolio_id = cursor.lastrowid
+                self._insert_assets(cursor, portfolio_id, assets)
+                return portfolio_id
+        except Exception as e:
+            print(f"创建投资组合失败：{str(e)}")
+            return None
+    
     def get_assets(self, portfolio_id: int) -> List[Dict]:
         """获取投资组合的资产列表"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
-            cursor.execute("SELECT * FROM assets WHERE portfolio_id = ?", (portfolio_id,))
+            cursor.execute(HOT_QUERIES["get_assets"], (portfolio_id,))
             return [{
                 "id": row[0],
                 "portfolio_id": row[1],
@@ -275,9 +745,84 @@ class DatabaseService:
                 "profit_rate": row[9]
             } for row in cursor.fetchall()]
     
+    def get_portfolio_holdings(self, portfolio_ids: Iterable[int]) -> Dict[str, List]:
+        """一次查询获取多个投资组合的持仓（同一代码合并数量），按列返回组合、代码、数量与现价"""
+        columns = {"portfolio_id": [], "symbol": [], "quantity": [], "current_price": []}
+        portfolio_ids = list(portfolio_ids)
+        if not portfolio_ids:
+            return columns
+        try:
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                placeholders = ",".join("?" * len(portfolio_ids))
+                cursor.execute(f"""
+                    SELECT portfolio_id, symbol, SUM(quantity), MAX(current_price)
+                    FROM assets
+                    WHERE portfolio_id IN ({placeholders})
+                    GROUP BY portfolio_id, symbol
+                    ORDER BY portfolio_id, symbol
+                """, portfolio_ids)
+                for row in cursor.fetchall():
+                    for key, value in zip(columns, row):
+                        columns[key].append(value)
+            return columns
+        except Exception as e:
+            print(f"获取持仓失败：{str(e)}")
+            return columns
+    
+    def get_portfolios_with_assets(self, user_id: int) -> List[Dict]:
+        """一次查询获取用户的全部投资组合及资产（资产按列存放，组合汇总由SQL聚合）"""
+        try:
+            with self._connect(readonly=True) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT p.*,
+                           a.id AS asset_id, a.symbol, a.name AS asset_name, a.quantity,
+                           a.cost_price, a.current_price, a.market_value, a.profit, a.profit_rate,
+                           a.created_at AS asset_created_at,
+                           COALESCE(SUM(a.market_value) OVER w, 0) AS portfolio_value,
+                           COALESCE(SUM(a.profit) OVER w, 0) AS portfolio_profit,
+                           COUNT(a.id) OVER w AS asset_count
+                    FROM portfolios p
+                    LEFT JOIN assets a ON a.portfolio_id = p.id
+                    WHERE p.user_id = ?
+                    WINDOW w AS (PARTITION BY p.id)
+                    ORDER BY p.created_at DESC, p.id DESC, a.id
+                """, (user_id,))
+                
+                asset_columns = ["id", "symbol", "name", "quantity", "cost_price", "current_price",
+                                 "market_value", "profit", "profit_rate", "created_at"]
+                portfolio_columns = None
+                portfolios = []
+                current = None
+                for row in cursor:
+                    if portfolio_columns is None:
+                        portfolio_columns = row.keys()[:row.keys().index("asset_id")]
+                    if current is None or current["id"] != row["id"]:
+                        current = {key: row[key] for key in portfolio_columns}
+                        current["portfolio_value"] = row["portfolio_value"]
+                        current["portfolio_profit"] = row["portfolio_profit"]
+                        current["asset_count"] = row["asset_count"]
+                        current["assets"] = {column: [] for column in asset_columns}
+                        portfolios.append(current)
+                    if row["asset_id"] is None:
+                        continue
+                    assets = current["assets"]
+                    assets["id"].append(row["asset_id"])
+                    assets["symbol"].append(row["symbol"])
+                    assets["name"].append(row["asset_name"])
+                    assets["created_at"].append(row["asset_created_at"])
+                    for column in asset_columns[3:-1]:
+                        assets[column].append(row[column])
+                return portfolios
+        except Exception as e:
+            print(f"获取投资组合及资产失败：{str(e)}")
+            return []
+    
     def create_goal(self, user_id: int, goal: InvestmentGoal) -> int:
         """创建投资目标"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """INSERT INTO goals 
@@ -291,15 +836,9 @@ class DatabaseService:
     def get_goals(self, user_id: int) -> List[Dict]:
         """获取用户的所有投资目标"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, name, target_amount, current_amount, deadline, 
-                           risk_tolerance, created_at, progress
-                    FROM goals
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
-                """, (user_id,))
+                cursor.execute(HOT_QUERIES["get_goals"], (user_id,))
                 goals = cursor.fetchall()
                 return [{
                     'id': g[0],
@@ -319,7 +858,7 @@ class DatabaseService:
         """添加新的投资目标"""
         try:
             progress = (goal.current_amount / goal.target_amount * 100) if goal.target_amount > 0 else 0
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO goals (
@@ -346,7 +885,7 @@ class DatabaseService:
         """更新投资目标"""
         try:
             progress = (goal.current_amount / goal.target_amount * 100) if goal.target_amount > 0 else 0
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE goals
@@ -371,7 +910,7 @@ class DatabaseService:
     def delete_goal(self, goal_id: int) -> bool:
         """删除投资目标"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM goals WHERE id = ?", (goal_id,))
                 conn.commit()
@@ -383,7 +922,7 @@ class DatabaseService:
     def update_goal_progress(self, goal_id: int, current_amount: float) -> bool:
         """更新投资目标进度"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     UPDATE goals
@@ -399,9 +938,9 @@ class DatabaseService:
     
     def add_transaction(self, user_id: int, asset_id: int, 
                        transaction_type: str, quantity: int, 
-                       price: float, amount: float):
+                       price: float, amount: float) -> int:
         """添加交易记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             cursor.execute(
                 """INSERT INTO transactions 
@@ -409,21 +948,16 @@ class DatabaseService:
                    VALUES (?, ?, ?, ?, ?, ?)""",
                 (user_id, asset_id, transaction_type, quantity, price, amount)
             )
+            return cursor.lastrowid
     
     def get_transactions(self, user_id: int, asset_id: Optional[int] = None) -> List[Dict]:
         """获取交易记录"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect() as conn:
             cursor = conn.cursor()
             if asset_id:
-                cursor.execute(
-                    "SELECT * FROM transactions WHERE user_id = ? AND asset_id = ?",
-                    (user_id, asset_id)
-                )
+                cursor.execute(HOT_QUERIES["get_transactions"], (user_id, asset_id))
             else:
-                cursor.execute(
-                    "SELECT * FROM transactions WHERE user_id = ?",
-                    (user_id,)
-                )
+                cursor.execute(HOT_QUERIES["get_user_transactions"], (user_id,))
             return [{
                 "id": row[0],
                 "user_id": row[1],
@@ -435,17 +969,258 @@ class DatabaseService:
                 "transaction_date": row[7]
             } for row in cursor.fetchall()]
     
+    def get_transactions_page(self, user_id: int, limit: int = 50, after: Optional[tuple] = None,
+                              start_date: Optional[str] = None, end_date: Optional[str] = None,
+                              asset_id: Optional[int] = None, transaction_type: Optional[str] = None) -> Dict:
+        """按时间倒序分页获取交易记录（键集分页）
+        
+        after 为上一页返回的 next_cursor，即末行的 (created_at, id)；日期为 YYYY-MM-DD，区间两端均包含。
+        返回 {"items": 本页交易, "next_cursor": 下一页游标，无更多数据时为 None}
+        """
+        # 结束日期并入键集上界：(created_at, id) < (次日, 0) 等价于 created_at < 次日，
+        # 使索引区间直接从游标位置开始，翻页代价与页码无关
+        upper = (self._next_day(end_date) if end_date else "9999-99-99", 0)
+        if after is not None and tuple(after) < upper:
+            upper = tuple(after)
+        
+        conditions = ["user_id = ?"]
+        params = [user_id]
+        if asset_id:
+            conditions.append("asset_id = ?")
+            params.append(asset_id)
+        if start_date:
+            conditions.append("created_at >= ?")
+            params.append(start_date)
+        conditions.append("(created_at, id) < (?, ?)")
+        params.extend(upper)
+        if transaction_type:
+            conditions.append("type = ?")
+            params.append(transaction_type)
+        params.append(limit + 1)
+        try:
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(_transactions_page_sql(conditions), params)
+                rows = cursor.fetchall()
+        except Exception as e:
+            print(f"获取交易记录失败：{str(e)}")
+            return {"items": [], "next_cursor": None}
+        
+        # 多取一行用于判断是否还有下一页
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "items": [{
+                "id": row[0],
+                "user_id": row[1],
+                "asset_id": row[2],
+                "type": row[3],
+                "quantity": row[4],
+                "price": row[5],
+                "amount": row[6],
+                "transaction_date": row[7]
+            } for row in rows],
+            "next_cursor": (rows[-1][7], rows[-1][0]) if has_more else None
+        }
+    
+    def get_transaction_summary(self, user_id: int, group_by: str = "month",
+                                start_date: Optional[str] = None, end_date: Optional[str] = None) -> List[Dict]:
+        """按月或按资产汇总交易笔数、数量与金额（按交易类型分别统计），由 SQL 完成聚合"""
+        if group_by == "month":
+            key = "strftime('%Y-%m', t.created_at)"
+            sql = f"""
+                SELECT {key} AS period, t.type, COUNT(*), SUM(t.quantity), SUM(t.amount)
+                FROM transactions t
+                WHERE t.user_id = ? AND t.created_at >= ? AND t.created_at < ?
+                GROUP BY period, t.type
+                ORDER BY period, t.type
+            """
+        elif group_by == "asset":
+            sql = """
+                SELECT s.asset_id, a.symbol, a.name, s.type, s.count, s.volume, s.amount
+                FROM (
+                    SELECT t.asset_id, t.type, COUNT(*) AS count, SUM(t.quantity) AS volume, SUM(t.amount) AS amount
+                    FROM transactions t
+                    WHERE t.user_id = ? AND t.created_at >= ? AND t.created_at < ?
+                    GROUP BY t.asset_id, t.type
+                ) s
+                LEFT JOIN assets a ON a.id = s.asset_id
+                ORDER BY s.asset_id, s.type
+            """
+        else:
+            print(f"不支持的汇总方式：{group_by}")
+            return []
+        
+        params = (user_id, start_date or "0000-00-00", self._next_day(end_date) if end_date else "9999-99-99")
+        try:
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(sql, params)
+                if group_by == "month":
+                    return [{
+                        "period": row[0],
+                        "type": row[1],
+                        "count": row[2],
+                        "volume": row[3],
+                        "amount": row[4]
+                    } for row in cursor.fetchall()]
+                return [{
+                    "asset_id": row[0],
+                    "symbol": row[1],
+                    "name": row[2],
+                    "type": row[3],
+                    "count": row[4],
+                    "volume": row[5],
+                    "amount": row[6]
+                } for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"汇总交易记录失败：{str(e)}")
+            return []
+    
+    @staticmethod
+    def _next_day(date_str: str) -> str:
+        """YYYY-MM-DD 的次日，用作 created_at 的开区间上界"""
+        return (datetime.strptime(date_str, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")
+    
+    def iter_transactions(self, user_id: int, after_id: int = 0, batch_size: int = 5000) -> Iterator[tuple]:
+        """按交易ID顺序流式读取交易记录 (id, asset_id, type, quantity, price, amount)"""
+        with self._connect(readonly=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute(HOT_QUERIES["iter_transactions"], (user_id, after_id))
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+    
+    def get_transaction_history(self, user_id: int, asset_ids: Iterable[int]) -> List[tuple]:
+        """按交易ID顺序获取指定资产的交易记录 (id, asset_id, type, quantity, price, amount, created_at)
+        
+        资产ID按参数上限分批查询；各资产的记录由索引定位后在内存中按交易ID排序，避免临时排序表
+        """
+        asset_ids = sorted(set(asset_ids))
+        rows = []
+        with self._connect(readonly=True) as conn:
+            cursor = conn.cursor()
+            chunk_size = SQL_PARAM_LIMIT - 1
+            for start in range(0, len(asset_ids), chunk_size):
+                chunk = asset_ids[start:start + chunk_size]
+                cursor.execute(_transaction_history_sql(len(chunk)), (user_id, *chunk))
+                rows.extend(cursor.fetchall())
+        rows.sort()
+        return rows
+    
+    def get_position_checkpoint(self, user_id: int) -> int:
+        """获取已物化到持仓表的最后一笔交易ID"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT last_txn_id FROM position_checkpoints WHERE user_id = ?", (user_id,))
+            row = cursor.fetchone()
+            return row[0] if row else 0
+    
+    def load_position_state(self, user_id: int, asset_ids: Iterable[int]) -> Dict[int, Dict]:
+        """读取指定资产的物化持仓及其未平仓批次"""
+        states = {}
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            for asset_id in asset_ids:
+                cursor.execute("""
+                    SELECT quantity, cost_basis, realized_pnl FROM positions
+                    WHERE user_id = ? AND asset_id = ?
+                """, (user_id, asset_id))
+                row = cursor.fetchone()
+                if not row:
+                    continue
+                cursor.execute("""
+                    SELECT open_txn_id, quantity, unit_cost FROM position_lots
+                    WHERE user_id = ? AND asset_id = ?
+                    ORDER BY open_txn_id
+                """, (user_id, asset_id))
+                states[asset_id] = {
+                    "quantity": row[0],
+                    "cost_basis": row[1],
+                    "realized_pnl": row[2],
+                    "lots": cursor.fetchall()
+                }
+        return states
+    
+    def save_position_state(self, user_id: int, states: Dict[int, Dict], last_txn_id: int,
+                            replace_all: bool = False, expected_checkpoint: Optional[int] = None) -> bool:
+        """在同一事务中写回持仓、批次与检查点；replace_all 为真时先清空该用户的物化数据；
+        给定 expected_checkpoint 时只在检查点仍为该值时写入，已被并发刷新推进则放弃写入并返回 False
+        """
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                # 先加写锁再核对检查点，核对与写入之间不会插入其他写入
+                cursor.execute("BEGIN IMMEDIATE")
+                if expected_checkpoint is not None:
+                    cursor.execute("SELECT last_txn_id FROM position_checkpoints WHERE user_id = ?", (user_id,))
+                    row = cursor.fetchone()
+                    if (row[0] if row else 0) != expected_checkpoint:
+                        return False
+                if replace_all:
+                    cursor.execute("DELETE FROM positions WHERE user_id = ?", (user_id,))
+                    cursor.execute("DELETE FROM position_lots WHERE user_id = ?", (user_id,))
+                else:
+                    cursor.executemany(
+                        "DELETE FROM position_lots WHERE user_id = ? AND asset_id = ?",
+                        ((user_id, asset_id) for asset_id in states)
+                    )
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO positions
+                    (user_id, asset_id, quantity, cost_basis, avg_cost, realized_pnl, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, datetime('now'))
+                """, ((
+                    user_id,
+                    asset_id,
+                    state["quantity"],
+                    state["cost_basis"],
+                    state["cost_basis"] / state["quantity"] if state["quantity"] > 0 else 0.0,
+                    state["realized_pnl"]
+                ) for asset_id, state in states.items()))
+                cursor.executemany("""
+                    INSERT INTO position_lots (user_id, asset_id, open_txn_id, quantity, unit_cost)
+                    VALUES (?, ?, ?, ?, ?)
+                """, (
+                    (user_id, asset_id, open_txn_id, quantity, unit_cost)
+                    for asset_id, state in states.items()
+                    for open_txn_id, quantity, unit_cost in state["lots"]
+                ))
+                cursor.execute("""
+                    INSERT OR REPLACE INTO position_checkpoints (user_id, last_txn_id, updated_at)
+                    VALUES (?, ?, datetime('now'))
+                """, (user_id, last_txn_id))
+                return True
+        except Exception as e:
+            print(f"保存持仓失败：{str(e)}")
+            return False
+    
+    def get_positions(self, user_id: int) -> List[Dict]:
+        """获取用户的物化持仓（附资产代码、名称与最新价）"""
+        try:
+            with self._connect(readonly=True) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT p.asset_id, a.symbol, a.name, a.current_price,
+                           p.quantity, p.cost_basis, p.avg_cost, p.realized_pnl, p.updated_at
+                    FROM positions p
+                    LEFT JOIN assets a ON a.id = p.asset_id
+                    WHERE p.user_id = ?
+                    ORDER BY p.asset_id
+                """, (user_id,))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"获取持仓失败：{str(e)}")
+            return []
+    
     def get_recent_user(self) -> Optional[Dict]:
         """获取最近创建的用户"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, name, experience, created_at
-                    FROM users
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """)
+                cursor.execute(HOT_QUERIES["get_recent_user"])
                 user = cursor.fetchone()
                 if user:
                     return {
@@ -462,16 +1237,9 @@ class DatabaseService:
     def get_recent_portfolio(self, user_id: int) -> Optional[Dict]:
         """获取用户最近创建的投资组合"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT id, name, risk_tolerance, initial_capital, investment_goal, 
-                           created_at, is_active, total_value, risk_score
-                    FROM portfolios
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """, (user_id,))
+                cursor.execute(HOT_QUERIES["get_recent_portfolio"], (user_id,))
                 portfolio = cursor.fetchone()
                 if portfolio:
                     return {
@@ -493,9 +1261,13 @@ class DatabaseService:
     def clear_all_data(self):
         """清空所有数据"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 # 按顺序删除数据，避免外键约束问题
+                conn.execute("DELETE FROM position_lots")
+                conn.execute("DELETE FROM positions")
+                conn.execute("DELETE FROM position_checkpoints")
                 conn.execute("DELETE FROM transactions")
+                conn.execute("DELETE FROM portfolio_snapshots")
                 conn.execute("DELETE FROM assets")
                 conn.execute("DELETE FROM goals")
                 conn.execute("DELETE FROM portfolios")
@@ -506,44 +1278,82 @@ class DatabaseService:
             return False
     
     def save_investment_analysis(self, user_id: int, symbol: str, analysis_type: str, analysis_data: dict) -> int:
-        """保存投资分析数据"""
+        """保存投资分析数据（同一用户、代码、类型覆盖旧数据并重置有效期）"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    INSERT INTO investment_analysis (user_id, symbol, analysis_type, analysis_data)
-                    VALUES (?, ?, ?, ?)
-                """, (user_id, symbol, analysis_type, json.dumps(analysis_data)))
-                conn.commit()
-                return cursor.lastrowid
+            return self.save_investment_analyses([(user_id, symbol, analysis_type, analysis_data)])
         except Exception as e:
             print(f"保存投资分析数据失败：{str(e)}")
             raise
     
+    def save_investment_analyses(self, rows: Iterable[tuple]) -> int:
+        """批量保存投资分析数据 (user_id, symbol, analysis_type, analysis_data)，单一事务提交"""
+        records = []
+        for user_id, symbol, analysis_type, analysis_data in rows:
+            payload, content_hash, payload_size = _encode_analysis(analysis_data)
+            ttl = ANALYSIS_TTL.get(analysis_type, DEFAULT_ANALYSIS_TTL)
+            records.append((user_id, symbol, analysis_type, payload, content_hash, payload_size, f"+{ttl} seconds"))
+        
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            # 内容未变化时只延长有效期，不重写压缩内容
+            cursor.executemany("""
+                INSERT INTO investment_analysis
+                (user_id, symbol, analysis_type, payload, content_hash, payload_size, created_at, expires_at)
+                VALUES (?, ?, ?, ?, ?, ?, datetime('now'), datetime('now', ?))
+                ON CONFLICT (user_id, symbol, analysis_type) DO UPDATE SET
+                    payload = CASE WHEN content_hash = excluded.content_hash THEN payload ELSE excluded.payload END,
+                    payload_size = excluded.payload_size,
+                    content_hash = excluded.content_hash,
+                    created_at = excluded.created_at,
+                    expires_at = excluded.expires_at
+            """, records)
+            count = cursor.rowcount
+        
+        self._analysis_writes += len(records)
+        if self._analysis_writes >= ANALYSIS_SWEEP_INTERVAL:
+            self._analysis_writes = 0
+            self.evict_investment_analysis()
+        return count
+    
     def get_investment_analysis(self, user_id: int, symbol: str, analysis_type: str) -> Optional[dict]:
-        """获取投资分析数据"""
+        """获取未过期的投资分析数据"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
-                conn.row_factory = sqlite3.Row
+            with self._connect() as conn:
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT * FROM investment_analysis
-                    WHERE user_id = ? AND symbol = ? AND analysis_type = ?
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """, (user_id, symbol, analysis_type))
+                cursor.execute(HOT_QUERIES["get_investment_analysis"], (user_id, symbol, analysis_type))
                 row = cursor.fetchone()
-                return json.loads(row['analysis_data']) if row else None
+                return _decode_analysis(row[0]) if row else None
         except Exception as e:
             print(f"获取投资分析数据失败：{str(e)}")
             return None
     
+    def evict_investment_analysis(self, max_bytes: int = ANALYSIS_CACHE_MAX_BYTES) -> int:
+        """淘汰过期的分析缓存；总容量仍超限时按到期时间由早到晚继续淘汰，返回删除条数"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(HOT_QUERIES["expire_investment_analysis"])
+                deleted = cursor.rowcount
+                cursor.execute("""
+                    DELETE FROM investment_analysis WHERE id IN (
+                        SELECT id FROM (
+                            SELECT id, SUM(payload_size) OVER (ORDER BY expires_at DESC, id DESC) AS kept_bytes
+                            FROM investment_analysis
+                        )
+                        WHERE kept_bytes > ?
+                    )
+                """, (max_bytes,))
+                return deleted + cursor.rowcount
+        except Exception as e:
+            print(f"淘汰分析缓存失败：{str(e)}")
+            return 0
+    
     def save_profit_analysis(self, user_id: int, initial_capital: float, investment_period: int,
                             expected_return: float, monthly_investment: float, risk_tolerance: str,
                             total_investment: float, expected_profit: float, annualized_return: float) -> int:
         """保存收益分析数据"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 cursor = conn.cursor()
                 cursor.execute("""
                     INSERT INTO profit_analysis (
@@ -561,20 +1371,306 @@ class DatabaseService:
             print(f"保存收益分析数据失败：{str(e)}")
             raise
     
+    def save_profit_analyses(self, rows: Iterable[tuple]) -> int:
+        """批量保存收益分析数据（字段顺序同 save_profit_analysis 参数），单一事务提交"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO profit_analysis (
+                    user_id, initial_capital, investment_period, expected_return,
+                    monthly_investment, risk_tolerance, total_investment,
+                    expected_profit, annualized_return
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, rows)
+            return cursor.rowcount
+    
     def get_profit_analysis(self, user_id: int) -> Optional[dict]:
         """获取收益分析数据"""
         try:
-            with sqlite3.connect(self.db_path) as conn:
+            with self._connect() as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT * FROM profit_analysis
-                    WHERE user_id = ?
-                    ORDER BY created_at DESC
-                    LIMIT 1
-                """, (user_id,))
+                cursor.execute(HOT_QUERIES["get_profit_analysis"], (user_id,))
                 row = cursor.fetchone()
                 return dict(row) if row else None
         except Exception as e:
             print(f"获取收益分析数据失败：{str(e)}")
-            return None 
\ No newline at end of file
+            return None
+    
+    def save_daily_bars(self, bars: Iterable[tuple]) -> int:
+        """批量写入日线行情，字段顺序见 BAR_COLUMNS，已存在的交易日会被覆盖"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany(f"""
+                    INSERT OR REPLACE INTO daily_bars ({", ".join(BAR_COLUMNS)})
+                    VALUES ({", ".join("?" * len(BAR_COLUMNS))})
+                """, bars)
+                return cursor.rowcount
+        except Exception as e:
+            print(f"保存日线行情失败：{str(e)}")
+            return 0
+    
+    def get_bar_coverage(self, ts_codes: List[str]) -> Dict[str, tuple]:
+        """获取各代码已同步的日线区间 (起始日, 截止日, 检查时间)；没有同步记录时以本地已有行情的首末交易日代替，
+        检查时间为 None
+        """
+        try:
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                coverage = {}
+                for ts_code in ts_codes:
+                    cursor.execute(HOT_QUERIES["get_bar_coverage"], (ts_code,))
+                    row = cursor.fetchone()
+                    if row is None:
+                        cursor.execute(
+                            "SELECT MIN(trade_date), MAX(trade_date), NULL FROM daily_bars WHERE ts_code = ?",
+                            (ts_code,)
+                        )
+                        row = cursor.fetchone()
+                    if row[0]:
+                        coverage[ts_code] = tuple(row)
+                return coverage
+        except Exception as e:
+            print(f"获取行情同步区间失败：{str(e)}")
+            return {}
+    
+    def save_bar_coverage(self, coverage: Iterable[tuple]) -> int:
+        """批量记录各代码已同步的日线区间 (ts_code, start_date, end_date)"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO bar_coverage (ts_code, start_date, end_date, checked_at)
+                    VALUES (?, ?, ?, CURRENT_TIMESTAMP)
+                """, coverage)
+                return cursor.rowcount
+        except Exception as e:
+            print(f"保存行情同步区间失败：{str(e)}")
+            return 0
+    
+    def get_daily_bars(self, ts_codes: List[str], start_date: str, end_date: str,
+                       columns: Iterable[str] = ("close",)) -> List[tuple]:
+        """按代码和日期区间读取日线行情，返回 (ts_code, trade_date, *columns) 元组列表"""
+        columns = [column for column in columns if column in BAR_COLUMNS[2:]]
+        try:
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                rows = []
+                for ts_code in ts_codes:
+                    cursor.execute(f"""
+                        SELECT ts_code, trade_date, {", ".join(columns)} FROM daily_bars
+                        WHERE ts_code = ? AND trade_date BETWEEN ? AND ?
+                        ORDER BY trade_date
+                    """, (ts_code, start_date, end_date))
+                    rows.extend(cursor.fetchall())
+                return rows
+        except Exception as e:
+            print(f"获取日线行情失败：{str(e)}")
+            return []
+    
+    def get_bar_date_counts(self, start_date: str, end_date: str) -> Dict[str, int]:
+        """统计日期区间内每个交易日本地已有的日线条数"""
+        try:
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(HOT_QUERIES["get_bar_date_counts"], (start_date, end_date))
+                return dict(cursor.fetchall())
+        except Exception as e:
+            print(f"统计日线行情失败：{str(e)}")
+            return {}
+    
+    def save_factor_exposures(self, exposures: Iterable[tuple]) -> int:
+        """批量写入因子暴露 (trade_date, ts_code, size, value, momentum, volatility, quality)，已存在的会被覆盖"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO factor_exposures
+                    (trade_date, ts_code, size, value, momentum, volatility, quality)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                """, exposures)
+                return cursor.rowcount
+        except Exception as e:
+            print(f"保存因子暴露失败：{str(e)}")
+            return 0
+    
+    def get_factor_exposures(self, trade_date: str) -> List[tuple]:
+        """读取某一交易日的全市场因子暴露，返回 (ts_code, size, value, momentum, volatility, quality) 元组列表"""
+        try:
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                cursor.execute(HOT_QUERIES["get_factor_exposures"], (trade_date,))
+                return cursor.fetchall()
+        except Exception as e:
+            print(f"获取因子暴露失败：{str(e)}")
+            return []
+    
+    def save_portfolio_snapshots(self, snapshots: Iterable[tuple]) -> int:
+        """批量写入投资组合净值快照 (portfolio_id, trade_date, total_value, total_cost, total_profit, nav)"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.executemany("""
+                    INSERT OR REPLACE INTO portfolio_snapshots
+                    (portfolio_id, trade_date, total_value, total_cost, total_profit, nav)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, snapshots)
+                return cursor.rowcount
+        except Exception as e:
+            print(f"保存净值快照失败：{str(e)}")
+            return 0
+    
+    def get_last_snapshot_date(self, portfolio_id: int) -> Optional[str]:
+        """获取投资组合最近一次净值快照的交易日"""
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "SELECT MAX(trade_date) FROM portfolio_snapshots WHERE portfolio_id = ?",
+                    (portfolio_id,)
+                )
+                return cursor.fetchone()[0]
+        except Exception as e:
+            print(f"获取最近净值快照失败：{str(e)}")
+            return None
+    
+    def get_portfolio_snapshots(self, portfolio_id: int, start_date: str = "00000000",
+                                end_date: str = "99999999") -> List[Dict]:
+        """获取投资组合在日期区间内的净值序列"""
+        try:
+            with self._connect(readonly=True) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                cursor.execute(HOT_QUERIES["get_portfolio_snapshots"], (portfolio_id, start_date, end_date))
+                return [dict(row) for row in cursor.fetchall()]
+        except Exception as e:
+            print(f"获取净值快照失败：{str(e)}")
+            return []
+    
+    def export_user_data(self, user_id: int, directory: str, chunk_size: int = 50000) -> Dict[str, int]:
+        """将用户数据按表流式导出为 Parquet 文件（每表一个文件），返回各表导出的行数
+        
+        每次只从游标取出 chunk_size 行写成一个行组，内存占用与总行数无关
+        """
+        try:
+            pa, pq = _require_pyarrow()
+            os.makedirs(directory, exist_ok=True)
+            counts = {}
+            with self._connect(readonly=True) as conn:
+                cursor = conn.cursor()
+                for table, sql in EXPORT_QUERIES.items():
+                    declared = {row[1]: row[2] for row in cursor.execute(f"PRAGMA table_info({table})")}
+                    cursor.execute(sql, (user_id,))
+                    names = [column[0] for column in cursor.description]
+                    schema = pa.schema([(name, _arrow_type(pa, declared.get(name, ""))) for name in names])
+                    
+                    counts[table] = 0
+                    with pq.ParquetWriter(os.path.join(directory, f"{table}.parquet"), schema,
+                                          compression="zstd") as writer:
+                        while True:
+                            rows = cursor.fetchmany(chunk_size)
+                            if not rows:
+                                break
+                            columns = zip(*rows)
+                            writer.write_batch(pa.RecordBatch.from_arrays(
+                                [pa.array(values, type=field.type) for values, field in zip(columns, schema)],
+                                schema=schema
+                            ))
+                            counts[table] += len(rows)
+            return counts
+        except Exception as e:
+            print(f"导出用户数据失败：{str(e)}")
+            return {}
+    
+    def import_user_data(self, directory: str, batch_size: int = 50000) -> Optional[int]:
+        """从 export_user_data 导出的 Parquet 文件导入用户数据，返回新用户ID
+        
+        整个导入在一个事务内完成；各表ID按固定偏移量整体平移到当前最大ID之后，
+        引用列按被引用表的偏移量换算，因此可逐批 executemany 写入而无需逐行查询新ID。
+        被引用表的数据文件缺失时整体放弃导入；引用了未导入行的记录（无法换算）被跳过
+        """
+        try:
+            pa, pq = _require_pyarrow()
+            if not os.path.exists(os.path.join(directory, "users.parquet")):
+                print(f"导入目录中缺少用户数据：{directory}")
+                return None
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                cursor.execute("BEGIN IMMEDIATE")
+                bases: Dict[str, int] = {}
+                offsets: Dict[str, int] = {}
+                # 各表已导入行的旧ID，用于校验引用列
+                imported: Dict[str, np.ndarray] = {}
+                for table, id_columns in IMPORT_ID_COLUMNS.items():
+                    path = os.path.join(directory, f"{table}.parquet")
+                    if not os.path.exists(path):
+                        continue
+                    parquet = pq.ParquetFile(path)
+                    if parquet.metadata.num_rows == 0:
+                        continue
+                    current = {row[1] for row in cursor.execute(f"PRAGMA table_info({table})")}
+                    names = [name for name in parquet.schema_arrow.names if name in current]
+                    references = {name: ref for name, ref in id_columns.items() if name != "id" and name in names}
+                    missing = sorted({ref for ref in references.values() if ref not in imported})
+                    if missing:
+                        raise ValueError(f"{table} 引用的 {', '.join(missing)} 数据文件缺失或为空")
+                    
+                    # 本表最小的旧ID映射到当前最大ID之后
+                    cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+                    bases[table] = cursor.fetchone()[0] + 1
+                    old_ids = parquet.read(columns=["id"]).column("id").to_numpy()
+                    offsets[table] = bases[table] - int(old_ids.min())
+                    
+                    sql = f"INSERT INTO {table} ({', '.join(names)}) VALUES ({', '.join('?' * len(names))})"
+                    kept_ids = []
+                    rejected = 0
+                    for batch in parquet.iter_batches(batch_size=batch_size, columns=names):
+                        keep = np.ones(batch.num_rows, dtype=bool)
+                        for name, ref in references.items():
+                            keep &= np.isin(batch.column(name).to_numpy(zero_copy_only=False), imported[ref])
+                        if not keep.all():
+                            rejected += int((~keep).sum())
+                            batch = batch.filter(pa.array(keep))
+                        kept_ids.append(batch.column("id").to_numpy(zero_copy_only=False))
+                        columns = []
+                        for name in names:
+                            column = batch.column(name)
+                            if name in id_columns:
+                                offset = offsets.get(id_columns[name], 0)
+                                columns.append((column.to_numpy(zero_copy_only=False) + offset).tolist())
+                            else:
+                                columns.append(column.to_pylist())
+                        cursor.executemany(sql, zip(*columns))
+                    imported[table] = np.concatenate(kept_ids)
+                    if rejected:
+                        print(f"{table} 有 {rejected} 条记录引用了导出数据之外的行，已跳过")
+                conn.commit()
+                return bases["users"]
+        except Exception as e:
+            print(f"导入用户数据失败：{str(e)}")
+            return None
+    
+    def explain_hot_queries(self) -> Dict[str, List[str]]:
+        """获取高频查询的执行计划"""
+        plans = {}
+        with self._connect(readonly=True) as conn:
+            cursor = conn.cursor()
+            for name, sql in HOT_QUERIES.items():
+                params = (None,) * sql.count("?")
+                cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+                plans[name] = [row[3] for row in cursor.fetchall()]
+        return plans
+    
+    def check_query_plans(self) -> List[str]:
+        """检查高频查询是否退化为全表扫描，返回出现回归的查询描述"""
+        regressions = []
+        for name, details in self.explain_hot_queries().items():
+            # 无过滤条件的查询允许沿索引有序遍历（配合 LIMIT 提前结束）
+            filtered = "WHERE" in HOT_QUERIES[name].upper()
+            for detail in details:
+                full_scan = detail.startswith("SCAN") and (filtered or "INDEX" not in detail)
+                if full_scan or "TEMP B-TREE" in detail:
+                    regressions.append(f"{name}: {detail}")
+        return regressions
@@ -0,0 +1,169 @@
+from typing import Callable, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+import warnings
+import numpy as np
+import pandas as pd
+from market_store import MarketDataStore
+from screener import StockScreener, StockUniverse
+
+# 风格因子：规模（总市值对数）、价值（账面市值比与盈利收益率）、动量（剔除最近一个月的过去一年收益）、
+# 波动（日收益标准差）、质量（ROE、毛利率与低负债）
+FACTORS = {
+    "size": "规模",
+    "value": "价值",
+    "momentum": "动量",
+    "volatility": "波动",
+    "quality": "质量"
+}
+
+def standardize(values: np.ndarray, limit: float = 5.0) -> np.ndarray:
+    """按列去极值（中位数 ± limit 倍 MAD）后标准化为均值 0、标准差 1，缺失值保持缺失"""
+    with warnings.catch_warnings():
+        # 整列缺失时 nanmedian / nanmean 会告警，结果为 NaN 即可
+        warnings.simplefilter("ignore", RuntimeWarning)
+        median = np.nanmedian(values, axis=0)
+        mad = np.nanmedian(np.abs(values - median), axis=0) * 1.4826
+        clipped = np.clip(values, median - limit * mad, median + limit * mad)
+        mean = np.nanmean(clipped, axis=0)
+        std = np.nanstd(clipped, axis=0)
+    return np.divide(clipped - mean, std, out=np.full(np.shape(clipped), np.nan), where=std > 0)
+
+def composite(*descriptors: np.ndarray) -> np.ndarray:
+    """多个描述变量分别标准化后取平均（忽略缺失的描述变量）"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        return np.nanmean(standardize(np.column_stack(descriptors)), axis=1)
+
+def price_descriptors(close: np.ndarray, pre_close: np.ndarray, momentum_window: int = 252, skip_window: int = 21,
+                      volatility_window: int = 252, min_coverage: float = 0.8) -> Tuple[np.ndarray, np.ndarray]:
+    """由日期 × 代码的收盘价与前收盘价面板（最后一行为计算日）计算动量与波动率
+    
+    面板的行须为连续的交易日（缺失行情为 NaN）；收益率按前收盘价计算，不受除权影响。
+    窗口内有效交易日不足窗口长度 min_coverage 的代码（上市不久、长期停牌或行情缺失）记为缺失
+    """
+    with np.errstate(invalid="ignore", divide="ignore"):
+        daily = close / pre_close - 1
+    daily[~np.isfinite(daily)] = np.nan
+    log_returns = np.log1p(daily)
+    
+    # 动量：[T - momentum_window, T - skip_window) 内的累计对数收益
+    window = log_returns[-momentum_window:len(log_returns) - skip_window]
+    observed = np.count_nonzero(~np.isnan(window), axis=0)
+    momentum = np.where(observed >= min_coverage * (momentum_window - skip_window), np.expm1(np.nansum(window, axis=0)), np.nan)
+    
+    window = daily[-volatility_window:]
+    observed = np.count_nonzero(~np.isnan(window), axis=0)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        volatility = np.where(observed >= min_coverage * volatility_window, np.nanstd(window, axis=0, ddof=1), np.nan)
+    return momentum, volatility
+
+class FactorEngine:
+    """风格因子引擎：由每日指标、日线与财务指标计算全市场标准化因子暴露，按交易日存入本地库"""
+
+    def __init__(self, screener: StockScreener, market_store: MarketDataStore, momentum_window: int = 252,
+                 skip_window: int = 21, volatility_window: int = 252, min_coverage: float = 0.8,
+                 calendar: str = "000001.SH", min_count: int = 1000):
+        self.screener = screener
+        self.market_store = market_store
+        self.db_service = market_store.db_service
+        self.momentum_window = momentum_window
+        self.skip_window = skip_window
+        self.volatility_window = volatility_window
+        # 计算动量与波动率所需的有效交易日占窗口的最低比例
+        self.min_coverage = min_coverage
+        # 交易日历所用指数，以及视为全市场行情完整的单日最少条数
+        self.calendar = calendar
+        self.min_count = min_count
+
+    def exposures(self, universe: StockUniverse, close: np.ndarray, pre_close: np.ndarray) -> np.ndarray:
+        """全市场截面的因子暴露矩阵（代码 × 因子，列顺序同 FACTORS），面板的列须与 universe.ts_codes 对齐"""
+        columns = universe.columns
+        with np.errstate(invalid="ignore", divide="ignore"):
+            size = np.where(columns["total_mv"] > 0, np.log(columns["total_mv"]), np.nan)
+            # 市净率、市盈率为负或缺失（亏损）时对应描述变量记为缺失
+            book_to_price = np.where(columns["pb"] > 0, 1 / columns["pb"], np.nan)
+            earnings_yield = np.where(columns["pe_ttm"] > 0, 1 / columns["pe_ttm"], np.nan)
+        momentum, volatility = price_descriptors(close, pre_close, self.momentum_window, self.skip_window,
+                                                 self.volatility_window, self.min_coverage)
+        value = composite(book_to_price, earnings_yield)
+        quality = composite(columns["roe"], columns["grossprofit_margin"], -columns["debt_to_assets"])
+        return standardize(np.column_stack([size, value, momentum, volatility, quality]))
+
+    def compute(self, date: Optional[str] = None, sync: bool = True, refresh: bool = False,
+                progress: Optional[Callable[[int, int], None]] = None) -> pd.DataFrame:
+        """计算（或读取已存储的）截至 date 最近交易日的全市场因子暴露，索引为代码、列为因子
+        
+        窗口内的全市场日线不完整（同步失败或被截断）时不计算也不存储，返回空表，下次调用时重新同步
+        """
+        universe = self.screener.load(date)
+        if universe is None or not len(universe):
+            return pd.DataFrame(columns=list(FACTORS), dtype=float)
+        trade_date = universe.trade_date
+        if not refresh:
+            stored = self.load(trade_date)
+            if not stored.empty:
+                return stored
+        
+        try:
+            # 按交易日约占自然日的 2/3 向前多取，保证窗口填满
+            lookback = max(self.momentum_window, self.volatility_window)
+            start_date = (datetime.strptime(trade_date, '%Y%m%d')
+                          - timedelta(days=int(lookback * 1.6) + 10)).strftime('%Y%m%d')
+            if sync:
+                self.market_store.sync_market_bars(start_date, trade_date, self.calendar, self.min_count,
+                                                   progress=progress)
+            # 以指数日线为交易日历，窗口内每个交易日的全市场日线都须完整
+            trade_dates = self.market_store.get_price_panel([self.calendar], start_date, trade_date).index
+            window_dates = trade_dates[-lookback:]
+            counts = self.db_service.get_bar_date_counts(start_date, trade_date)
+            incomplete = [day for day in window_dates if counts.get(day, 0) < self.min_count]
+            if len(window_dates) < lookback or window_dates[-1] != trade_date or incomplete:
+                print(f"截至 {trade_date} 的全市场日线不足 {lookback} 个完整交易日"
+                      f"（日历 {len(window_dates)} 日，缺失 {len(incomplete)} 日），暂不计算因子暴露")
+                return pd.DataFrame(columns=list(FACTORS), dtype=float)
+            ts_codes = list(universe.ts_codes)
+            panels = self.market_store.get_price_panels(ts_codes, start_date, trade_date, fields=('close', 'pre_close'))
+            # 对齐到交易日历，停牌或缺失行情的交易日为 NaN，按实际交易日计算各代码的窗口覆盖
+            close = panels['close'].reindex(window_dates).to_numpy()
+            pre_close = panels['pre_close'].reindex(window_dates).to_numpy()
+            matrix = self.exposures(universe, close, pre_close)
+        except Exception as e:
+            print(f"计算因子暴露失败：{str(e)}")
+            return pd.DataFrame(columns=list(FACTORS), dtype=float)
+        
+        frame = pd.DataFrame(matrix, index=pd.Index(ts_codes, name='ts_code'), columns=list(FACTORS))
+        rows = frame.astype(object).where(frame.notna(), None).itertuples(name=None)
+        self.db_service.save_factor_exposures((trade_date, *row) for row in rows)
+        return frame
+
+    def load(self, trade_date: str) -> pd.DataFrame:
+        """读取已存储的某一交易日因子暴露"""
+        rows = self.db_service.get_factor_exposures(trade_date)
+        frame = pd.DataFrame(rows, columns=['ts_code', *FACTORS]).set_index('ts_code')
+        return frame.astype(float)
+
+    @staticmethod
+    def aggregate(frame: pd.DataFrame, holdings: Dict[str, float]) -> Dict:
+        """按持仓市值加权汇总因子暴露；没有暴露数据的持仓按 0（市场平均）计入，coverage 为有数据的市值占比"""
+        codes = [code for code, value in holdings.items() if value]
+        values = np.array([holdings[code] for code in codes], dtype=float)
+        total = values.sum()
+        if not codes or total <= 0:
+            return {"exposures": {factor: 0.0 for factor in FACTORS}, "coverage": 0.0, "missing": codes}
+        weights = values / total
+        matrix = frame.reindex(codes).to_numpy(dtype=float)
+        return {
+            "exposures": dict(zip(FACTORS, (weights @ np.nan_to_num(matrix, nan=0.0)).tolist())),
+            "coverage": float(weights[~np.isnan(matrix).all(axis=1)].sum()),
+            "missing": [code for code, row in zip(codes, matrix) if np.isnan(row).all()]
+        }
+
+    def portfolio_exposures(self, holdings: Dict[str, float], date: Optional[str] = None, sync: bool = True,
+                            progress: Optional[Callable[[int, int], None]] = None) -> Dict:
+        """组合层面的风格因子暴露，holdings 为代码到持仓市值的映射，progress 报告全市场行情的同步进度"""
+        frame = self.compute(date, sync, progress=progress)
+        result = self.aggregate(frame, holdings)
+        universe = self.screener.load(date)
+        result["trade_date"] = universe.trade_date if universe is not None else None
+        return result
\ No newline at end of file
@@ -0,0 +1,308 @@
+from typing import List, Dict, Optional, Tuple
+from collections import deque
+import numpy as np
+
+# 默认参数与技术分析页一致
+MA_WINDOWS = (5, 10, 20)
+MACD_PARAMS = (12, 26, 9)
+RSI_PERIOD = 14
+BOLL_PARAMS = (20, 2.0)
+KDJ_PARAMS = (9, 3, 3)
+ATR_PERIOD = 14
+
+def _as_panel(values) -> Tuple[np.ndarray, bool]:
+    """转为以时间为第 0 维的二维浮点数组，并记录输入是否为一维"""
+    array = np.asarray(values, dtype=float)
+    if array.ndim == 1:
+        return array[:, None], True
+    return array, False
+
+def _restore(result: np.ndarray, flat: bool) -> np.ndarray:
+    return result[:, 0] if flat else result
+
+def forward_fill(panel: np.ndarray) -> np.ndarray:
+    """沿时间轴向前填充 NaN，首个有效值之前保持 NaN"""
+    index = np.where(np.isnan(panel), 0, np.arange(len(panel))[:, None])
+    np.maximum.accumulate(index, axis=0, out=index)
+    return panel[index, np.arange(panel.shape[1])]
+
+def sma(values, window: int) -> np.ndarray:
+    """简单移动平均（累计和差分），窗口内有 NaN 时结果为 NaN"""
+    panel, flat = _as_panel(values)
+    valid = ~np.isnan(panel)
+    zeros = np.zeros((1, panel.shape[1]))
+    sums = np.vstack([zeros, np.cumsum(np.where(valid, panel, 0.0), axis=0)])
+    counts = np.vstack([zeros, np.cumsum(valid, axis=0)])
+    result = np.full(panel.shape, np.nan)
+    if len(panel) >= window:
+        full = counts[window:] - counts[:-window] == window
+        result[window - 1:] = np.where(full, (sums[window:] - sums[:-window]) / window, np.nan)
+    return _restore(result, flat)
+
+def ema(values, span: int) -> np.ndarray:
+    """指数移动平均：以首个有效值为初值，与 pandas ewm(span, adjust=False) 一致"""
+    return _recursive(values, 2.0 / (span + 1))
+
+def _recursive(values, alpha: float, initial: Optional[float] = None) -> np.ndarray:
+    """一阶递推 y_t = y_{t-1} + α(x_t - y_{t-1})，逐日对全部列一次更新
+    
+    initial 为空时以各列首个有效值为初值；缺失值沿用上一期结果
+    """
+    panel, flat = _as_panel(values)
+    result = np.full(panel.shape, np.nan)
+    current = np.full(panel.shape[1], np.nan if initial is None else float(initial))
+    started = np.zeros(panel.shape[1], dtype=bool)
+    for t in range(len(panel)):
+        row = panel[t]
+        valid = ~np.isnan(row)
+        if initial is None:
+            current = np.where(valid & ~started, row, current)
+            current = np.where(valid & started, current + alpha * (row - current), current)
+        else:
+            current = np.where(valid, current + alpha * (row - current), current)
+        started |= valid
+        result[t] = np.where(started, current, np.nan)
+    return _restore(result, flat)
+
+def _wilder(values, period: int) -> np.ndarray:
+    """Wilder 平滑：前 period 个有效值取简单平均，之后 y_t = y_{t-1} + (x_t - y_{t-1}) / period"""
+    panel, flat = _as_panel(values)
+    k = panel.shape[1]
+    result = np.full(panel.shape, np.nan)
+    counts = np.zeros(k)
+    current = np.zeros(k)
+    for t in range(len(panel)):
+        row = panel[t]
+        valid = ~np.isnan(row)
+        counts += valid
+        step = np.where(counts <= period, counts, period).clip(1)
+        current = np.where(valid, current + (np.where(valid, row, 0.0) - current) / step, current)
+        result[t] = np.where(counts >= period, current, np.nan)
+    return _restore(result, flat)
+
+def macd(values, fast: int = MACD_PARAMS[0], slow: int = MACD_PARAMS[1],
+         signal: int = MACD_PARAMS[2]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """MACD：返回 DIF（快慢 EMA 之差）、DEA（DIF 的 EMA）与柱值 DIF - DEA"""
+    dif = ema(values, fast) - ema(values, slow)
+    dea = ema(dif, signal)
+    return dif, dea, dif - dea
+
+def rsi(values, period: int = RSI_PERIOD) -> np.ndarray:
+    """Wilder RSI：涨跌幅分别做 Wilder 平滑；首个结果出现在第 period 个涨跌幅处"""
+    panel, flat = _as_panel(values)
+    # 停牌等缺失日之后的首个价格与缺失前的价格比较
+    delta = np.full(panel.shape, np.nan)
+    delta[1:] = panel[1:] - forward_fill(panel)[:-1]
+    gains = _wilder(np.clip(delta, 0.0, None), period)
+    losses = _wilder(np.clip(-delta, 0.0, None), period)
+    total = gains + losses
+    with np.errstate(invalid="ignore", divide="ignore"):
+        result = np.where(total > 0, 100 * gains / total, np.where(np.isnan(total), np.nan, 50.0))
+    return _restore(result, flat)
+
+def bollinger(values, window: int = BOLL_PARAMS[0],
+              width: float = BOLL_PARAMS[1]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """布林带：返回中轨（简单移动平均）、上轨与下轨（中轨 ± width 倍样本标准差）
+    
+    标准差由滚动和与平方和求得，各列先减去首个有效值以减小大数相减的精度损失
+    """
+    panel, flat = _as_panel(values)
+    middle = sma(panel, window)
+    first = np.argmax(~np.isnan(panel), axis=0) if len(panel) else np.zeros(panel.shape[1], dtype=int)
+    shifted = panel - panel[first, np.arange(panel.shape[1])] if len(panel) else panel
+    mean = sma(shifted, window)
+    variance = (sma(shifted * shifted, window) - mean * mean) * window / max(window - 1, 1)
+    std = np.sqrt(np.clip(variance, 0.0, None))
+    return _restore(middle, flat), _restore(middle + width * std, flat), _restore(middle - width * std, flat)
+
+def _rolling_extreme(panel: np.ndarray, window: int, high: bool) -> np.ndarray:
+    """滚动最高价或最低价（忽略缺失值），窗口不足时取已有数据；逐个滞后期比较，内存与输入同阶"""
+    combine = np.fmax if high else np.fmin
+    result = panel.copy()
+    for lag in range(1, min(window, len(panel))):
+        result[lag:] = combine(result[lag:], panel[:-lag])
+    return result
+
+def kdj(high, low, close, n: int = KDJ_PARAMS[0], m1: int = KDJ_PARAMS[1],
+        m2: int = KDJ_PARAMS[2]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """KDJ：RSV 为收盘价在 n 日高低区间中的位置，K、D 以 50 为初值按 1/m1、1/m2 平滑，J = 3K - 2D"""
+    high, flat = _as_panel(high)
+    low, _ = _as_panel(low)
+    close, _ = _as_panel(close)
+    highest = _rolling_extreme(high, n, True)
+    lowest = _rolling_extreme(low, n, False)
+    spread = highest - lowest
+    with np.errstate(invalid="ignore", divide="ignore"):
+        rsv = np.where(spread > 0, (close - lowest) / spread * 100, np.where(np.isnan(close), np.nan, 50.0))
+    k = _recursive(rsv, 1.0 / m1, 50.0)
+    d = _recursive(k, 1.0 / m2, 50.0)
+    return _restore(k, flat), _restore(d, flat), _restore(3 * k - 2 * d, flat)
+
+def atr(high, low, close, period: int = ATR_PERIOD) -> np.ndarray:
+    """平均真实波幅：真实波幅取 高-低、|高-昨收|、|低-昨收| 的最大值，再做 Wilder 平滑"""
+    high, flat = _as_panel(high)
+    low, _ = _as_panel(low)
+    close, _ = _as_panel(close)
+    previous = np.vstack([np.full((1, close.shape[1]), np.nan), forward_fill(close)[:-1]])
+    true_range = np.fmax(high - low, np.maximum(np.abs(high - previous), np.abs(low - previous)))
+    return _restore(_wilder(true_range, period), flat)
+
+class _Wilder:
+    """单序列 Wilder 平滑的增量状态"""
+
+    def __init__(self, period: int):
+        self.period = period
+        self.count = 0
+        self.value = 0.0
+
+    def update(self, x: float) -> Optional[float]:
+        self.count += 1
+        self.value += (x - self.value) / min(self.count, self.period)
+        return self.value if self.count >= self.period else None
+
+class _Rolling:
+    """定长窗口的增量和与平方和；以首个值为参照点累计，减小大数相减的精度损失"""
+
+    def __init__(self, window: int):
+        self.window = window
+        self.values: deque = deque()
+        self.reference: Optional[float] = None
+        self.sum = 0.0
+        self.squares = 0.0
+
+    def update(self, x: float) -> None:
+        if self.reference is None:
+            self.reference = x
+        shifted = x - self.reference
+        self.values.append(shifted)
+        self.sum += shifted
+        self.squares += shifted * shifted
+        if len(self.values) > self.window:
+            old = self.values.popleft()
+            self.sum -= old
+            self.squares -= old * old
+
+    def mean(self) -> Optional[float]:
+        if len(self.values) < self.window:
+            return None
+        return self.reference + self.sum / self.window
+
+    def std(self) -> Optional[float]:
+        n = len(self.values)
+        if n < self.window or n < 2:
+            return None
+        variance = (self.squares - self.sum * self.sum / n) / (n - 1)
+        return float(np.sqrt(max(variance, 0.0)))
+
+class _Extreme:
+    """单调队列维护的滑动窗口最高价或最低价，每根 K 线均摊 O(1)"""
+
+    def __init__(self, window: int, high: bool):
+        self.window = window
+        self.high = high
+        self.index = 0
+        self.queue: deque = deque()
+
+    def update(self, x: float) -> float:
+        while self.queue and (self.queue[-1][1] <= x if self.high else self.queue[-1][1] >= x):
+            self.queue.pop()
+        self.queue.append((self.index, x))
+        if self.queue[0][0] <= self.index - self.window:
+            self.queue.popleft()
+        self.index += 1
+        return self.queue[0][1]
+
+class IndicatorState:
+    """单个代码的增量指标状态：每根新 K 线以 O(1) 更新全部指标，结果与批量计算一致"""
+
+    def __init__(self, ma_windows: Tuple[int, ...] = MA_WINDOWS, macd_params: Tuple[int, int, int] = MACD_PARAMS,
+                 rsi_period: int = RSI_PERIOD, boll_params: Tuple[int, float] = BOLL_PARAMS,
+                 kdj_params: Tuple[int, int, int] = KDJ_PARAMS, atr_period: int = ATR_PERIOD):
+        self.ma = {window: _Rolling(window) for window in ma_windows}
+        self.macd_params = macd_params
+        self.ema = {span: None for span in macd_params[:2]}
+        self.dea: Optional[float] = None
+        self.gains = _Wilder(rsi_period)
+        self.losses = _Wilder(rsi_period)
+        self.boll_width = boll_params[1]
+        self.boll = self.ma.get(boll_params[0]) or _Rolling(boll_params[0])
+        self.kdj_params = kdj_params
+        self.highest = _Extreme(kdj_params[0], True)
+        self.lowest = _Extreme(kdj_params[0], False)
+        self.k = 50.0
+        self.d = 50.0
+        self.true_range = _Wilder(atr_period)
+        self.last_close: Optional[float] = None
+
+    def update(self, high: float, low: float, close: float) -> Dict[str, Optional[float]]:
+        """追加一根 K 线并返回最新指标值，尚未就绪的指标为 None"""
+        result: Dict[str, Optional[float]] = {}
+        for window, rolling in self.ma.items():
+            rolling.update(close)
+            result[f"MA{window}"] = rolling.mean()
+        if self.boll.window not in self.ma:
+            self.boll.update(close)
+        
+        # EMA 与 MACD
+        for span in self.ema:
+            previous = self.ema[span]
+            self.ema[span] = close if previous is None else previous + 2.0 / (span + 1) * (close - previous)
+        fast, slow, signal = self.macd_params
+        dif = self.ema[fast] - self.ema[slow]
+        self.dea = dif if self.dea is None else self.dea + 2.0 / (signal + 1) * (dif - self.dea)
+        result.update({f"EMA{fast}": self.ema[fast], f"EMA{slow}": self.ema[slow],
+                       "DIF": dif, "DEA": self.dea, "MACD": dif - self.dea})
+        
+        # RSI 与 ATR 需要前一日收盘价
+        if self.last_close is None:
+            result["RSI"] = None
+            true_range = high - low
+        else:
+            delta = close - self.last_close
+            gain = self.gains.update(max(delta, 0.0))
+            loss = self.losses.update(max(-delta, 0.0))
+            if gain is None:
+                result["RSI"] = None
+            else:
+                result["RSI"] = 100 * gain / (gain + loss) if gain + loss > 0 else 50.0
+            true_range = max(high - low, abs(high - self.last_close), abs(low - self.last_close))
+        result["ATR"] = self.true_range.update(true_range)
+        self.last_close = close
+        
+        # 布林带
+        middle, std = self.boll.mean(), self.boll.std()
+        result["BOLL_MID"] = middle
+        result["BOLL_UPPER"] = middle + self.boll_width * std if middle is not None and std is not None else None
+        result["BOLL_LOWER"] = middle - self.boll_width * std if middle is not None and std is not None else None
+        
+        # KDJ
+        _, m1, m2 = self.kdj_params
+        highest = self.highest.update(high)
+        lowest = self.lowest.update(low)
+        rsv = (close - lowest) / (highest - lowest) * 100 if highest > lowest else 50.0
+        self.k += (rsv - self.k) / m1
+        self.d += (self.k - self.d) / m2
+        result.update({"K": self.k, "D": self.d, "J": 3 * self.k - 2 * self.d})
+        return result
+
+class StreamingIndicators:
+    """多代码的增量技术指标：按代码保存状态，逐根 K 线推送即得最新指标"""
+
+    def __init__(self, **params):
+        self.params = params
+        self.states: Dict[str, IndicatorState] = {}
+
+    def update(self, symbol: str, high: float, low: float, close: float) -> Dict[str, Optional[float]]:
+        """推送某代码的一根新 K 线"""
+        state = self.states.get(symbol)
+        if state is None:
+            state = self.states[symbol] = IndicatorState(**self.params)
+        return state.update(high, low, close)
+
+    def warm_up(self, symbol: str, highs: List[float], lows: List[float], closes: List[float]) -> Dict[str, Optional[float]]:
+        """用历史 K 线（按时间升序）初始化某代码的状态，返回最后一根 K 线的指标"""
+        self.states[symbol] = IndicatorState(**self.params)
+        result: Dict[str, Optional[float]] = {}
+        for high, low, close in zip(highs, lows, closes):
+            result = self.states[symbol].update(high, low, close)
+        return result
\ No newline at end of file
@@ -0,0 +1,149 @@
+from typing import Callable, List, Dict, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import time
+import pandas as pd
+from database import DatabaseService, BAR_COLUMNS
+from tushare_service import TushareService
+
+def shift_date(date: str, days: int) -> str:
+    """将 YYYYMMDD 格式的日期平移若干自然日"""
+    return (datetime.strptime(date, '%Y%m%d') + timedelta(days=days)).strftime('%Y%m%d')
+
+class MarketDataStore:
+    """本地日线行情库：增量同步 Tushare 日线并提供按日期对齐的价格面板"""
+    
+    def __init__(self, db_service: DatabaseService, tushare_service: Optional[TushareService] = None,
+                 recheck_interval: int = 1800):
+        self.db_service = db_service
+        self.tushare_service = tushare_service
+        # 只差当天（尚未发布）的日线时，距上次检查不足该秒数则不再请求
+        self.recheck_interval = recheck_interval
+    
+    def _checked_recently(self, checked_at: Optional[str]) -> bool:
+        """同步区间是否在 recheck_interval 秒内检查过（checked_at 为 UTC 时间）"""
+        if not checked_at:
+            return False
+        checked = datetime.strptime(checked_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+        return (datetime.now(timezone.utc) - checked).total_seconds() < self.recheck_interval
+    
+    def sync_daily_bars(self, ts_codes: List[str], start_date: str, end_date: Optional[str] = None,
+                        index: bool = False) -> int:
+        """增量同步日线数据：只请求已同步区间之外的部分，向前补齐更早的历史、向后追加新的交易日；
+        index 为 True 时同步指数日线。请求失败时不更新已同步区间，下次调用会重新请求
+        """
+        if self.tushare_service is None:
+            return 0
+        now = datetime.now()
+        today = now.strftime('%Y%m%d')
+        if end_date is None:
+            end_date = today
+        # 已确定发布完毕的最近一天：周末不开市，工作日当天的日线可能尚未发布
+        published = today if now.weekday() >= 5 else shift_date(today, -1)
+        
+        coverage = self.db_service.get_bar_coverage(ts_codes)
+        saved = 0
+        synced = []
+        for ts_code in ts_codes:
+            first, last, checked_at = coverage.get(ts_code, (None, None, None))
+            if first is None:
+                ranges = [(start_date, end_date)]
+                covered_end = end_date
+            else:
+                ranges = []
+                covered_end = last
+                if start_date < first:
+                    ranges.append((start_date, shift_date(first, -1)))
+                # 只差当天的日线且刚检查过时不再请求，避免行情发布前每次调用都访问网络
+                if end_date > last and not (last >= published and self._checked_recently(checked_at)):
+                    ranges.append((shift_date(last, 1), end_date))
+                    covered_end = end_date
+            if not ranges:
+                continue
+            
+            latest = last or ""
+            failed = False
+            for fetch_start, fetch_end in ranges:
+                if index:
+                    df = self.tushare_service.get_index_data(ts_code, fetch_start, fetch_end)
+                else:
+                    df = self.tushare_service.get_daily_data(ts_code, fetch_start, fetch_end)
+                if df is None:
+                    failed = True
+                    break
+                saved += self.save_bars(df)
+                if not df.empty:
+                    latest = max(latest, str(df['trade_date'].max()))
+            if failed:
+                continue
+            
+            # 同步区间不超过当天；没有取到当天行情时只记到已发布的最近一天，之后再检查
+            if covered_end >= today:
+                covered_end = max(today if latest >= today else published, last or "")
+            synced.append((ts_code, min(start_date, first or start_date), covered_end))
+        self.db_service.save_bar_coverage(synced)
+        return saved
+    
+    def sync_market_bars(self, start_date: str, end_date: Optional[str] = None, calendar: str = "000001.SH",
+                         min_count: int = 1000, interval: float = 0.3,
+                         progress: Optional[Callable[[int, int], None]] = None) -> int:
+        """按交易日同步全市场日线：以指数日线作为交易日历，只请求本地条数不足 min_count 的交易日
+        
+        首次同步需逐日请求约一年的交易日，两次请求至少间隔 interval 秒以免触发 Tushare 的每分钟调用限制；
+        progress(已完成, 总数) 用于报告进度。请求失败的交易日不写入，下次同步时重新请求
+        """
+        if self.tushare_service is None:
+            return 0
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        
+        self.sync_daily_bars([calendar], start_date, end_date, index=True)
+        trade_dates = self.get_price_panel([calendar], start_date, end_date).index
+        counts = self.db_service.get_bar_date_counts(start_date, end_date)
+        missing = [trade_date for trade_date in trade_dates if counts.get(trade_date, 0) < min_count]
+        saved = 0
+        failed = 0
+        last_request = 0.0
+        for done, trade_date in enumerate(missing, 1):
+            wait = last_request + interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            last_request = time.monotonic()
+            snapshot = self.tushare_service.get_daily_snapshot(trade_date)
+            if snapshot is None:
+                failed += 1
+            else:
+                saved += self.save_bars(snapshot)
+            if progress is not None:
+                progress(done, len(missing))
+        if failed:
+            print(f"全市场日线有 {failed} 个交易日同步失败，将在下次同步时重试")
+        return saved
+    
+    def save_bars(self, df: pd.DataFrame) -> int:
+        """将 Tushare 返回的日线 DataFrame 写入本地行情库"""
+        if df is None or df.empty:
+            return 0
+        bars = df.reindex(columns=BAR_COLUMNS)
+        bars = bars.astype(object).where(bars.notna(), None)
+        return self.db_service.save_daily_bars(bars.itertuples(index=False, name=None))
+    
+    def get_price_panel(self, ts_codes: List[str], start_date: str, end_date: str,
+                        field: str = 'close') -> pd.DataFrame:
+        """读取价格面板：行为交易日（升序），列为代码"""
+        rows = self.db_service.get_daily_bars(ts_codes, start_date, end_date, columns=(field,))
+        if not rows:
+            return pd.DataFrame(columns=ts_codes, dtype=float)
+        bars = pd.DataFrame(rows, columns=['ts_code', 'trade_date', field])
+        panel = bars.pivot(index='trade_date', columns='ts_code', values=field)
+        return panel.reindex(columns=ts_codes).sort_index().astype(float)
+    
+    def get_price_panels(self, ts_codes: List[str], start_date: str, end_date: str,
+                         fields: Tuple[str, ...] = ('open', 'close', 'pre_close')) -> Dict[str, pd.DataFrame]:
+        """一次读取多个字段的价格面板，各面板的交易日与代码完全对齐"""
+        rows = self.db_service.get_daily_bars(ts_codes, start_date, end_date, columns=fields)
+        if not rows:
+            return {field: pd.DataFrame(columns=ts_codes, dtype=float) for field in fields}
+        bars = pd.DataFrame(rows, columns=['ts_code', 'trade_date', *fields])
+        panels = bars.pivot(index='trade_date', columns='ts_code', values=list(fields)).sort_index()
+        return {field: panels[field].reindex(columns=ts_codes).astype(float) for field in fields}
+
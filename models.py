@@ -106,4 +106,5 @@ class InvestmentStrategy(BaseModel):
     suitability_score: float
     expected_return: float
     risk_level: str
+    target_weights: Dict[str, float] = Field(default_factory=dict)  # 优化器给出的目标权重（代码 -> 权重）
     created_at: datetime = Field(default_factory=datetime.now) 
\ No newline at end of file
@@ -0,0 +1,224 @@
+from typing import List, Dict, Optional
+import numpy as np
+from risk_model import RiskModel, TRADING_DAYS
+from projection import RISK_FREE_RATE
+
+OBJECTIVES = {
+    "min_variance": "最小方差",
+    "max_sharpe": "最大夏普比率",
+    "risk_parity": "风险平价"
+}
+
+def project_capped_simplex(v: np.ndarray, cap: float = 1.0) -> np.ndarray:
+    """欧氏投影到 {w | 0 ≤ w ≤ cap, Σw = 1}
+    
+    w = clip(v - τ, 0, cap)，f(τ) = Σ max(v - τ, 0) - Σ max(v - cap - τ, 0) 分段线性递减，
+    在全部断点上用排序后的后缀和一次求值，再线性插值得到 τ
+    """
+    n = len(v)
+    upper = np.sort(v)
+    lower = upper - cap
+    upper_tail = np.concatenate([np.cumsum(upper[::-1])[::-1], [0.0]])
+    lower_tail = np.concatenate([np.cumsum(lower[::-1])[::-1], [0.0]])
+
+    def total(tau: np.ndarray) -> np.ndarray:
+        i = np.searchsorted(upper, tau, side="right")
+        j = np.searchsorted(lower, tau, side="right")
+        return (upper_tail[i] - tau * (n - i)) - (lower_tail[j] - tau * (n - j))
+    
+    points = np.sort(np.concatenate([upper, lower]))
+    values = total(points)
+    k = int(np.searchsorted(-values, -1.0, side="left"))
+    if k == 0:
+        tau = points[0]
+    elif k >= len(points):
+        tau = points[-1]
+    else:
+        left, right = values[k - 1], values[k]
+        tau = points[k - 1] + (left - 1.0) * (points[k] - points[k - 1]) / (left - right) if left > right else points[k]
+    return np.clip(v - tau, 0.0, cap)
+
+def solve_qp(Q: np.ndarray, q: np.ndarray, cap: float = 1.0, start: Optional[np.ndarray] = None,
+             max_iter: int = 5000, tol: float = 1e-9) -> np.ndarray:
+    """加速投影梯度法（FISTA）求解 min ½w'Qw - q'w，约束为只做多、权重上限且权重和为 1"""
+    n = len(q)
+    # 步长取 1/L，L 为 Q 的最大特征值（幂迭代估计，略放大以保证收敛）
+    probe = np.ones(n) / np.sqrt(n)
+    for _ in range(30):
+        probe = Q @ probe
+        norm = np.linalg.norm(probe)
+        if norm == 0:
+            break
+        probe /= norm
+    lipschitz = max(float(probe @ Q @ probe) * 1.05, 1e-12)
+    step = 1.0 / lipschitz
+    
+    x = project_capped_simplex(np.ones(n) / n if start is None else start, cap)
+    y = x.copy()
+    t = 1.0
+    for _ in range(max_iter):
+        x_next = project_capped_simplex(y - step * (Q @ y - q), cap)
+        # 自适应重启：动量方向与下降方向相反时重置动量，避免振荡
+        if (y - x_next) @ (x_next - x) > 0:
+            t = 1.0
+        t_next = (1 + np.sqrt(1 + 4 * t * t)) / 2
+        y = x_next + ((t - 1) / t_next) * (x_next - x)
+        if np.abs(x_next - x).max() < tol:
+            x = x_next
+            break
+        x, t = x_next, t_next
+    return x
+
+def min_variance(cov: np.ndarray, cap: float = 1.0) -> np.ndarray:
+    """最小方差组合"""
+    return solve_qp(cov, np.zeros(len(cov)), cap)
+
+def max_sharpe(mu: np.ndarray, cov: np.ndarray, risk_free_rate: float = 0.0, cap: float = 1.0,
+               iterations: int = 40) -> np.ndarray:
+    """最大夏普比率组合：沿有效前沿 min ½w'Σw - γ·μ'w 对 log γ 做黄金分割搜索（夏普比率沿前沿单峰）"""
+    excess = mu - risk_free_rate
+
+    def sharpe(w: np.ndarray) -> float:
+        volatility = np.sqrt(max(float(w @ cov @ w), 1e-18))
+        return float(excess @ w) / volatility
+    
+    cache: Dict[float, np.ndarray] = {}
+
+    def frontier(log_gamma: float, start: Optional[np.ndarray]) -> np.ndarray:
+        if log_gamma not in cache:
+            cache[log_gamma] = solve_qp(cov, (10 ** log_gamma) * mu, cap, start, tol=1e-9)
+        return cache[log_gamma]
+    
+    ratio = (np.sqrt(5) - 1) / 2
+    low, high = -4.0, 3.0
+    a = high - ratio * (high - low)
+    b = low + ratio * (high - low)
+    wa = frontier(a, None)
+    wb = frontier(b, wa)
+    for _ in range(iterations):
+        if sharpe(wa) >= sharpe(wb):
+            high, b, wb = b, a, wa
+            a = high - ratio * (high - low)
+            wa = frontier(a, wb)
+        else:
+            low, a, wa = a, b, wb
+            b = low + ratio * (high - low)
+            wb = frontier(b, wa)
+        if high - low < 1e-3:
+            break
+    
+    # 兼顾前沿两端（最小方差端与收益最高端）
+    candidates = [wa, wb, frontier(-4.0, wa), frontier(3.0, wb)]
+    return max(candidates, key=sharpe)
+
+def risk_parity(cov: np.ndarray, cap: float = 1.0, budgets: Optional[np.ndarray] = None,
+                max_sweeps: int = 200, tol: float = 1e-10) -> np.ndarray:
+    """风险平价组合：循环坐标下降求解 min ½y'Σy - Σ b·ln y，归一化后各资产风险贡献相等
+    
+    超出上限的权重截断为上限，剩余权重按比例分配给其余资产（此时风险贡献不再严格相等）
+    """
+    n = len(cov)
+    budgets = np.ones(n) / n if budgets is None else budgets / budgets.sum()
+    diag = np.diag(cov)
+    y = 1.0 / np.sqrt(np.maximum(diag, 1e-18))
+    y /= y.sum()
+    sigma_y = cov @ y
+    for _ in range(max_sweeps):
+        change = 0.0
+        for i in range(n):
+            # 除去自身后的 (Σy)_i
+            others = sigma_y[i] - diag[i] * y[i]
+            updated = (-others + np.sqrt(others * others + 4 * diag[i] * budgets[i])) / (2 * diag[i])
+            delta = updated - y[i]
+            if delta != 0.0:
+                sigma_y += cov[:, i] * delta
+                y[i] = updated
+                change = max(change, abs(delta) / updated)
+        if change < tol:
+            break
+    return apply_cap(y / y.sum(), cap)
+
+def apply_cap(weights: np.ndarray, cap: float) -> np.ndarray:
+    """将超出上限的权重截断为上限，并把多出的部分按比例分给未触及上限的资产"""
+    weights = weights.copy()
+    capped = np.zeros(len(weights), dtype=bool)
+    while True:
+        over = (weights > cap + 1e-12) & ~capped
+        if not over.any():
+            return weights
+        capped |= over
+        weights[capped] = cap
+        free = ~capped
+        remaining = 1.0 - cap * capped.sum()
+        if remaining <= 0 or weights[free].sum() <= 0:
+            return weights
+        weights[free] *= remaining / weights[free].sum()
+
+class PortfolioOptimizer:
+    """组合优化器：基于风险模型缓存的协方差与历史收益，求解最小方差、最大夏普与风险平价权重"""
+
+    def __init__(self, risk_model: RiskModel, risk_free_rate: float = RISK_FREE_RATE):
+        self.risk_model = risk_model
+        self.risk_free_rate = risk_free_rate
+
+    def optimize(self, holdings: Dict[str, float], universe: Optional[List[str]] = None,
+                 objective: str = "max_sharpe", max_weight: float = 0.2,
+                 expected_returns: Optional[Dict[str, float]] = None, end_date: Optional[str] = None,
+                 method: str = "sample", sync: bool = True) -> Dict:
+        """在当前持仓与候选代码的并集上求解目标权重
+        
+        holdings 为代码到持仓市值的映射；max_weight 为单一资产权重上限（低于 1/n 时放宽为 1/n）；
+        expected_returns 为年化预期收益，缺省使用历史日收益均值年化
+        """
+        ts_codes = list(dict.fromkeys([code for code, value in holdings.items() if value] + list(universe or [])))
+        result = {"objective": objective, "weights": {}, "expected_return": 0.0, "volatility": 0.0,
+                  "sharpe": 0.0, "current": None, "insufficient": {}}
+        if objective not in OBJECTIVES:
+            print(f"不支持的优化目标：{objective}")
+            return result
+        if not ts_codes:
+            return result
+        
+        try:
+            returns = self.risk_model.history(ts_codes, end_date, sync, fill=False)[ts_codes]
+            # 历史行情不足的代码无法可靠估计风险（缺失日按 0 收益计会低估波动），不参与优化
+            insufficient = self.risk_model.insufficient(returns)
+            if insufficient:
+                print(f"以下代码的历史行情不足，未参与优化：{list(insufficient)}")
+                result["insufficient"] = insufficient
+            ts_codes = [code for code in ts_codes if code not in insufficient]
+            if not ts_codes:
+                return result
+            returns = returns[ts_codes].fillna(0.0)
+            
+            cov = self.risk_model.covariance(ts_codes, end_date, method, sync=False).to_numpy()
+            cov = cov + np.eye(len(ts_codes)) * 1e-8 * max(float(np.trace(cov)) / len(ts_codes), 1e-12)
+            if expected_returns is not None:
+                mu = np.array([expected_returns.get(code, 0.0) for code in ts_codes], dtype=float)
+            else:
+                mu = returns[ts_codes].to_numpy().mean(axis=0) * TRADING_DAYS
+            cap = max(max_weight, 1.0 / len(ts_codes))
+            
+            if objective == "min_variance":
+                weights = min_variance(cov, cap)
+            elif objective == "max_sharpe":
+                weights = max_sharpe(mu, cov, self.risk_free_rate, cap)
+            else:
+                weights = risk_parity(cov, cap)
+        except Exception as e:
+            print(f"组合优化失败：{str(e)}")
+            return result
+        
+        result.update(self._statistics(weights, mu, cov))
+        result["weights"] = {code: float(w) for code, w in zip(ts_codes, weights) if w > 1e-6}
+        
+        current = np.array([holdings.get(code, 0.0) for code in ts_codes], dtype=float)
+        if current.sum() > 0:
+            result["current"] = self._statistics(current / current.sum(), mu, cov)
+        return result
+
+    def _statistics(self, weights: np.ndarray, mu: np.ndarray, cov: np.ndarray) -> Dict:
+        expected_return = float(weights @ mu)
+        volatility = float(np.sqrt(max(weights @ cov @ weights, 0.0)))
+        sharpe = (expected_return - self.risk_free_rate) / volatility if volatility > 0 else 0.0
+        return {"expected_return": expected_return, "volatility": volatility, "sharpe": sharpe}
\ No newline at end of file
@@ -0,0 +1,172 @@
+from typing import List, Dict, Optional, Iterable
+from collections import deque
+from database import DatabaseService
+
+# 交易类型
+BUY_TYPES = {"buy", "买入"}
+SELL_TYPES = {"sell", "卖出"}
+
+class PositionState:
+    """单个资产的持仓状态：FIFO批次队列、持仓成本与已实现盈亏"""
+    __slots__ = ("quantity", "cost_basis", "realized_pnl", "lots", "oversold")
+    
+    def __init__(self, quantity: int = 0, cost_basis: float = 0.0, realized_pnl: float = 0.0,
+                 lots: Iterable = ()):
+        self.quantity = quantity
+        self.cost_basis = cost_basis
+        self.realized_pnl = realized_pnl
+        # 每个批次为 [开仓交易ID, 剩余数量, 单位成本]
+        self.lots = deque([list(lot) for lot in lots])
+        # 本次重放中卖出超过持仓而被忽略的数量（不持久化），由持仓引擎汇总提示
+        self.oversold = 0
+    
+    @property
+    def avg_cost(self) -> float:
+        return self.cost_basis / self.quantity if self.quantity > 0 else 0.0
+    
+    def buy(self, txn_id: int, quantity: int, unit_cost: float) -> None:
+        """买入：追加新批次"""
+        self.lots.append([txn_id, quantity, unit_cost])
+        self.quantity += quantity
+        self.cost_basis += quantity * unit_cost
+    
+    def sell(self, quantity: int, unit_proceeds: float) -> float:
+        """卖出：按先进先出消耗批次，返回本次已实现盈亏"""
+        remaining = quantity
+        consumed_cost = 0.0
+        while remaining > 0 and self.lots:
+            lot = self.lots[0]
+            matched = min(remaining, lot[1])
+            consumed_cost += matched * lot[2]
+            lot[1] -= matched
+            remaining -= matched
+            if lot[1] == 0:
+                self.lots.popleft()
+        self.oversold += remaining
+        
+        matched_quantity = quantity - remaining
+        realized = matched_quantity * unit_proceeds - consumed_cost
+        self.quantity -= matched_quantity
+        self.cost_basis -= consumed_cost
+        self.realized_pnl += realized
+        return realized
+    
+    def apply(self, txn_id: int, transaction_type: str, quantity: int, price: float, amount: float) -> None:
+        """应用一笔交易；成交金额含费用时以金额折算单位价格"""
+        if quantity <= 0:
+            return
+        unit_price = amount / quantity if amount else price
+        if transaction_type in BUY_TYPES:
+            self.buy(txn_id, quantity, unit_price)
+        elif transaction_type in SELL_TYPES:
+            self.sell(quantity, unit_price)
+        else:
+            print(f"未知的交易类型：{transaction_type}")
+    
+    def to_dict(self) -> Dict:
+        return {
+            "quantity": self.quantity,
+            "cost_basis": self.cost_basis,
+            "realized_pnl": self.realized_pnl,
+            "lots": [tuple(lot) for lot in self.lots]
+        }
+
+class PositionEngine:
+    """持仓引擎：将交易流水重放为物化持仓，新交易到达时只增量应用检查点之后的流水"""
+    
+    def __init__(self, db_service: DatabaseService):
+        self.db_service = db_service
+    
+    def record_transaction(self, user_id: int, asset_id: int, transaction_type: str,
+                           quantity: int, price: float, amount: Optional[float] = None) -> Optional[int]:
+        """记录交易并增量更新持仓"""
+        try:
+            if amount is None:
+                amount = quantity * price
+            txn_id = self.db_service.add_transaction(user_id, asset_id, transaction_type, quantity, price, amount)
+            self.refresh(user_id)
+            return txn_id
+        except Exception as e:
+            print(f"记录交易失败：{str(e)}")
+            return None
+    
+    @staticmethod
+    def _warn_oversold(states: Dict[int, PositionState]) -> None:
+        """每个资产汇总输出一条超卖提示"""
+        for asset_id, state in states.items():
+            if state.oversold > 0:
+                print(f"资产 {asset_id} 卖出数量超过持仓，已忽略超出部分共 {state.oversold}")
+    
+    def refresh(self, user_id: int, retries: int = 3) -> int:
+        """应用检查点之后的新交易，只读写受影响资产的持仓，返回应用的交易笔数
+        
+        写回时核对检查点未被并发的刷新推进，否则从新的检查点重新应用，同一笔交易不会被重复计入
+        """
+        for _ in range(retries):
+            checkpoint = self.db_service.get_position_checkpoint(user_id)
+            transactions = list(self.db_service.iter_transactions(user_id, after_id=checkpoint))
+            if not transactions:
+                return 0
+            
+            asset_ids = {txn[1] for txn in transactions}
+            states = {
+                asset_id: PositionState(**state)
+                for asset_id, state in self.db_service.load_position_state(user_id, asset_ids).items()
+            }
+            for txn_id, asset_id, transaction_type, quantity, price, amount in transactions:
+                if asset_id not in states:
+                    states[asset_id] = PositionState()
+                states[asset_id].apply(txn_id, transaction_type, quantity, price, amount)
+            
+            if self.db_service.save_position_state(
+                user_id,
+                {asset_id: state.to_dict() for asset_id, state in states.items()},
+                transactions[-1][0],
+                expected_checkpoint=checkpoint
+            ):
+                self._warn_oversold(states)
+                return len(transactions)
+        print(f"刷新持仓失败：用户 {user_id} 的持仓检查点持续被并发修改或写入失败")
+        return 0
+    
+    def rebuild(self, user_id: int) -> int:
+        """从头流式重放全部交易并整体替换物化持仓，返回重放的交易笔数"""
+        states: Dict[int, PositionState] = {}
+        last_txn_id = 0
+        count = 0
+        for txn_id, asset_id, transaction_type, quantity, price, amount in self.db_service.iter_transactions(user_id):
+            state = states.get(asset_id)
+            if state is None:
+                state = states[asset_id] = PositionState()
+            state.apply(txn_id, transaction_type, quantity, price, amount)
+            last_txn_id = txn_id
+            count += 1
+        
+        self.db_service.save_position_state(
+            user_id,
+            {asset_id: state.to_dict() for asset_id, state in states.items()},
+            last_txn_id,
+            replace_all=True
+        )
+        self._warn_oversold(states)
+        return count
+    
+    def get_positions(self, user_id: int, prices: Optional[Dict[int, float]] = None,
+                      include_closed: bool = False) -> List[Dict]:
+        """获取持仓及盈亏；prices 按资产ID提供最新价，缺省使用资产表中的当前价"""
+        self.refresh(user_id)
+        prices = prices or {}
+        positions = []
+        for position in self.db_service.get_positions(user_id):
+            if position["quantity"] <= 0 and not include_closed:
+                continue
+            price = prices.get(position["asset_id"], position["current_price"] or 0.0)
+            market_value = position["quantity"] * price
+            position["current_price"] = price
+            position["market_value"] = market_value
+            position["unrealized_pnl"] = market_value - position["cost_basis"]
+            position["unrealized_pnl_rate"] = (
+                position["unrealized_pnl"] / position["cost_basis"] * 100 if position["cost_basis"] > 0 else 0.0
+            )
+            positions.append(position)
+        return positions
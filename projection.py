@@ -0,0 +1,144 @@
+from typing import Dict, Optional, Tuple
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from market_store import MarketDataStore
+
+# 不同风险承受能力下权益类资产的配置比例，其余部分按无风险利率计息
+RISK_EQUITY_SHARE = {
+    "保守": 0.2,
+    "稳健": 0.5,
+    "激进": 0.9
+}
+RISK_FREE_RATE = 0.025
+# 指数历史不足时使用的年化收益率与波动率
+DEFAULT_INDEX_RETURN = 0.06
+DEFAULT_INDEX_VOLATILITY = 0.22
+# 估计参数所需的最少月数
+MIN_HISTORY_MONTHS = 24
+
+def scenario_grid(initial_capital: float, annual_returns: np.ndarray, horizons: np.ndarray,
+                  monthly_investments: np.ndarray) -> Dict[str, np.ndarray]:
+    """投资计划情景网格：对 年化收益率(%) × 投资月数 × 每月追加 的笛卡尔积用闭式解一次计算
+
+    返回 future_value、total_investment、total_profit、annualized_return(%)，形状均为
+    (收益率个数, 月数个数, 追加金额个数)；收益率为 0 时年金系数取月数，不做除法
+    """
+    rates = np.asarray(annual_returns, dtype=float).reshape(-1, 1, 1) / 12 / 100
+    months = np.asarray(horizons, dtype=float).reshape(1, -1, 1)
+    contributions = np.asarray(monthly_investments, dtype=float).reshape(1, 1, -1)
+
+    growth = (1 + rates) ** months
+    annuity = np.divide(growth - 1, rates, out=np.broadcast_to(months, growth.shape).copy(), where=rates != 0)
+    future_value = initial_capital * growth + contributions * annuity
+    total_investment = np.broadcast_to(initial_capital + contributions * months, future_value.shape)
+
+    valid = (total_investment > 0) & (months > 0)
+    ratio = np.divide(future_value, total_investment, out=np.ones_like(future_value), where=valid)
+    exponent = np.divide(12, months, out=np.zeros_like(months), where=months > 0)
+    annualized_return = np.where(valid, ratio ** exponent - 1, 0.0) * 100
+    return {
+        "future_value": future_value,
+        "total_investment": total_investment,
+        "total_profit": future_value - total_investment,
+        "annualized_return": annualized_return
+    }
+
+class MonteCarloProjection:
+    """投资计划蒙特卡洛模拟：以基准指数的历史月度收益估计参数，整批路径一次性向量化计算"""
+
+    def __init__(self, market_store: Optional[MarketDataStore] = None, benchmark: str = "000300.SH",
+                 history_years: int = 10, seed: Optional[int] = None):
+        self.market_store = market_store
+        self.benchmark = benchmark
+        self.history_years = history_years
+        # 固定种子时模拟结果可复现
+        self.seed = seed
+        self._index_parameters: Dict[str, Tuple[float, float]] = {}
+
+    @staticmethod
+    def monthly_parameters(closes: pd.Series) -> Optional[Tuple[float, float]]:
+        """由按交易日升序的收盘价计算月度对数收益的均值与标准差"""
+        closes = closes.dropna()
+        if closes.empty:
+            return None
+        month_end = closes.groupby(closes.index.str[:6]).last()
+        log_returns = np.diff(np.log(month_end.to_numpy()))
+        if len(log_returns) < MIN_HISTORY_MONTHS:
+            return None
+        return float(log_returns.mean()), float(log_returns.std(ddof=1))
+
+    def index_parameters(self, end_date: Optional[str] = None, sync: bool = True) -> Tuple[float, float]:
+        """基准指数的月度对数收益均值与标准差（按月缓存），无足够历史时使用默认值"""
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        if end_date[:6] in self._index_parameters:
+            return self._index_parameters[end_date[:6]]
+        
+        parameters = None
+        if self.market_store is not None:
+            try:
+                start_date = (datetime.strptime(end_date, '%Y%m%d')
+                              - timedelta(days=365 * self.history_years)).strftime('%Y%m%d')
+                if sync:
+                    self.market_store.sync_daily_bars([self.benchmark], start_date, end_date, index=True)
+                panel = self.market_store.get_price_panel([self.benchmark], start_date, end_date)
+                parameters = self.monthly_parameters(panel[self.benchmark])
+            except Exception as e:
+                print(f"估计指数收益参数失败：{str(e)}")
+        if parameters is None:
+            return float(np.log1p(DEFAULT_INDEX_RETURN) / 12), float(DEFAULT_INDEX_VOLATILITY / np.sqrt(12))
+        
+        self._index_parameters[end_date[:6]] = parameters
+        return parameters
+
+    def estimate_parameters(self, risk_tolerance: str, end_date: Optional[str] = None,
+                            sync: bool = True) -> Tuple[float, float]:
+        """按风险承受能力混合指数与无风险资产，返回组合月度对数收益的均值与标准差"""
+        share = RISK_EQUITY_SHARE.get(risk_tolerance, 0.5)
+        index_mu, index_sigma = self.index_parameters(end_date, sync)
+        risk_free_mu = np.log1p(RISK_FREE_RATE) / 12
+        return float(share * index_mu + (1 - share) * risk_free_mu), float(share * index_sigma)
+
+    def simulate(self, initial_capital: float, monthly_investment: float, months: int,
+                 mu: float, sigma: float, n_paths: int = 10000) -> np.ndarray:
+        """模拟资产价值路径，返回 (路径数, 月数 + 1) 的数组，第 0 列为初始资金
+        
+        每月末先计收益再追加投资：V_t = G_t · (V_0 + c · Σ_{s≤t} 1 / G_s)，G 为累计增长倍数
+        """
+        rng = np.random.default_rng(self.seed)
+        growth = rng.normal(mu, sigma, (n_paths, months))
+        np.cumsum(growth, axis=1, out=growth)
+        np.exp(growth, out=growth)
+        
+        contributions = np.reciprocal(growth)
+        np.cumsum(contributions, axis=1, out=contributions)
+        contributions *= monthly_investment
+        contributions += initial_capital
+        contributions *= growth
+        
+        values = np.empty((n_paths, months + 1))
+        values[:, 0] = initial_capital
+        values[:, 1:] = contributions
+        return values
+
+    def project(self, initial_capital: float, monthly_investment: float, months: int, risk_tolerance: str,
+                n_paths: int = 10000, percentiles: Tuple[int, ...] = (5, 25, 50, 75, 95)) -> Dict:
+        """模拟投资计划，返回各月的分位数区间、期末分布及亏损概率"""
+        mu, sigma = self.estimate_parameters(risk_tolerance)
+        values = self.simulate(initial_capital, monthly_investment, months, mu, sigma, n_paths)
+        bands = np.percentile(values, percentiles, axis=0)
+        total_investment = initial_capital + monthly_investment * months
+        final_values = values[:, -1]
+        return {
+            "monthly_mean": mu,
+            "monthly_volatility": sigma,
+            "annual_return": float(np.expm1(mu * 12)),
+            "annual_volatility": float(sigma * np.sqrt(12)),
+            "percentiles": list(percentiles),
+            "bands": {p: band for p, band in zip(percentiles, bands)},
+            "final": {p: float(band[-1]) for p, band in zip(percentiles, bands)},
+            "expected_value": float(final_values.mean()),
+            "total_investment": total_investment,
+            "loss_probability": float((final_values < total_investment).mean())
+        }
\ No newline at end of file
@@ -0,0 +1,216 @@
+from typing import List, Dict, Optional
+import numpy as np
+from database import DatabaseService
+
+# A 股交易费用：佣金双向收取且单笔不低于最低收费，印花税仅卖出收取，过户费双向收取
+COMMISSION_RATE = 0.00025
+MIN_COMMISSION = 5.0
+STAMP_DUTY_RATE = 0.0005
+TRANSFER_FEE_RATE = 0.00001
+# 每手股数：买入须为整手，不足一手的零股只能一次性卖出
+LOT_SIZE = 100
+
+def group_prefix(groups: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """按已排序的分组计算组内前缀和（不含自身）"""
+    totals = np.cumsum(values) - values
+    if len(groups) == 0:
+        return totals
+    starts = np.r_[True, groups[1:] != groups[:-1]]
+    # 每行所在分组起点的下标
+    offsets = np.maximum.accumulate(np.where(starts, np.arange(len(groups)), 0))
+    return totals - totals[offsets]
+
+class Rebalancer:
+    """调仓引擎：按目标权重与实时报价生成整手买卖指令并计入交易费用，多个组合在一次向量化计算中完成"""
+
+    def __init__(self, db_service: DatabaseService, commission_rate: float = COMMISSION_RATE,
+                 min_commission: float = MIN_COMMISSION, stamp_duty_rate: float = STAMP_DUTY_RATE,
+                 transfer_fee_rate: float = TRANSFER_FEE_RATE, lot_size: int = LOT_SIZE):
+        self.db_service = db_service
+        self.commission_rate = commission_rate
+        self.min_commission = min_commission
+        self.stamp_duty_rate = stamp_duty_rate
+        self.transfer_fee_rate = transfer_fee_rate
+        self.lot_size = lot_size
+
+    def fees(self, amounts: np.ndarray, sell: np.ndarray) -> Dict[str, np.ndarray]:
+        """按成交金额计算佣金、印花税与过户费（精确到分），金额为 0 的指令不收费"""
+        amounts = np.asarray(amounts, dtype=float)
+        commission = np.where(amounts > 0, np.maximum(amounts * self.commission_rate, self.min_commission), 0.0)
+        stamp_duty = np.where(sell, amounts * self.stamp_duty_rate, 0.0)
+        transfer_fee = amounts * self.transfer_fee_rate
+        commission, stamp_duty, transfer_fee = (np.round(x, 2) for x in (commission, stamp_duty, transfer_fee))
+        return {
+            "commission": commission,
+            "stamp_duty": stamp_duty,
+            "transfer_fee": transfer_fee,
+            "fee": commission + stamp_duty + transfer_fee
+        }
+
+    def _buy_cost(self, shares: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        """买入所需资金（成交金额加费用）"""
+        amounts = shares * prices
+        return amounts + self.fees(amounts, np.zeros(np.shape(amounts), dtype=bool))["fee"]
+
+    def rebalance(self, portfolio_id: int, target_weights: Dict[str, float],
+                  quotes: Optional[Dict[str, float]] = None, cash: float = 0.0) -> Dict:
+        """调仓单个投资组合，参数含义同 rebalance_book"""
+        return self.rebalance_book({portfolio_id: target_weights}, quotes, {portfolio_id: cash})[portfolio_id]
+
+    def rebalance_book(self, targets: Dict[int, Dict[str, float]], quotes: Optional[Dict[str, float]] = None,
+                       cash: Optional[Dict[int, float]] = None) -> Dict[int, Dict]:
+        """批量调仓：一次查询读取全部组合的持仓，返回各组合的指令与调仓结果
+        
+        targets 为组合到目标权重（代码到占总资产比例）的映射，未列出的持仓视为清仓，权重之和不足 1 的部分保留为现金；
+        quotes 为代码到最新价的映射，缺省时使用资产表中的现价；cash 为各组合可用现金
+        """
+        holdings = self.db_service.get_portfolio_holdings(targets.keys())
+        return self.plan(holdings, targets, quotes or {}, cash or {})
+
+    def plan(self, holdings: Dict[str, List], targets: Dict[int, Dict[str, float]],
+             quotes: Dict[str, float], cash: Dict[int, float]) -> Dict[int, Dict]:
+        """由列式持仓（get_portfolio_holdings 的返回格式）计算调仓指令
+        
+        先按四舍五入到整手的交易量卖出，再买入整数手，剩余不足一手的部分按余数从大到小
+        逐手补足，仅在现金足够且能降低权重偏离（含现金）时追加
+        """
+        portfolio_ids = list(targets)
+        position = {portfolio_id: p for p, portfolio_id in enumerate(portfolio_ids)}
+        rows: Dict[tuple, int] = {}
+        groups, symbols, quantities, fallback, weights = [], [], [], [], []
+
+        def row(portfolio_id: int, symbol: str) -> int:
+            key = (portfolio_id, symbol)
+            if key not in rows:
+                rows[key] = len(symbols)
+                groups.append(position[portfolio_id])
+                symbols.append(symbol)
+                quantities.append(0.0)
+                fallback.append(np.nan)
+                weights.append(0.0)
+            return rows[key]
+        
+        for portfolio_id, symbol, quantity, price in zip(holdings["portfolio_id"], holdings["symbol"],
+                                                         holdings["quantity"], holdings["current_price"]):
+            if portfolio_id not in position:
+                continue
+            i = row(portfolio_id, symbol)
+            quantities[i] += quantity or 0.0
+            if price:
+                fallback[i] = price
+        for portfolio_id, target in targets.items():
+            for symbol, weight in target.items():
+                weights[row(portfolio_id, symbol)] = max(float(weight), 0.0)
+        
+        n = len(portfolio_ids)
+        lot = self.lot_size
+        groups = np.array(groups, dtype=int)
+        q0 = np.array(quantities, dtype=float)
+        w = np.array(weights, dtype=float)
+        prices = np.array([quotes.get(symbol, price) for symbol, price in zip(symbols, fallback)], dtype=float)
+        tradable = np.isfinite(prices) & (prices > 0)
+        missing = sorted({symbols[i] for i in np.flatnonzero(~tradable & ((w > 0) | (q0 > 0)))})
+        if missing:
+            print(f"以下代码缺少报价，未生成调仓指令：{missing}")
+        prices = np.where(tradable, prices, 0.0)
+        
+        # 权重之和超过 1 时按比例缩放
+        weight_sums = np.bincount(groups, weights=w, minlength=n)
+        w = w / np.maximum(weight_sums, 1.0)[groups]
+        cash_before = np.array([float(cash.get(portfolio_id, 0.0)) for portfolio_id in portfolio_ids])
+        equity = np.bincount(groups, weights=q0 * prices, minlength=n) + cash_before
+        target_cash = equity * (1 - np.minimum(weight_sums, 1.0))
+        
+        # 以手为单位的目标交易量；无报价的代码不交易
+        target_shares = np.divide(w * equity[groups], prices, out=q0.copy(), where=tradable)
+        lots = (target_shares - q0) / lot
+        
+        # 卖出：四舍五入到整手，目标权重为 0 时连同零股全部卖出
+        sell_lots = np.where(lots < 0, np.floor(-lots + 0.5), 0.0)
+        sold = np.minimum(sell_lots * lot, q0)
+        sold = np.where(tradable & (w == 0), q0, sold)
+        sell_amounts = sold * prices
+        sell_fees = self.fees(sell_amounts, np.ones(len(sold), dtype=bool))
+        available = cash_before + np.bincount(groups, weights=sell_amounts - sell_fees["fee"], minlength=n)
+        
+        # 买入：先取整数手，余数留待补足
+        buy_lots = np.where(lots > 0, np.floor(lots), 0.0)
+        remainders = np.where(lots > 0, lots - buy_lots, 0.0)
+        remaining = available - np.bincount(groups, weights=self._buy_cost(buy_lots * lot, prices), minlength=n)
+        
+        # 费用使现金不足时，从余数最小的代码起逐手减少买入
+        for p in np.flatnonzero(remaining < 0):
+            candidates = np.flatnonzero((groups == p) & (buy_lots > 0))
+            candidates = candidates[np.argsort(remainders[candidates], kind="stable")]
+            k = 0
+            while remaining[p] < 0 and buy_lots[candidates].sum() > 0:
+                i = candidates[k % len(candidates)]
+                if buy_lots[i] > 0:
+                    before = self._buy_cost(buy_lots[i] * lot, prices[i])
+                    buy_lots[i] -= 1
+                    remaining[p] += before - self._buy_cost(buy_lots[i] * lot, prices[i])
+                k += 1
+        
+        # 余数补足：每个代码至多追加一手，按组内余数从大到小依次判断，首个不满足条件处截止
+        candidates = np.flatnonzero(tradable & (remainders > 0))
+        candidates = candidates[np.lexsort((-remainders[candidates], groups[candidates]))]
+        extra_cost = (self._buy_cost((buy_lots[candidates] + 1) * lot, prices[candidates])
+                      - self._buy_cost(buy_lots[candidates] * lot, prices[candidates]))
+        spent = group_prefix(groups[candidates], extra_cost)
+        g = groups[candidates]
+        # 追加一手使该代码超配 (1 - 余数) 手，仅当剩余超额现金多于超配金额时偏离才会减小
+        overshoot = (1 - remainders[candidates]) * lot * prices[candidates]
+        ok = (spent + extra_cost <= remaining[g]) & (remaining[g] - target_cash[g] - spent > overshoot)
+        failed = (~ok).astype(float)
+        accepted = group_prefix(g, failed) + failed == 0
+        buy_lots[candidates[accepted]] += 1
+        
+        bought = buy_lots * lot
+        buy_amounts = bought * prices
+        buy_fees = self.fees(buy_amounts, np.zeros(len(bought), dtype=bool))
+        q1 = q0 - sold + bought
+        cash_after = (available - np.bincount(groups, weights=buy_amounts + buy_fees["fee"], minlength=n))
+        
+        # 调仓后的权重偏离（含现金）与换手率
+        total_fees = np.bincount(groups, weights=sell_fees["fee"] + buy_fees["fee"], minlength=n)
+        equity_after = np.bincount(groups, weights=q1 * prices, minlength=n) + cash_after
+        scale = np.divide(1.0, equity_after, out=np.zeros(n), where=equity_after > 0)
+        deviation = (np.bincount(groups, weights=(q1 * prices * scale[groups] - w) ** 2, minlength=n)
+                     + (cash_after * scale - target_cash / np.where(equity > 0, equity, 1.0)) ** 2)
+        turnover = np.divide(np.bincount(groups, weights=sell_amounts + buy_amounts, minlength=n), 2 * equity,
+                             out=np.zeros(n), where=equity > 0)
+        
+        results = {}
+        for p, portfolio_id in enumerate(portfolio_ids):
+            results[portfolio_id] = {
+                "orders": [],
+                "positions": {},
+                "total_value": float(equity[p]),
+                "cash_before": float(cash_before[p]),
+                "cash_after": float(cash_after[p]),
+                "total_fees": float(total_fees[p]),
+                "turnover": float(turnover[p]),
+                "tracking_error": float(np.sqrt(deviation[p]))
+            }
+        for i in range(len(symbols)):
+            result = results[portfolio_ids[groups[i]]]
+            if q1[i] > 0:
+                result["positions"][symbols[i]] = float(q1[i])
+            for side, shares, amounts, fees in (("sell", sold, sell_amounts, sell_fees),
+                                                ("buy", bought, buy_amounts, buy_fees)):
+                if shares[i] > 0:
+                    result["orders"].append({
+                        "symbol": symbols[i],
+                        "side": side,
+                        "quantity": float(shares[i]),
+                        "price": float(prices[i]),
+                        "amount": float(amounts[i]),
+                        "commission": float(fees["commission"][i]),
+                        "stamp_duty": float(fees["stamp_duty"][i]),
+                        "transfer_fee": float(fees["transfer_fee"][i]),
+                        "fee": float(fees["fee"][i])
+                    })
+        # 先卖后买，卖出所得用于买入
+        for result in results.values():
+            result["orders"].sort(key=lambda order: order["side"] != "sell")
+        return results
\ No newline at end of file
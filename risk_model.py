@@ -0,0 +1,182 @@
+from typing import List, Dict, Optional, Tuple
+from collections import deque
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from market_store import MarketDataStore
+
+# 年化使用的交易日数
+TRADING_DAYS = 252
+
+class CovarianceState:
+    """一组代码的协方差增量状态：滚动窗口内的收益率、一阶和与叉积和，以及指数加权二阶矩"""
+
+    def __init__(self, ts_codes: Tuple[str, ...], window: int, ewma_lambda: float):
+        self.ts_codes = ts_codes
+        self.window = window
+        self.ewma_lambda = ewma_lambda
+        k = len(ts_codes)
+        self.rows: deque = deque()
+        self.sums = np.zeros(k)
+        self.cross = np.zeros((k, k))
+        self.ewma = np.zeros((k, k))
+        self.ewma_weight = 0.0
+        self.last_date: Optional[str] = None
+
+    def update(self, dates: List[str], returns: np.ndarray) -> None:
+        """追加新交易日的收益率（行按日期升序），移出窗口外的旧数据"""
+        if len(dates) == 0:
+            return
+        self.sums += returns.sum(axis=0)
+        self.cross += returns.T @ returns
+        self.rows.extend(zip(dates, returns))
+        
+        expired = len(self.rows) - self.window
+        if expired > 0:
+            old = np.array([self.rows.popleft()[1] for _ in range(expired)])
+            self.sums -= old.sum(axis=0)
+            self.cross -= old.T @ old
+        
+        # 指数加权：E_t = λE_{t-1} + (1-λ) r_t r_t'，按新数据条数一次性展开
+        decay = self.ewma_lambda ** np.arange(len(dates) - 1, -1, -1)
+        weights = (1 - self.ewma_lambda) * decay
+        scale = self.ewma_lambda ** len(dates)
+        self.ewma = scale * self.ewma + (returns * weights[:, None]).T @ returns
+        self.ewma_weight = scale * self.ewma_weight + weights.sum()
+        self.last_date = dates[-1]
+
+    @property
+    def count(self) -> int:
+        return len(self.rows)
+
+    def covariance(self, method: str = "sample") -> np.ndarray:
+        """日协方差矩阵：sample 为窗口样本协方差，ewma 为零均值指数加权协方差"""
+        k = len(self.ts_codes)
+        if method == "ewma":
+            return self.ewma / self.ewma_weight if self.ewma_weight > 0 else np.zeros((k, k))
+        n = self.count
+        if n < 2:
+            return np.zeros((k, k))
+        return (self.cross - np.outer(self.sums, self.sums) / n) / (n - 1)
+
+class RiskModel:
+    """基于本地日线行情的收益率风险模型：波动率、协方差及组合风险贡献；协方差按代码组合缓存并随新交易日增量更新"""
+
+    def __init__(self, market_store: MarketDataStore, window: int = 250, ewma_lambda: float = 0.94,
+                 min_coverage: float = 0.8):
+        self.market_store = market_store
+        # 样本协方差的滚动窗口（交易日）与指数加权衰减系数（RiskMetrics 日度取 0.94）
+        self.window = window
+        self.ewma_lambda = ewma_lambda
+        # 窗口内有行情的交易日占比低于该值的代码视为历史不足：缺失日按 0 收益计会低估波动与相关性
+        self.min_coverage = min_coverage
+        self._states: Dict[Tuple[str, ...], CovarianceState] = {}
+
+    def get_returns(self, ts_codes: List[str], start_date: str, end_date: str, fill: bool = True) -> pd.DataFrame:
+        """日收益率矩阵：行为交易日，列为代码；以 close / pre_close 计算（自动处理除权）；
+        无行情的交易日（停牌或尚未上市）fill 为真时记为 0，否则保留为缺失
+        """
+        close = self.market_store.get_price_panel(ts_codes, start_date, end_date, field='close')
+        pre_close = self.market_store.get_price_panel(ts_codes, start_date, end_date, field='pre_close')
+        returns = close / pre_close.reindex(index=close.index, columns=close.columns) - 1
+        returns = returns.replace([np.inf, -np.inf], np.nan)
+        return returns.fillna(0.0) if fill else returns
+
+    def history(self, ts_codes: List[str], end_date: Optional[str] = None, sync: bool = True,
+                window: Optional[int] = None, fill: bool = True) -> pd.DataFrame:
+        """截至 end_date 最近 window 个交易日（缺省为模型窗口）的日收益率矩阵；
+        fill 为 False 时无行情的交易日保留为缺失，可交给 insufficient 检查覆盖度
+        """
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        window = window or self.window
+        # 按交易日约占自然日的 2/3 向前多取，保证窗口填满
+        start = datetime.strptime(end_date, '%Y%m%d') - timedelta(days=int(window * 1.6) + 10)
+        start_date = start.strftime('%Y%m%d')
+        if sync:
+            self.market_store.sync_daily_bars(list(ts_codes), start_date, end_date)
+        return self.get_returns(list(ts_codes), start_date, end_date, fill).iloc[-window:]
+
+    def insufficient(self, returns: pd.DataFrame, window: Optional[int] = None) -> Dict[str, int]:
+        """有效收益率不足 min_coverage × window 个交易日的代码及其有效天数，returns 为 history(fill=False) 的结果"""
+        required = self.min_coverage * (window or self.window)
+        return {code: int(count) for code, count in returns.notna().sum().items() if count < required}
+    
+    def _state(self, ts_codes: Tuple[str, ...], end_date: str, sync: bool) -> CovarianceState:
+        """获取截至 end_date 的协方差状态；已缓存时只读取最近一个已知交易日之后的数据"""
+        state = self._states.get(ts_codes)
+        if state is not None and state.last_date >= end_date:
+            if state.last_date == end_date:
+                return state
+            # 回看历史日期：单独计算，不覆盖缓存
+            state = None
+        elif state is not None:
+            start_date = (datetime.strptime(state.last_date, '%Y%m%d') + timedelta(days=1)).strftime('%Y%m%d')
+            if sync:
+                self.market_store.sync_daily_bars(list(ts_codes), start_date, end_date)
+            returns = self.get_returns(list(ts_codes), start_date, end_date)
+            state.update(list(returns.index), returns.to_numpy())
+            return state
+        
+        returns = self.history(list(ts_codes), end_date, sync)
+        fresh = CovarianceState(ts_codes, self.window, self.ewma_lambda)
+        fresh.update(list(returns.index), returns.to_numpy())
+        # 无行情数据时不缓存，避免之后补齐的历史数据被跳过
+        if fresh.last_date is not None and ts_codes not in self._states:
+            self._states[ts_codes] = fresh
+        return fresh
+
+    def covariance(self, ts_codes: List[str], end_date: Optional[str] = None, method: str = "sample",
+                   sync: bool = True) -> pd.DataFrame:
+        """年化协方差矩阵；method 为 sample（滚动窗口样本）或 ewma（指数加权）"""
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        key = tuple(sorted(set(ts_codes)))
+        try:
+            cov = self._state(key, end_date, sync).covariance(method) * TRADING_DAYS
+        except Exception as e:
+            print(f"计算协方差失败：{str(e)}")
+            cov = np.zeros((len(key), len(key)))
+        return pd.DataFrame(cov, index=key, columns=key).loc[list(ts_codes), list(ts_codes)]
+
+    def volatility(self, ts_codes: List[str], end_date: Optional[str] = None, method: str = "sample",
+                   sync: bool = True) -> pd.Series:
+        """各代码的年化波动率"""
+        cov = self.covariance(ts_codes, end_date, method, sync)
+        return pd.Series(np.sqrt(np.clip(np.diag(cov.to_numpy()), 0, None)), index=cov.index)
+
+    def portfolio_risk(self, weights: Dict[str, float], end_date: Optional[str] = None, method: str = "sample",
+                       sync: bool = True) -> Dict:
+        """组合年化波动率及各持仓的边际风险贡献与成分风险贡献
+        
+        weights 为代码到持仓市值（或权重）的映射，内部归一化；成分风险贡献之和等于组合波动率
+        """
+        ts_codes = [code for code, weight in weights.items() if weight]
+        if not ts_codes:
+            return {"volatility": 0.0, "marginal": {}, "component": {}, "percent": {}}
+        
+        w = np.array([weights[code] for code in ts_codes], dtype=float)
+        w = w / w.sum()
+        cov = self.covariance(ts_codes, end_date, method, sync).to_numpy()
+        variance = float(w @ cov @ w)
+        volatility = float(np.sqrt(max(variance, 0.0)))
+        
+        # 边际贡献 ∂σ/∂w = Σw / σ，成分贡献 w_i · ∂σ/∂w_i
+        marginal = cov @ w / volatility if volatility > 0 else np.zeros_like(w)
+        component = w * marginal
+        percent = component / volatility if volatility > 0 else np.zeros_like(w)
+        return {
+            "volatility": volatility,
+            "marginal": dict(zip(ts_codes, marginal.tolist())),
+            "component": dict(zip(ts_codes, component.tolist())),
+            "percent": dict(zip(ts_codes, percent.tolist()))
+        }
+
+    @staticmethod
+    def holding_weights(portfolio: Dict) -> Dict[str, float]:
+        """由 get_portfolios_with_assets 返回的列式资产计算各代码的市值"""
+        weights: Dict[str, float] = {}
+        assets = portfolio['assets']
+        for symbol, quantity, price in zip(assets['symbol'], assets['quantity'], assets['current_price']):
+            weights[symbol] = weights.get(symbol, 0.0) + quantity * price
+        return weights
\ No newline at end of file
@@ -0,0 +1,230 @@
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+import time
+import numpy as np
+import pandas as pd
+from tushare_service import TushareService
+
+# 每日指标（daily_basic）字段
+DAILY_BASIC_FIELDS = {
+    "close": "收盘价",
+    "pe_ttm": "市盈率(TTM)",
+    "pb": "市净率",
+    "ps_ttm": "市销率(TTM)",
+    "dv_ttm": "股息率(TTM,%)",
+    "total_mv": "总市值(万元)",
+    "circ_mv": "流通市值(万元)",
+    "turnover_rate": "换手率(%)"
+}
+# 财务指标（fina_indicator）字段，百分比字段保持接口原值（ROE 为 15 即 15%）
+FINA_FIELDS = {
+    "roe": "净资产收益率(%)",
+    "roa": "总资产收益率(%)",
+    "grossprofit_margin": "销售毛利率(%)",
+    "netprofit_margin": "销售净利率(%)",
+    "debt_to_assets": "资产负债率(%)",
+    "current_ratio": "流动比率",
+    "or_yoy": "营业收入同比增长(%)",
+    "netprofit_yoy": "净利润同比增长(%)"
+}
+FIELDS = {**DAILY_BASIC_FIELDS, **FINA_FIELDS}
+OPERATORS = ("<", "<=", ">", ">=", "between")
+
+def recent_periods(date: str, count: int = 3) -> List[str]:
+    """date 之前已结束的最近 count 个报告期（季末日），按时间倒序"""
+    year, month = int(date[:4]), int(date[4:6])
+    quarter = (month - 1) // 3
+    periods = []
+    for _ in range(count):
+        if quarter == 0:
+            year, quarter = year - 1, 4
+        periods.append(f"{year}{['0331', '0630', '0930', '1231'][quarter - 1]}")
+        quarter -= 1
+    return periods
+
+class StockUniverse:
+    """全市场截面：按代码排序的类型化列，每个数值字段预先建立排序索引（缺失值排在末尾）"""
+
+    def __init__(self, frame: pd.DataFrame, trade_date: str, period: Optional[str] = None):
+        frame = frame.drop_duplicates('ts_code').sort_values('ts_code')
+        self.trade_date = trade_date
+        self.period = period
+        self.ts_codes = frame['ts_code'].to_numpy(dtype=str)
+        self.names = frame.get('name', pd.Series('', index=frame.index)).fillna('').to_numpy(dtype=str)
+        self.industries = pd.Categorical(frame.get('industry', pd.Series(None, index=frame.index)).fillna('未知'))
+        self.columns: Dict[str, np.ndarray] = {}
+        self.order: Dict[str, np.ndarray] = {}
+        self.sorted: Dict[str, np.ndarray] = {}
+        self.valid: Dict[str, int] = {}
+        for field in FIELDS:
+            if field in frame:
+                values = pd.to_numeric(frame[field], errors='coerce').to_numpy(dtype=float, copy=True)
+            else:
+                values = np.full(len(frame), np.nan)
+            values[~np.isfinite(values)] = np.nan
+            order = np.argsort(values, kind='stable')
+            self.columns[field] = values
+            self.order[field] = order
+            self.sorted[field] = values[order]
+            self.valid[field] = int(np.count_nonzero(~np.isnan(values)))
+
+    def __len__(self) -> int:
+        return len(self.ts_codes)
+
+    def range_mask(self, field: str, low: Optional[float] = None, high: Optional[float] = None,
+                   include_low: bool = True, include_high: bool = True) -> np.ndarray:
+        """字段取值落在 [low, high]（开闭由参数决定）内的股票掩码；缺失值不满足任何条件"""
+        values = self.sorted[field][:self.valid[field]]
+        start = 0 if low is None else int(np.searchsorted(values, low, side='left' if include_low else 'right'))
+        end = len(values) if high is None else int(np.searchsorted(values, high, side='right' if include_high else 'left'))
+        mask = np.zeros(len(self), dtype=bool)
+        mask[self.order[field][start:max(start, end)]] = True
+        return mask
+
+    def condition_mask(self, field: str, operator: str, value) -> np.ndarray:
+        """单个条件的掩码，operator 为 <、<=、>、>= 或 between（value 为 (下限, 上限)）"""
+        if field not in self.columns:
+            raise ValueError(f"不支持的筛选字段：{field}")
+        if operator == "<":
+            return self.range_mask(field, high=value, include_high=False)
+        if operator == "<=":
+            return self.range_mask(field, high=value)
+        if operator == ">":
+            return self.range_mask(field, low=value, include_low=False)
+        if operator == ">=":
+            return self.range_mask(field, low=value)
+        if operator == "between":
+            return self.range_mask(field, low=value[0], high=value[1])
+        raise ValueError(f"不支持的比较运算符：{operator}")
+
+    def screen(self, criteria: List[Tuple], sort_by: Optional[str] = None, ascending: bool = True,
+               limit: Optional[int] = 100, industries: Optional[List[str]] = None) -> pd.DataFrame:
+        """按全部条件（且）筛选并排序，criteria 为 (字段, 运算符, 值) 列表；排序字段缺失的股票排在最后"""
+        mask = np.ones(len(self), dtype=bool)
+        for field, operator, value in criteria:
+            mask &= self.condition_mask(field, operator, value)
+        if industries:
+            codes = [self.industries.categories.get_loc(name) for name in industries if name in self.industries.categories]
+            mask &= np.isin(self.industries.codes, codes)
+        
+        if sort_by is None:
+            selected = np.flatnonzero(mask)
+        else:
+            # 沿预先排好的索引取出被选中的股票，无需再次排序
+            order = self.order[sort_by]
+            valid = self.valid[sort_by]
+            ranked = order[:valid] if ascending else order[:valid][::-1]
+            ranked = np.concatenate([ranked, order[valid:]])
+            selected = ranked[mask[ranked]]
+        if limit is not None:
+            selected = selected[:limit]
+        
+        return pd.DataFrame({
+            "ts_code": self.ts_codes[selected],
+            "name": self.names[selected],
+            "industry": self.industries.categories.to_numpy()[self.industries.codes[selected]],
+            **{field: values[selected] for field, values in self.columns.items()}
+        })
+
+class StockScreener:
+    """条件选股：合并最近交易日的每日指标与各股最新一期财务指标，截面按交易日缓存"""
+
+    def __init__(self, tushare_service: TushareService, lookback_days: int = 10, retry_interval: int = 600):
+        self.tushare_service = tushare_service
+        # 向前查找最近交易日的自然日数
+        self.lookback_days = lookback_days
+        # 加载失败后该秒数内不再重新请求（页面每次重绘都会调用）
+        self.retry_interval = retry_interval
+        self._universe: Optional[StockUniverse] = None
+        self._loaded_on: Optional[str] = None
+        self._basic: Optional[pd.DataFrame] = None
+        self._basic_on: Optional[str] = None
+        # 加载失败的日期 -> 失败时刻
+        self._failed: Dict[str, float] = {}
+
+    def _failed_recently(self, key: str) -> bool:
+        failed_at = self._failed.get(key)
+        return failed_at is not None and time.monotonic() - failed_at < self.retry_interval
+
+    def stock_basic(self, date: Optional[str] = None) -> pd.DataFrame:
+        """股票列表（代码、名称、行业），按日缓存；请求失败时在 retry_interval 内返回上次的结果"""
+        if date is None:
+            date = datetime.now().strftime('%Y%m%d')
+        if self._basic is not None and self._basic_on == date:
+            return self._basic
+        if self._failed_recently(f"basic:{date}"):
+            return self._basic if self._basic is not None else pd.DataFrame()
+        
+        basic = self.tushare_service.get_stock_basic()
+        if basic is None or basic.empty:
+            self._failed[f"basic:{date}"] = time.monotonic()
+            return self._basic if self._basic is not None else pd.DataFrame()
+        self._basic, self._basic_on = basic, date
+        return basic
+
+    def load(self, date: Optional[str] = None, refresh: bool = False) -> Optional[StockUniverse]:
+        """获取截至 date 的全市场截面（同一天内重复调用直接返回缓存；失败后 retry_interval 内不重新加载）"""
+        if date is None:
+            date = datetime.now().strftime('%Y%m%d')
+        if not refresh and self._universe is not None and self._loaded_on == date:
+            return self._universe
+        if not refresh and self._failed_recently(date):
+            return self._universe
+        
+        try:
+            basic = self.stock_basic(date)
+            daily_basic, trade_date = pd.DataFrame(), None
+            day = datetime.strptime(date, '%Y%m%d')
+            for offset in range(self.lookback_days):
+                trade_date = (day - timedelta(days=offset)).strftime('%Y%m%d')
+                daily_basic = self.tushare_service.get_market_data(trade_date)
+                if daily_basic is not None and not daily_basic.empty:
+                    break
+            if daily_basic is None or daily_basic.empty:
+                print(f"最近{self.lookback_days}天没有每日指标数据")
+                self._failed[date] = time.monotonic()
+                return self._universe
+            
+            fields = ",".join(["ts_code", "ann_date", "end_date", *FINA_FIELDS])
+            snapshots = [self.tushare_service.get_fina_indicator_snapshot(period, fields)
+                         for period in recent_periods(trade_date)]
+            snapshots = [snapshot for snapshot in snapshots if snapshot is not None and not snapshot.empty]
+            if not snapshots:
+                # 没有 fina_indicator_vip 权限时截面只含每日指标，period 为 None，财务字段全部缺失
+                print("未获取到全市场财务指标，财务类字段不可用于筛选")
+            fina = pd.concat(snapshots) if snapshots else pd.DataFrame()
+            self._universe = self.build(basic, daily_basic, fina, trade_date)
+            self._loaded_on = date
+            self._failed.pop(date, None)
+        except Exception as e:
+            print(f"加载选股数据失败：{str(e)}")
+            self._failed[date] = time.monotonic()
+        return self._universe
+
+    @staticmethod
+    def build(basic: pd.DataFrame, daily_basic: pd.DataFrame, fina: pd.DataFrame, trade_date: str) -> StockUniverse:
+        """合并股票列表、每日指标与财务指标；每只股票取已披露的最新一期财务指标"""
+        frame = daily_basic[['ts_code', *[f for f in DAILY_BASIC_FIELDS if f in daily_basic]]]
+        if basic is not None and not basic.empty:
+            frame = frame.merge(basic[['ts_code', 'name', 'industry']], on='ts_code', how='left')
+        period = None
+        if fina is not None and not fina.empty:
+            fina = fina.sort_values(['end_date', 'ann_date']).drop_duplicates('ts_code', keep='last')
+            period = str(fina['end_date'].max())
+            frame = frame.merge(fina[['ts_code', *[f for f in FINA_FIELDS if f in fina]]], on='ts_code', how='left')
+        return StockUniverse(frame, trade_date, period)
+
+    def industries(self) -> List[str]:
+        """股票列表中的全部行业（行业筛选的可选项），只请求 stock_basic，不加载全市场截面"""
+        basic = self.stock_basic()
+        if 'industry' not in basic:
+            return []
+        return sorted(basic['industry'].dropna().unique())
+
+    def screen(self, criteria: List[Tuple], sort_by: Optional[str] = None, ascending: bool = True,
+               limit: Optional[int] = 100, industries: Optional[List[str]] = None) -> pd.DataFrame:
+        """加载（或复用）当日截面后筛选，参数含义同 StockUniverse.screen"""
+        universe = self.load()
+        if universe is None:
+            return pd.DataFrame(columns=["ts_code", "name", "industry", *FIELDS])
+        return universe.screen(criteria, sort_by, ascending, limit, industries)
\ No newline at end of file
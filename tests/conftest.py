@@ -0,0 +1,50 @@
+import sqlite3
+import pytest
+from database import DatabaseService
+from market_store import MarketDataStore
+
+SYMBOL = "000001.SZ"
+
+class PortfolioFixture:
+    """单一资产投资组合的测试库：行情、交易与创建时间均按交易日写入"""
+    
+    def __init__(self, db_service: DatabaseService, created: str):
+        self.db_service = db_service
+        self.market_store = MarketDataStore(db_service)
+        self.user_id = db_service.create_user("测试用户", "中级")
+        self.portfolio_id = db_service.create_portfolio(self.user_id, "测试组合", "中等", "稳健增长", 0, 0, 0, 0)
+        self.asset_id = db_service.add_asset(self.portfolio_id, SYMBOL, "平安银行", 0, 0, 0, 0, 0, 0)
+        self._execute("UPDATE portfolios SET created_at = ? WHERE id = ?", (self._timestamp(created), self.portfolio_id))
+    
+    @staticmethod
+    def _timestamp(date: str) -> str:
+        return f"{date[:4]}-{date[4:6]}-{date[6:]} 10:00:00"
+    
+    def _execute(self, sql: str, params: tuple) -> None:
+        with sqlite3.connect(self.db_service.db_path) as conn:
+            conn.execute(sql, params)
+    
+    def bars(self, closes: dict, ts_code: str = SYMBOL) -> None:
+        """写入日线收盘价 {交易日: 收盘价}"""
+        self.db_service.save_daily_bars(
+            (ts_code, date, close, close, close, close, close, 0, 0) for date, close in closes.items()
+        )
+    
+    def trade(self, date: str, transaction_type: str, quantity: int, price: float) -> None:
+        txn_id = self.db_service.add_transaction(self.user_id, self.asset_id, transaction_type, quantity, price,
+                                                 quantity * price)
+        self._execute("UPDATE transactions SET created_at = ? WHERE id = ?", (self._timestamp(date), txn_id))
+    
+    def portfolio(self) -> dict:
+        return next(p for p in self.db_service.get_portfolios_with_assets(self.user_id) if p["id"] == self.portfolio_id)
+    
+    def navs(self) -> dict:
+        return {row["trade_date"]: row["nav"] for row in self.db_service.get_portfolio_snapshots(self.portfolio_id)}
+
+@pytest.fixture
+def db_service(tmp_path):
+    return DatabaseService(str(tmp_path / "test.db"))
+
+@pytest.fixture
+def portfolio_fixture(db_service):
+    return PortfolioFixture(db_service, "20240102")
\ No newline at end of file
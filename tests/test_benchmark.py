@@ -0,0 +1,24 @@
+import numpy as np
+import pandas as pd
+import pytest
+from benchmark import BenchmarkAnalysis, DEFAULT_BENCHMARK
+from valuation import PortfolioValuation
+
+def test_mid_period_purchase_does_not_distort_relative_statistics(portfolio_fixture):
+    dates = pd.bdate_range("2024-01-02", periods=12).strftime("%Y%m%d")
+    levels = 3000 * np.cumprod(1 + np.random.default_rng(0).normal(0, 0.01, len(dates)))
+    # 个股与基准同涨同跌，期中追加买入不应产生超额收益
+    portfolio_fixture.bars(dict(zip(dates, levels)), DEFAULT_BENCHMARK)
+    portfolio_fixture.bars(dict(zip(dates, levels / 100)))
+    portfolio_fixture.trade(dates[0], "buy", 100, levels[0] / 100)
+    portfolio_fixture.trade(dates[5], "buy", 300, levels[5] / 100)
+    
+    analysis = BenchmarkAnalysis(PortfolioValuation(portfolio_fixture.db_service, portfolio_fixture.market_store))
+    result = analysis.analyze(portfolio_fixture.portfolio(), end_date=dates[-1], window=5)
+    
+    assert result["observations"] == len(dates) - 1
+    metrics = result["metrics"]
+    assert metrics["beta"] == pytest.approx(1.0)
+    assert metrics["alpha"] == pytest.approx(0.0, abs=1e-9)
+    assert metrics["tracking_error"] == pytest.approx(0.0, abs=1e-6)
+    assert metrics["portfolio_return"] == pytest.approx(metrics["benchmark_return"])
\ No newline at end of file
@@ -0,0 +1,48 @@
+from collections import Counter
+import pandas as pd
+from screener import StockScreener
+
+class CountingTushare:
+    """记录各接口调用次数的 Tushare 替身，daily_basic 可设置为无数据"""
+    
+    def __init__(self, daily_basic: bool = True):
+        self.calls = Counter()
+        self.daily_basic = daily_basic
+    
+    def get_stock_basic(self):
+        self.calls["stock_basic"] += 1
+        return pd.DataFrame({"ts_code": ["000001.SZ", "600000.SH", "000002.SZ"],
+                             "name": ["平安银行", "浦发银行", "万科A"], "industry": ["银行", "银行", "全国地产"]})
+    
+    def get_market_data(self, trade_date):
+        self.calls["daily_basic"] += 1
+        if not self.daily_basic:
+            return pd.DataFrame()
+        return pd.DataFrame({"ts_code": ["000001.SZ", "600000.SH"], "pe_ttm": [5.0, 6.0], "total_mv": [1e7, 2e7]})
+    
+    def get_fina_indicator_snapshot(self, period, fields=""):
+        self.calls["fina_indicator_vip"] += 1
+        return None
+
+def test_industries_only_request_stock_basic():
+    tushare = CountingTushare()
+    screener = StockScreener(tushare)
+    
+    assert screener.industries() == ["全国地产", "银行"]
+    assert screener.industries() == ["全国地产", "银行"]
+    assert tushare.calls == {"stock_basic": 1}
+
+def test_failed_load_is_not_retried_within_interval():
+    tushare = CountingTushare(daily_basic=False)
+    screener = StockScreener(tushare, lookback_days=3)
+    
+    assert screener.load("20240105") is None
+    assert screener.load("20240105") is None
+    assert tushare.calls == {"stock_basic": 1, "daily_basic": 3}
+    
+    # 超过重试间隔后重新加载
+    screener.retry_interval = 0
+    tushare.daily_basic = True
+    universe = screener.load("20240105")
+    assert universe is not None and len(universe) == 2
+    assert tushare.calls["stock_basic"] == 1
\ No newline at end of file
@@ -0,0 +1,31 @@
+import pytest
+from valuation import PortfolioValuation
+
+def test_purchase_without_price_change_keeps_nav_flat(portfolio_fixture):
+    portfolio_fixture.bars({"20240102": 10.0, "20240103": 15.0, "20240104": 15.0, "20240105": 15.0})
+    portfolio_fixture.trade("20240102", "buy", 100, 10.0)
+    portfolio_fixture.trade("20240104", "buy", 100, 15.0)
+    
+    valuation = PortfolioValuation(portfolio_fixture.db_service, portfolio_fixture.market_store)
+    assert valuation.value_portfolio(portfolio_fixture.portfolio(), "20240105", sync=False) == 4
+    
+    navs = portfolio_fixture.navs()
+    assert navs["20240102"] == pytest.approx(1.0)
+    assert navs["20240103"] == pytest.approx(1.5)
+    assert navs["20240104"] == pytest.approx(1.5)
+    assert navs["20240105"] == pytest.approx(1.5)
+
+def test_sale_and_incremental_valuation_keep_nav_continuous(portfolio_fixture):
+    portfolio_fixture.bars({"20240102": 10.0, "20240103": 12.0, "20240104": 12.0, "20240105": 13.2})
+    portfolio_fixture.trade("20240102", "buy", 200, 10.0)
+    valuation = PortfolioValuation(portfolio_fixture.db_service, portfolio_fixture.market_store)
+    valuation.value_portfolio(portfolio_fixture.portfolio(), "20240103", sync=False)
+    
+    # 上次估值之后卖出一半，增量估值从最近快照日接续
+    portfolio_fixture.trade("20240104", "sell", 100, 12.0)
+    valuation.value_portfolio(portfolio_fixture.portfolio(), "20240105", sync=False)
+    
+    navs = portfolio_fixture.navs()
+    assert navs["20240103"] == pytest.approx(1.2)
+    assert navs["20240104"] == pytest.approx(1.2)
+    assert navs["20240105"] == pytest.approx(1.32)
\ No newline at end of file
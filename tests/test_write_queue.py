@@ -0,0 +1,52 @@
+import threading
+from write_queue import AnalysisWriteQueue
+
+class BlockingDatabase:
+    """写入在 gate 放行前阻塞的数据库替身，用于让队列保持满载"""
+    
+    def __init__(self):
+        self.gate = threading.Event()
+        self.entered = threading.Event()
+        self.rows = []
+        self._lock = threading.Lock()
+    
+    def save_investment_analyses(self, rows):
+        self.entered.set()
+        self.gate.wait()
+        with self._lock:
+            self.rows.extend(rows)
+    
+    def save_profit_analyses(self, rows):
+        self.save_investment_analyses(rows)
+
+def _run(target, *args):
+    thread = threading.Thread(target=target, args=args, daemon=True)
+    thread.start()
+    return thread
+
+def test_close_while_full_writes_every_request_and_flush_returns():
+    db = BlockingDatabase()
+    writes = AnalysisWriteQueue(db, maxsize=2, batch_size=1, flush_interval=0.05, put_timeout=5.0)
+    save = lambda i: writes.save_investment_analysis(1, f"{i:06d}.SZ", "技术分析", {"i": i})
+    
+    # 后台线程卡在第一笔写入，再放入两笔占满队列
+    save(0)
+    assert db.entered.wait(2)
+    save(1)
+    save(2)
+    # 队列已满，这些生产者阻塞等待名额
+    producers = [_run(save, i) for i in range(3, 40)]
+    closer = _run(writes.close)
+    closer.join(0.2)
+    
+    db.gate.set()
+    closer.join(5)
+    assert not closer.is_alive()
+    for producer in producers:
+        producer.join(5)
+        assert not producer.is_alive()
+    
+    flusher = _run(writes.flush)
+    flusher.join(5)
+    assert not flusher.is_alive()
+    assert sorted(row[1] for row in db.rows) == [f"{i:06d}.SZ" for i in range(40)]
\ No newline at end of file
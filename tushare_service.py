@@ -18,13 +18,13 @@ class TushareService:
             print(f"获取股票基本信息失败: {str(e)}")
             return pd.DataFrame()
             
-    def get_daily_data(self, ts_code: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """获取股票日线数据"""
+    def get_daily_data(self, ts_code: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        """获取股票日线数据，请求失败时返回 None（与区间内没有行情区分）"""
         try:
             return self.pro.daily(ts_code=ts_code, start_date=start_date, end_date=end_date)
         except Exception as e:
             print(f"获取日线数据失败: {str(e)}")
-            return pd.DataFrame()
+            return None
             
     def get_company_info(self, ts_code: str) -> Dict:
         """获取公司基本信息"""
@@ -92,13 +92,13 @@ class TushareService:
             print(f"获取现金流量表数据失败: {str(e)}")
             return pd.DataFrame()
             
-    def get_index_data(self, index_code: str, start_date: str, end_date: str) -> pd.DataFrame:
-        """获取指数数据"""
+    def get_index_data(self, index_code: str, start_date: str, end_date: str) -> Optional[pd.DataFrame]:
+        """获取指数数据，请求失败时返回 None（与区间内没有行情区分）"""
         try:
             return self.pro.index_daily(ts_code=index_code, start_date=start_date, end_date=end_date)
         except Exception as e:
             print(f"获取指数数据失败: {str(e)}")
-            return pd.DataFrame()
+            return None
             
     def get_market_data(self, trade_date: str = None) -> pd.DataFrame:
         """获取市场整体数据"""
@@ -110,6 +110,25 @@ class TushareService:
             print(f"获取市场数据失败: {str(e)}")
             return pd.DataFrame()
             
+    def get_daily_snapshot(self, trade_date: str) -> Optional[pd.DataFrame]:
+        """获取某一交易日全市场的日线数据，请求失败时返回 None"""
+        try:
+            return self.pro.daily(trade_date=trade_date)
+        except Exception as e:
+            print(f"获取全市场日线数据失败: {str(e)}")
+            return None
+            
+    def get_fina_indicator_snapshot(self, period: str, fields: str = '') -> Optional[pd.DataFrame]:
+        """获取某一报告期全市场的财务指标，请求失败（包括没有接口权限）时返回 None
+        
+        fina_indicator_vip 需要 Tushare 账户具备该接口的积分权限，普通权限只能按代码调用 fina_indicator
+        """
+        try:
+            return self.pro.fina_indicator_vip(period=period, fields=fields)
+        except Exception as e:
+            print(f"获取全市场财务指标失败（需 fina_indicator_vip 接口权限）: {str(e)}")
+            return None
+            
     def get_industry_data(self, level: str = 'L1') -> pd.DataFrame:
         """获取行业分类数据"""
         try:
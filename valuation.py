@@ -0,0 +1,299 @@
+from typing import List, Dict, Optional, Tuple
+from datetime import datetime, timedelta
+import threading
+import numpy as np
+import pandas as pd
+from database import DatabaseService
+from market_store import MarketDataStore, shift_date
+from positions import PositionState
+
+class PortfolioValuation:
+    """投资组合每日净值估值：基于本地日线行情库，按每个交易日当时的持仓估值；
+    从最近一次快照日起增量估值，该日重新估值以补齐估值时尚未同步完整的行情。
+    净值为剔除买入、卖出等资金进出后的单位净值（时间加权），首个估值日为 1
+    """
+    
+    def __init__(self, db_service: DatabaseService, market_store: MarketDataStore, lookback_days: int = 30):
+        self.db_service = db_service
+        self.market_store = market_store
+        # 向前多取的自然日数，用于停牌或区间首日无行情时沿用前收盘价
+        self.lookback_days = lookback_days
+    
+    def run(self, user_id: int, end_date: Optional[str] = None, sync: bool = True) -> Dict[int, int]:
+        """估值用户的全部投资组合，返回各组合写入的快照天数"""
+        if end_date is None:
+            end_date = datetime.now().strftime('%Y%m%d')
+        
+        results = {}
+        for portfolio in self.db_service.get_portfolios_with_assets(user_id):
+            try:
+                results[portfolio['id']] = self.value_portfolio(portfolio, end_date, sync)
+            except Exception as e:
+                print(f"投资组合 {portfolio.get('name', portfolio['id'])} 估值失败：{str(e)}")
+                results[portfolio['id']] = 0
+        return results
+    
+    def value_portfolio(self, portfolio: Dict, end_date: str, sync: bool = True) -> int:
+        """估值单个投资组合（需包含 get_portfolios_with_assets 返回的列式资产）"""
+        assets = portfolio['assets']
+        if not assets['symbol']:
+            return 0
+        symbols = sorted(set(assets['symbol']))
+        
+        last_date = self.db_service.get_last_snapshot_date(portfolio['id'])
+        if last_date:
+            start = datetime.strptime(last_date, '%Y%m%d')
+        else:
+            start = datetime.strptime(str(portfolio['created_at'])[:10], '%Y-%m-%d')
+        start_date = start.strftime('%Y%m%d')
+        if start_date > end_date:
+            return 0
+        
+        fetch_start = (start - timedelta(days=self.lookback_days)).strftime('%Y%m%d')
+        if sync:
+            self.market_store.sync_daily_bars(symbols, fetch_start, end_date)
+        
+        panel = self.market_store.get_price_panel(symbols, fetch_start, end_date)
+        panel = panel.ffill()
+        panel = panel[panel.index >= start_date]
+        if panel.empty:
+            return 0
+        
+        # 以上一个快照日的市值与净值为起点，之后的资金进出计入首个估值日
+        previous = self.db_service.get_portfolio_snapshots(portfolio['id'], end_date=shift_date(start_date, -1))
+        if previous:
+            since, previous_value, previous_nav = (previous[-1]['trade_date'], previous[-1]['total_value'],
+                                                   previous[-1]['nav'])
+        else:
+            since, previous_value, previous_nav = "", 0.0, 1.0
+        
+        quantities, costs, flows = self.holdings(portfolio, panel.index, since)
+        # 尚无行情的持仓按成本计
+        prices = panel.reindex(columns=assets['symbol']).to_numpy()
+        total_values = np.where(np.isnan(prices), costs, prices * quantities).sum(axis=1)
+        total_costs = costs.sum(axis=1)
+        total_profits = total_values - total_costs
+        # 当日收益 = (收盘市值 - 当日净流入) / 前一日市值 - 1；前一日无持仓时净值不变
+        opening = np.r_[previous_value, total_values[:-1]]
+        growth = np.divide(total_values - flows, opening, out=np.ones_like(total_values), where=opening > 0)
+        navs = previous_nav * np.cumprod(growth)
+        
+        snapshots = zip(
+            [portfolio['id']] * len(panel),
+            panel.index,
+            total_values.tolist(),
+            total_costs.tolist(),
+            total_profits.tolist(),
+            navs.tolist()
+        )
+        self.db_service.save_portfolio_snapshots(snapshots)
+        return len(panel)
+    
+    def holdings(self, portfolio: Dict, trade_dates: pd.Index,
+                 since: str = "") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """各交易日（行）× 资产（列，顺序同列式资产）当日收盘时的持仓数量与持仓成本，以及各交易日的净流入金额
+        
+        有交易记录的资产按截至当日的交易以先进先出重放（与持仓引擎一致），买入金额计为流入、卖出金额计为流出；
+        没有交易记录的资产自录入当日起按资产表中的数量与成本价持有，录入时计为流入。
+        非交易日的资金进出计入下一个交易日，since 当日及之前的不计入
+        """
+        assets = portfolio['assets']
+        columns = {asset_id: i for i, asset_id in enumerate(assets['id'])}
+        dates = np.asarray(trade_dates, dtype=str)
+        quantities = np.zeros((len(dates), len(columns)))
+        costs = np.zeros_like(quantities)
+        flows = np.zeros(len(dates) + 1)
+        
+        # 每个资产的持仓变动 (生效日, 数量, 成本, 净流入)，按交易顺序排列
+        changes: Dict[int, List[tuple]] = {}
+        states: Dict[int, PositionState] = {}
+        for txn_id, asset_id, transaction_type, quantity, price, amount, created_at in \
+                self.db_service.get_transaction_history(portfolio['user_id'], columns):
+            state = states.setdefault(asset_id, PositionState())
+            held = state.quantity
+            state.apply(txn_id, transaction_type, quantity, price, amount)
+            # 与持仓引擎一致，成交金额含费用时以金额折算单位价格；超卖被忽略的部分不计入流出
+            unit_price = amount / quantity if quantity > 0 and amount else price
+            changes.setdefault(asset_id, []).append(
+                (str(created_at)[:10].replace('-', ''), state.quantity, state.cost_basis,
+                 (state.quantity - held) * unit_price)
+            )
+        
+        for asset_id, i in columns.items():
+            if asset_id not in changes:
+                quantity = float(assets['quantity'][i])
+                cost = quantity * float(assets['cost_price'][i])
+                changes[asset_id] = [(str(assets['created_at'][i])[:10].replace('-', ''), quantity, cost, cost)]
+            for date, quantity, cost, flow in changes[asset_id]:
+                row = np.searchsorted(dates, date)
+                quantities[row:, i] = quantity
+                costs[row:, i] = cost
+                if date > since:
+                    flows[row] += flow
+        # 最后一个交易日之后的资金进出不计入
+        return quantities, costs, flows[:-1]
+
+class LiveValuation:
+    """实时估值：持仓按行保存在数组中，报价变动只把差额累加到所属组合的市值，市值变动超过阈值时才输出"""
+    
+    def __init__(self, threshold: float = 0.001, reconcile_every: int = 1000000):
+        # 组合市值相对上次输出的变动比例超过该值时输出变动
+        self.threshold = threshold
+        # 累计应用的持仓行数达到该值时整体重算一次，消除增量累加的浮点误差
+        self.reconcile_every = reconcile_every
+        self._lock = threading.Lock()
+        self._updates = 0
+        self.portfolio_ids: List[int] = []
+        self._index: Dict[int, int] = {}
+        self.symbols: List[str] = []
+        self.groups = np.zeros(0, dtype=int)
+        self.quantities = np.zeros(0)
+        self.costs = np.zeros(0)
+        self.prices = np.zeros(0)
+        self.values = np.zeros(0)
+        self.total_costs = np.zeros(0)
+        self.emitted = np.zeros(0)
+        self._rows: Dict[str, np.ndarray] = {}
+        self._starts = np.zeros(0, dtype=int)
+        # 各代码最近一次收到的报价，新载入的持仓优先使用
+        self.last_prices: Dict[str, float] = {}
+    
+    def __contains__(self, portfolio_id: int) -> bool:
+        return portfolio_id in self._index
+    
+    def load(self, portfolios: List[Dict]) -> None:
+        """载入（或替换）投资组合持仓，portfolios 为 get_portfolios_with_assets 的返回格式；其他已载入的组合保持不变"""
+        with self._lock:
+            replaced = {portfolio['id'] for portfolio in portfolios}
+            keep = [p for p, portfolio_id in enumerate(self.portfolio_ids) if portfolio_id not in replaced]
+            rows = np.flatnonzero(np.isin(self.groups, keep))
+            portfolio_ids = [self.portfolio_ids[p] for p in keep]
+            remap = np.zeros(len(self.portfolio_ids), dtype=int)
+            remap[keep] = np.arange(len(keep))
+            groups = [remap[self.groups[rows]]]
+            symbols = [self.symbols[i] for i in rows]
+            quantities, costs, prices = [self.quantities[rows]], [self.costs[rows]], [self.prices[rows]]
+            emitted = [self.emitted[p] for p in keep]
+            for portfolio in portfolios:
+                assets = portfolio['assets']
+                quantity = np.asarray(assets['quantity'], dtype=float)
+                groups.append(np.full(len(quantity), len(portfolio_ids), dtype=int))
+                symbols.extend(assets['symbol'])
+                quantities.append(quantity)
+                costs.append(quantity * np.asarray(assets['cost_price'], dtype=float))
+                prices.append(np.array([self.last_prices.get(symbol, price or 0.0)
+                                        for symbol, price in zip(assets['symbol'], assets['current_price'])], dtype=float))
+                portfolio_ids.append(portfolio['id'])
+                emitted.append(np.nan)
+            
+            # 各组合的持仓行保持连续，便于按组合切片
+            self.groups = np.concatenate(groups)
+            order = np.argsort(self.groups, kind='stable')
+            self.groups = self.groups[order]
+            self.symbols = [symbols[i] for i in order]
+            self.quantities, self.costs, self.prices = (np.concatenate(x)[order] for x in (quantities, costs, prices))
+            self.portfolio_ids = portfolio_ids
+            self._index = {portfolio_id: p for p, portfolio_id in enumerate(portfolio_ids)}
+            self._starts = np.searchsorted(self.groups, np.arange(len(portfolio_ids) + 1))
+            
+            by_symbol: Dict[str, List[int]] = {}
+            for i, symbol in enumerate(self.symbols):
+                by_symbol.setdefault(symbol, []).append(i)
+            self._rows = {symbol: np.array(rows, dtype=int) for symbol, rows in by_symbol.items()}
+            
+            n = len(portfolio_ids)
+            self.total_costs = np.bincount(self.groups, weights=self.costs, minlength=n)
+            self._reconcile()
+            # 新载入的组合以当前市值作为输出基准
+            self.emitted = np.array(emitted, dtype=float)
+            self.emitted = np.where(np.isnan(self.emitted), self.values, self.emitted)
+    
+    def _reconcile(self) -> None:
+        """由持仓数组整体重算各组合市值"""
+        self.values = np.bincount(self.groups, weights=self.quantities * self.prices, minlength=len(self.portfolio_ids))
+        self._updates = 0
+    
+    def update(self, symbol: str, price: float) -> List[Dict]:
+        """应用单个代码的最新价，返回市值变动超过阈值的组合"""
+        return self.update_many({symbol: price})
+    
+    def update_many(self, quotes: Dict[str, float]) -> List[Dict]:
+        """批量应用报价：只处理持有这些代码的持仓行，差额累加到所属组合，返回市值变动超过阈值的组合"""
+        with self._lock:
+            rows, prices = [], []
+            for symbol, price in quotes.items():
+                symbol_rows = self._rows.get(symbol)
+                if symbol_rows is None or not price or not np.isfinite(price) or price <= 0:
+                    continue
+                self.last_prices[symbol] = float(price)
+                rows.append(symbol_rows)
+                prices.append(np.full(len(symbol_rows), float(price)))
+            if not rows:
+                return []
+            
+            rows = np.concatenate(rows)
+            prices = np.concatenate(prices)
+            groups = self.groups[rows]
+            np.add.at(self.values, groups, (prices - self.prices[rows]) * self.quantities[rows])
+            self.prices[rows] = prices
+            self._updates += len(rows)
+            if self._updates >= self.reconcile_every:
+                self._reconcile()
+            return self._changes(np.unique(groups))
+    
+    def _changes(self, groups: np.ndarray) -> List[Dict]:
+        """检查受影响的组合，市值相对上次输出变动超过阈值的更新基准并输出"""
+        values = self.values[groups]
+        base = self.emitted[groups]
+        moved = np.abs(values - base) > self.threshold * np.abs(base)
+        changes = []
+        for p, value, previous in zip(groups[moved], values[moved], base[moved]):
+            self.emitted[p] = value
+            changes.append({
+                "portfolio_id": self.portfolio_ids[p],
+                **self._totals(p),
+                "change": float(value / previous - 1) if previous else 0.0
+            })
+        return changes
+    
+    def _totals(self, p: int) -> Dict:
+        value = float(self.values[p])
+        cost = float(self.total_costs[p])
+        return {
+            "total_value": value,
+            "total_cost": cost,
+            "total_profit": value - cost,
+            "total_profit_rate": (value - cost) / cost * 100 if cost > 0 else 0.0
+        }
+    
+    def totals(self, portfolio_id: int) -> Optional[Dict]:
+        """组合当前的市值、成本与盈亏（盈亏率为百分数），未载入时返回 None"""
+        p = self._index.get(portfolio_id)
+        return None if p is None else self._totals(p)
+    
+    def snapshot(self, portfolio_id: int) -> Optional[Dict]:
+        """组合汇总与按列存放的各持仓市值、盈亏及权重"""
+        with self._lock:
+            p = self._index.get(portfolio_id)
+            if p is None:
+                return None
+            rows = slice(self._starts[p], self._starts[p + 1])
+            quantities = self.quantities[rows]
+            costs = self.costs[rows]
+            prices = self.prices[rows].copy()
+            totals = self._totals(p)
+        market_values = quantities * prices
+        profits = market_values - costs
+        total = totals["total_value"]
+        return {
+            **totals,
+            "assets": {
+                "symbol": self.symbols[rows],
+                "quantity": quantities.tolist(),
+                "current_price": prices.tolist(),
+                "market_value": market_values.tolist(),
+                "profit": profits.tolist(),
+                "profit_rate": np.divide(profits * 100, costs, out=np.zeros_like(costs), where=costs > 0).tolist(),
+                "weight": (market_values / total if total > 0 else np.zeros_like(market_values)).tolist()
+            }
+        }
\ No newline at end of file
@@ -0,0 +1,117 @@
+from typing import List, Dict, Optional
+from statistics import NormalDist
+import numpy as np
+from risk_model import RiskModel, TRADING_DAYS
+
+def var_es(pnl: np.ndarray, confidence: float = 0.95) -> tuple:
+    """由情景损益计算 VaR 与 ES（以正数表示损失）
+    
+    pnl 的最后一维为情景；ES 为损失不小于 VaR 的情景的平均损失
+    """
+    losses = -np.asarray(pnl, dtype=float)
+    n = losses.shape[-1]
+    # 只做一次部分排序即可同时得到分位数与尾部
+    k = min(int(np.floor(confidence * n)), n - 1)
+    ordered = np.partition(losses, k, axis=-1)
+    var = ordered[..., k]
+    es = ordered[..., k:].mean(axis=-1)
+    return var, es
+
+def horizon_returns(returns: np.ndarray, horizon: int) -> np.ndarray:
+    """由日收益率计算重叠的 horizon 日复利收益率（对数收益累加后一次差分）"""
+    if horizon <= 1:
+        return returns
+    log_paths = np.vstack([np.zeros(returns.shape[1]), np.cumsum(np.log1p(returns), axis=0)])
+    return np.expm1(log_paths[horizon:] - log_paths[:-horizon])
+
+class VaREngine:
+    """组合风险价值与预期亏损：历史模拟、参数法（正态）与蒙特卡洛，情景 × 资产全向量化计算"""
+    
+    METHODS = ("historical", "parametric", "monte_carlo")
+
+    def __init__(self, risk_model: RiskModel, seed: Optional[int] = None):
+        self.risk_model = risk_model
+        # 固定种子时蒙特卡洛结果可复现
+        self.seed = seed
+
+    def calculate(self, holdings: Dict[str, float], method: str = "historical", confidence: float = 0.95,
+                  horizon: int = 1, end_date: Optional[str] = None, n_scenarios: int = 100000,
+                  covariance: str = "sample", sync: bool = True) -> Dict:
+        """计算组合的 VaR 与 ES
+        
+        holdings 为代码到持仓市值的映射；horizon 为持有期（交易日）；covariance 为参数法与蒙特卡洛使用的
+        协方差估计（sample 或 ewma）
+        """
+        ts_codes = [code for code, value in holdings.items() if value]
+        total_value = float(sum(holdings[code] for code in ts_codes))
+        result = {"method": method, "confidence": confidence, "horizon": horizon,
+                  "var": 0.0, "es": 0.0, "var_rate": 0.0, "es_rate": 0.0, "insufficient": {}}
+        if not ts_codes or total_value == 0:
+            return result
+        
+        try:
+            values = np.array([holdings[code] for code in ts_codes], dtype=float)
+            returns = self.risk_model.history(ts_codes, end_date, sync, fill=False)[ts_codes]
+            # 缺失日按 0 收益计会低估波动与尾部损失，有持仓历史不足时不给出结果
+            insufficient = self.risk_model.insufficient(returns)
+            if insufficient:
+                print(f"以下代码的历史行情不足，无法计算风险价值：{list(insufficient)}")
+                result["insufficient"] = insufficient
+                return result
+            returns = returns.fillna(0.0).to_numpy()
+            if method == "historical":
+                var, es = self.historical(returns, values, confidence, horizon)
+            elif method == "parametric":
+                cov = self.risk_model.covariance(ts_codes, end_date, covariance, sync=False).to_numpy() / TRADING_DAYS
+                var, es = self.parametric(returns.mean(axis=0), cov, values, confidence, horizon)
+            elif method == "monte_carlo":
+                cov = self.risk_model.covariance(ts_codes, end_date, covariance, sync=False).to_numpy() / TRADING_DAYS
+                var, es = self.monte_carlo(np.log1p(returns).mean(axis=0), cov, values, confidence, horizon, n_scenarios)
+            else:
+                print(f"不支持的风险价值计算方法：{method}")
+                return result
+        except Exception as e:
+            print(f"计算风险价值失败：{str(e)}")
+            return result
+        
+        result.update({
+            "var": float(var),
+            "es": float(es),
+            "var_rate": float(var) / total_value,
+            "es_rate": float(es) / total_value
+        })
+        return result
+
+    @staticmethod
+    def historical(returns: np.ndarray, values: np.ndarray, confidence: float = 0.95,
+                   horizon: int = 1) -> tuple:
+        """历史模拟：以窗口内每个（重叠的）持有期收益作为一个情景"""
+        scenarios = horizon_returns(returns, horizon)
+        if len(scenarios) == 0:
+            return 0.0, 0.0
+        return var_es(scenarios @ values, confidence)
+
+    @staticmethod
+    def parametric(mean: np.ndarray, cov: np.ndarray, values: np.ndarray, confidence: float = 0.95,
+                   horizon: int = 1) -> tuple:
+        """参数法：组合收益服从正态分布，均值与方差按持有期线性放大"""
+        mu = float(mean @ values) * horizon
+        sigma = float(np.sqrt(max(values @ cov @ values, 0.0) * horizon))
+        normal = NormalDist()
+        z = normal.inv_cdf(confidence)
+        var = sigma * z - mu
+        es = sigma * normal.pdf(z) / (1 - confidence) - mu
+        return var, es
+
+    def monte_carlo(self, mean: np.ndarray, cov: np.ndarray, values: np.ndarray, confidence: float = 0.95,
+                    horizon: int = 1, n_scenarios: int = 100000) -> tuple:
+        """蒙特卡洛：按多元正态抽取持有期对数收益，资产收益复利后汇总为组合损益"""
+        rng = np.random.default_rng(self.seed)
+        k = len(values)
+        # 协方差可能因数值误差略非正定，对角线加微小扰动后再做 Cholesky 分解
+        jitter = 1e-12 * max(float(np.trace(cov)) / k, 1e-12)
+        chol = np.linalg.cholesky(cov * horizon + np.eye(k) * jitter)
+        shocks = rng.standard_normal((n_scenarios, k)) @ chol.T
+        shocks += mean * horizon
+        np.expm1(shocks, out=shocks)
+        return var_es(shocks @ values, confidence)
\ No newline at end of file
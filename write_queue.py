@@ -0,0 +1,149 @@
+from typing import List, Dict
+from collections import deque
+import atexit
+import queue
+import threading
+import time
+from database import DatabaseService
+
+# 写入任务类型
+INVESTMENT_ANALYSIS = "investment_analysis"
+PROFIT_ANALYSIS = "profit_analysis"
+
+_STOP = object()
+
+class AnalysisWriteQueue:
+    """分析结果后台写入队列：有界队列缓冲写请求，后台线程按批合并为单个事务提交"""
+    
+    def __init__(self, db_service: DatabaseService, maxsize: int = 1000, batch_size: int = 200,
+                 flush_interval: float = 0.5, put_timeout: float = 2.0, retry_delay: float = 0.2,
+                 max_failures: int = 1000):
+        self.db_service = db_service
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        # 队列满时生产者最多等待的秒数，超时后改为同步写入
+        self.put_timeout = put_timeout
+        # 批量写入失败（如数据库被锁）后等待多少秒重试一次
+        self.retry_delay = retry_delay
+        # 最终写入失败的请求 (类型, 数据, 错误信息)，由 flush 取出，最多保留 max_failures 条
+        self.failures = deque(maxlen=max_failures)
+        self._failures_lock = threading.Lock()
+        # 队列本身不限长，容量由名额控制：生产者先占用一个名额再入队，后台线程取出后归还
+        self._queue = queue.Queue()
+        self._slots = threading.Semaphore(maxsize)
+        # 关闭标记的检查与入队在同一把锁内完成，close 持锁标记关闭后再放入结束标记，之后不会再有请求入队
+        self._put_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="analysis-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def save_investment_analysis(self, user_id: int, symbol: str, analysis_type: str, analysis_data: dict) -> None:
+        """异步保存投资分析数据"""
+        self._put(INVESTMENT_ANALYSIS, (user_id, symbol, analysis_type, analysis_data))
+    
+    def save_profit_analysis(self, user_id: int, initial_capital: float, investment_period: int,
+                             expected_return: float, monthly_investment: float, risk_tolerance: str,
+                             total_investment: float, expected_profit: float, annualized_return: float) -> None:
+        """异步保存收益分析数据"""
+        self._put(PROFIT_ANALYSIS, (user_id, initial_capital, investment_period, expected_return,
+                                    monthly_investment, risk_tolerance, total_investment,
+                                    expected_profit, annualized_return))
+    
+    def _put(self, kind: str, row: tuple) -> None:
+        """入队；队列已关闭或持续满载（背压）时直接同步写入，保证数据不丢失"""
+        if not self._closed:
+            if self._slots.acquire(timeout=self.put_timeout):
+                with self._put_lock:
+                    if not self._closed:
+                        self._queue.put_nowait((kind, row))
+                        return
+                # 等待名额期间队列已关闭
+                self._slots.release()
+            else:
+                print("分析写入队列已满，改为同步写入")
+        self._write({kind: [row]})
+    
+    def _run(self) -> None:
+        """后台线程：取出一批写请求，按类型分组后批量提交"""
+        stopping = False
+        while not stopping:
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            
+            items = [item]
+            while len(items) < self.batch_size:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            
+            batches: Dict[str, List[tuple]] = {}
+            for entry in items:
+                if entry is _STOP:
+                    stopping = True
+                    continue
+                kind, row = entry
+                batches.setdefault(kind, []).append(row)
+                self._slots.release()
+            try:
+                self._write(batches)
+            finally:
+                for _ in items:
+                    self._queue.task_done()
+    
+    def _save(self, kind: str, rows: List[tuple]) -> None:
+        """在一个事务中提交同一类型的写请求"""
+        if kind == INVESTMENT_ANALYSIS:
+            self.db_service.save_investment_analyses(rows)
+        elif kind == PROFIT_ANALYSIS:
+            self.db_service.save_profit_analyses(rows)
+    
+    def _write(self, batches: Dict[str, List[tuple]]) -> None:
+        """将分组后的写请求各自在一个事务中提交；失败时稍后整批重试一次，仍失败则逐条写入，
+        逐条仍失败的请求记入 failures
+        """
+        for kind, rows in batches.items():
+            try:
+                self._save(kind, rows)
+                continue
+            except Exception as e:
+                print(f"批量保存{kind}失败（{len(rows)}条），稍后重试：{str(e)}")
+            
+            time.sleep(self.retry_delay)
+            try:
+                self._save(kind, rows)
+                continue
+            except Exception as e:
+                print(f"重试批量保存{kind}失败，改为逐条写入：{str(e)}")
+            
+            for row in rows:
+                try:
+                    self._save(kind, [row])
+                except Exception as e:
+                    print(f"保存{kind}失败：{str(e)}")
+                    with self._failures_lock:
+                        self.failures.append((kind, row, str(e)))
+    
+    def flush(self) -> List[tuple]:
+        """阻塞直到已入队的写请求全部处理完毕，返回并清空期间最终写入失败的请求 (类型, 数据, 错误信息)"""
+        self._queue.join()
+        with self._failures_lock:
+            failures = list(self.failures)
+            self.failures.clear()
+        return failures
+    
+    def close(self) -> None:
+        """停止接收新请求，提交剩余数据并结束后台线程
+        
+        结束标记排在关闭前入队的全部请求之后，后台线程处理完它们才退出；
+        此时仍在等待名额的生产者取得名额后会发现队列已关闭，改为同步写入
+        """
+        with self._put_lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put_nowait(_STOP)
+        self._thread.join()